@@ -1,17 +1,22 @@
 import json
+import threading
+import time
 
 import structlog
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
 
 from app.api.deps import get_api_key_context, get_orchestrator, get_redis
 from app.core.glossary import mask_terms, restore_terms
 from app.core.lang_detect import LanguageDetectionError, detect_language
 from app.core.orchestrator import Orchestrator
+from app.core.policies import tenant_weight
 from app.core.quality import estimate_confidence
 from app.core.routing import resolve_model_path
 from app.core.usage import QuotaExceeded, check_quota, record_usage
+from app.inference.batcher import DeadlineExceeded, SchedulingHints
 from app.metrics import QUOTA_EXCEEDED
 from app.settings import settings
 from domain.models import ApiKey, Glossary
@@ -81,7 +86,10 @@ def translate(
             beam_size=getattr(opts, "beam_size", None) or settings.default_beam_size,
             max_new_tokens=getattr(opts, "max_new_tokens", 256),
             split_long=getattr(opts, "split_long", True),
+            hints=_scheduling_hints(key, deadline=time.monotonic() + settings.sync_request_timeout_s),
         )
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail="translation timed out") from e
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
 
@@ -141,6 +149,9 @@ def translate_stream(
     opts = req.options or {}
     beam = getattr(opts, "beam_size", None) or settings.default_beam_size
     max_new = getattr(opts, "max_new_tokens", 256)
+    # Set when the client disconnects so queued sentences are dropped.
+    cancelled = threading.Event()
+    hints = _scheduling_hints(key, cancelled=cancelled)
 
     def event_stream():
         chars_out = 0
@@ -148,14 +159,40 @@ def translate_stream(
             yield f"event: meta\ndata: {json.dumps({'detected_source_lang': detected})}\n\n"
         for i, sentence, model_name in orchestrator.translate_stream(
             source_lang=source_lang, target_lang=req.target_lang, text=req.text,
-            beam_size=beam, max_new_tokens=max_new,
+            beam_size=beam, max_new_tokens=max_new, hints=hints,
         ):
             chars_out += len(sentence)
             yield f"data: {json.dumps({'index': i, 'text': sentence, 'model': model_name})}\n\n"
         record_usage(db, key.id, chars_in=chars_in, chars_out=chars_out)
         yield f"event: done\ndata: {json.dumps({'chars_out': chars_out})}\n\n"
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    async def cancellable_stream():
+        # Runs the sync generator in the threadpool. On client disconnect this
+        # async generator is cancelled/closed, and the finally flags the
+        # request so the worker thread stops waiting on (and the batcher drops)
+        # the sentence in flight.
+        try:
+            async for chunk in iterate_in_threadpool(event_stream()):
+                yield chunk
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(cancellable_stream(), media_type="text/event-stream")
+
+
+def _scheduling_hints(
+    key: ApiKey,
+    deadline: float | None = None,
+    cancelled: threading.Event | None = None,
+) -> SchedulingHints:
+    """Fair-queuing identity for the inference batcher (one tenant per API key,
+    weighted by the key's tier) plus the request's deadline/cancellation."""
+    return SchedulingHints(
+        tenant=key.id,
+        weight=tenant_weight(key.rpm_limit),
+        deadline=deadline,
+        cancelled=cancelled,
+    )
 
 
 def _load_glossary_entries(db: Session, glossary_id: str | None, key: ApiKey) -> dict[str, str]:
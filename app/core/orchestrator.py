@@ -1,23 +1,20 @@
-import hashlib
+import dataclasses
 import time
 
 import structlog
 
 from app.core.policies import PolicyDecision, decide_sync_or_async
 from app.core.routing import display_path, resolve_model_path
+from app.inference.batcher import STREAM, SchedulingHints
 from app.inference.engine import InferenceEngine
 from app.metrics import TRANSLATE_LATENCY
+from app.settings import settings
 from infra.cache import RedisCache
+from infra.cache_codec import CacheKey, cache_key
+from infra.singleflight import Singleflight
 
 log = structlog.get_logger()
 
-def _hash_key(*parts: str) -> str:
-    h = hashlib.sha256()
-    for p in parts:
-        h.update(p.encode("utf-8"))
-        h.update(b"|")
-    return h.hexdigest()
-
 class Orchestrator:
     """
     Strategy layer:
@@ -29,6 +26,7 @@ class Orchestrator:
     def __init__(self, engine: InferenceEngine, cache: RedisCache):
         self.engine = engine
         self.cache = cache
+        self._flights = Singleflight()
 
     def decide(self, texts: list[str]) -> PolicyDecision:
         return decide_sync_or_async(texts)
@@ -40,14 +38,16 @@ class Orchestrator:
         text: str,
         beam_size: int,
         max_new_tokens: int,
+        hints: SchedulingHints | None = None,
     ):
         """Yield (index, sentence_translation) as each sentence completes.
 
         Trades batch efficiency for progressive output: sentences are translated
         one at a time (still using the sentence cache) so the UI can render as
         results arrive. Multi-hop pivot routes run each sentence through all
-        stages before yielding.
+        stages before yielding. Sentences run in the ``stream`` priority lane.
         """
+        hints = dataclasses.replace(hints or SchedulingHints(), priority=STREAM)
         model_path = resolve_model_path(source_lang, target_lang)
         model_name = display_path(model_path)
         sentences = self.engine.split_sentences(text)
@@ -61,6 +61,7 @@ class Orchestrator:
                     max_new_tokens=max_new_tokens,
                     split_long=False,
                     cache=self.cache,
+                    hints=hints,
                 )
             yield i, current.strip(), model_name
 
@@ -72,7 +73,11 @@ class Orchestrator:
         beam_size: int,
         max_new_tokens: int,
         split_long: bool,
+        hints: SchedulingHints | None = None,
     ) -> tuple[str, list[str], float, float]:
+        """Translate a batch of texts. ``hints`` tags the call by origin for the
+        batcher's priority lanes (default: interactive API traffic; Celery jobs
+        pass ``bulk``) and carries the tenant for fair queuing."""
         model_path = resolve_model_path(source_lang, target_lang)
         model_name = display_path(model_path)
         route_key = "|".join(model_path) if model_path else "identity"
@@ -81,33 +86,63 @@ class Orchestrator:
         total_sentences = 0
         cache_hits = 0
 
-        outputs: list[str] = []
-        for t in texts:
-            # sentence splitting happens inside engine for consistency,
-            # but we cache at whole-text level too (cheap win).
-            cache_key = "tx:" + _hash_key(route_key, str(beam_size), str(max_new_tokens), "T", t.strip())
-            cached = self.cache.get_json(cache_key)
+        # Whole-text cache first (cheap win); duplicate texts within the request
+        # are translated once and count as hits, as if served from the cache.
+        # All whole-text keys are looked up in one MGET.
+        outputs: list[str | None] = [None] * len(texts)
+        cache_keys = [
+            cache_key("tx", route_key, str(beam_size), str(max_new_tokens), "T", t.strip()) for t in texts
+        ]
+        unique_keys = list(dict.fromkeys(cache_keys))
+        cached_by_key = dict(zip(unique_keys, self.cache.mget_json(unique_keys), strict=True))
+        pending: dict[CacheKey, list[int]] = {}  # tx cache key -> indices of that text
+        for i, key in enumerate(cache_keys):
+            if key in pending:
+                cache_hits += 1
+                pending[key].append(i)
+                continue
+            cached = cached_by_key[key]
             if cached is not None:
                 cache_hits += 1
-                outputs.append(cached["translation"])
+                outputs[i] = cached["translation"]
                 continue
+            pending[key] = [i]
 
-            current_text = t
+        # Batch mode: every missed text goes through each model stage together,
+        # so the engine can dedupe sentences across texts and issue a few
+        # length-sorted generate calls instead of one (or more) per text.
+        def compute(batch: list[CacheKey]) -> dict[CacheKey, str]:
+            nonlocal total_sentences
+            current = [texts[pending[k][0]] for k in batch]
             for stage_model in model_path:
-                translation, sent_count = self.engine.translate_text(
+                results = self.engine.translate_texts(
                     model_name=stage_model,
-                    text=current_text,
+                    texts=current,
                     beam_size=beam_size,
                     max_new_tokens=max_new_tokens,
                     split_long=split_long,
                     cache=self.cache,  # sentence-level cache inside
+                    hints=hints,
                 )
-                total_sentences += sent_count
-                current_text = translation
+                total_sentences += sum(n for _, n in results)
+                current = [translation for translation, _ in results]
+            finals = {k: translation.strip() for k, translation in zip(batch, current, strict=True)}
+            self.cache.mset_json({k: {"translation": t} for k, t in finals.items()})
+            return finals
 
-            final_translation = current_text.strip()
-            self.cache.set_json(cache_key, {"translation": final_translation})
-            outputs.append(final_translation)
+        if not pending:
+            finals = {}
+        elif settings.singleflight:
+            # Texts another request is already translating are waited for.
+            finals = self._flights.run(
+                list(pending), compute, deadline=hints.deadline if hints else None,
+                cache=self.cache, cached=lambda entry: entry["translation"],
+            )
+        else:
+            finals = compute(list(pending))
+        for key, indices in pending.items():
+            for i in indices:
+                outputs[i] = finals[key]
 
         latency_ms = (time.perf_counter() - t0) * 1000.0
         TRANSLATE_LATENCY.observe(latency_ms)
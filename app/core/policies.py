@@ -16,3 +16,15 @@ def decide_sync_or_async(texts: list[str]) -> PolicyDecision:
     if total_chars > settings.max_sync_chars:
         return PolicyDecision(True, f"payload too large (> {settings.max_sync_chars} chars)")
     return PolicyDecision(False, "within sync budget")
+
+
+def tenant_weight(rpm_limit: int | None) -> float:
+    """Fair-queuing weight of an API key in the inference batcher.
+
+    The key's tier is expressed by its rpm limit, so its share of batch slots
+    scales with ``rpm_limit / default_key_rpm`` (a 600-rpm key gets 10x the
+    default key's share under contention), clamped to [0.1, 100].
+    """
+    if not rpm_limit or settings.default_key_rpm <= 0:
+        return 1.0
+    return min(100.0, max(0.1, rpm_limit / settings.default_key_rpm))
@@ -10,27 +10,225 @@ background worker drains the queue, forming a batch when either ``max_batch``
 items are waiting or ``max_wait_s`` elapses since the first queued item, then
 calls ``batch_fn(list_of_items)`` once and scatters results back by index.
 
+submit_many() enqueues several items at once (e.g. every uncached sentence of
+one request) so they can share a batch with other callers' items.
+
+Token budget: with ``max_tokens`` set, a batch is also capped by its *padded*
+cost ``len(batch) * longest_item * beams`` (lengths come from ``cost_fn``), which
+is what actually bounds generate() memory and compute. An item that would push
+the batch over budget waits at the head of the queue for the next batch; an
+item that is over budget on its own still runs, alone.
+
+Priority lanes: each submission carries a priority class (``interactive`` sync
+API calls, ``stream`` SSE sentences, ``bulk`` Celery jobs). Every batch is
+filled from the highest-priority lanes first, so a 2000-segment job cannot hold
+the model while interactive callers wait: it is preempted at the next batch
+boundary. To avoid starving bulk work under sustained interactive load, a lane
+whose oldest item has waited longer than ``starvation_s`` is served first.
+
+Fair queuing: within a lane, items are queued per tenant (API key) and served
+by weighted deficit round robin, charging each tenant the token cost of what it
+gets into a batch. A heavy tenant bursting 64-text requests therefore gets its
+weighted share of batch slots instead of all of them, and small tenants' tail
+latency stays flat. Weights come from the key's tier (see
+``app.core.policies.tenant_weight``).
+
+Deadlines: a submission may carry an absolute ``deadline`` (time.monotonic())
+and/or a ``cancelled`` event (set on SSE disconnect). Expired or cancelled
+items are dropped before ``batch_fn`` runs, and the waiting caller gets
+``DeadlineExceeded`` instead of blocking forever, so under overload we stop
+spending compute on answers nobody will read.
+
 Correctness (what the tests pin down):
   * results map back to the correct caller and preserve per-item identity,
-  * a batch never exceeds max_batch,
-  * an exception in batch_fn propagates to every caller in that batch.
+  * a batch never exceeds max_batch (nor max_tokens, unless a single item does),
+  * an exception in batch_fn propagates to every caller in that batch,
+  * after stop(), queued and new submissions fail fast instead of hanging,
+  * expired/cancelled items never reach batch_fn and their callers time out.
 """
-import queue
 import threading
 import time
+from collections import OrderedDict, deque
 from collections.abc import Callable
+from dataclasses import dataclass
 from typing import Any
 
+from app.metrics import INFERENCE_DROPPED
+
+INTERACTIVE = "interactive"
+STREAM = "stream"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, STREAM, BULK)  # highest first
+
+
+@dataclass(frozen=True)
+class SchedulingHints:
+    """Per-request scheduling metadata threaded from the API/worker down to the
+    batcher (orchestrator -> engine -> submit)."""
+    priority: str = INTERACTIVE
+    tenant: str | None = None  # fair-queuing identity (API key id); None = shared
+    weight: float = 1.0        # relative share of batch slots for this tenant
+    deadline: float | None = None  # time.monotonic() after which results are useless
+    cancelled: threading.Event | None = None  # set when the caller went away
+
+    def expired(self, now: float | None = None) -> bool:
+        if self.cancelled is not None and self.cancelled.is_set():
+            return True
+        if self.deadline is None:
+            return False
+        return (time.monotonic() if now is None else now) >= self.deadline
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the request is already past its deadline."""
+        if self.expired():
+            raise DeadlineExceeded("request cancelled" if self.cancelled and self.cancelled.is_set()
+                                   else "deadline exceeded")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed (or it was cancelled) before its items ran."""
+
+
+class BatcherStopped(RuntimeError):
+    """Raised to callers whose items were not (and will not be) run because the
+    batcher was stopped."""
+
+
+def padded_cost(count: int, max_len: int, beams: int = 1) -> int:
+    """Padded token cost of a batch: every row is padded to the longest one and
+    beam search multiplies the rows."""
+    return count * max_len * beams
+
+
+def plan_batches(
+    lengths: list[int],
+    max_batch: int,
+    max_tokens: int | None = None,
+    beams: int = 1,
+) -> list[list[int]]:
+    """Split items (in the given order) into consecutive batches of indices that
+    respect ``max_batch`` and, when set, the padded ``max_tokens`` budget.
+
+    Callers sort by length first so neighbouring items pad well together.
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    longest = 0
+    for i, n in enumerate(lengths):
+        new_longest = max(longest, n)
+        if current and (
+            len(current) >= max_batch
+            or (max_tokens and padded_cost(len(current) + 1, new_longest, beams) > max_tokens)
+        ):
+            batches.append(current)
+            current, new_longest = [], n
+        current.append(i)
+        longest = new_longest
+    if current:
+        batches.append(current)
+    return batches
+
 
 class _Slot:
-    __slots__ = ("item", "event", "result", "error")
+    __slots__ = ("item", "cost", "hints", "abandoned", "enqueued_at", "event", "result", "error")
 
-    def __init__(self, item: Any):
+    def __init__(self, item: Any, cost: int = 1, hints: SchedulingHints | None = None):
         self.item = item
+        self.cost = cost
+        self.hints = hints or SchedulingHints()
+        self.abandoned = False  # caller stopped waiting (timed out)
+        self.enqueued_at = time.monotonic()
         self.event = threading.Event()
         self.result: Any = None
         self.error: BaseException | None = None
 
+    @property
+    def tenant(self) -> str | None:
+        return self.hints.tenant
+
+    @property
+    def weight(self) -> float:
+        return self.hints.weight
+
+    def expired(self, now: float) -> bool:
+        return self.abandoned or self.hints.expired(now)
+
+    def fail(self, error: BaseException) -> None:
+        self.error = error
+        self.event.set()
+
+
+class FairQueue:
+    """Weighted deficit-round-robin queue over tenants (one per priority lane).
+
+    Each active tenant has a FIFO of slots and a deficit counter. Each turn
+    credits the front tenant ``quantum * weight`` tokens; it dequeues while its
+    deficit covers its head's cost, then goes to the back of the round. Over time every backlogged tenant gets
+    batch tokens in proportion to its weight, whatever its request sizes.
+    Not thread-safe: DynamicBatcher guards it with its condition lock.
+    """
+
+    def __init__(self, quantum: int = 64):
+        self._quantum = max(1, quantum)
+        self._queues: OrderedDict[str | None, deque[_Slot]] = OrderedDict()  # round-robin order
+        self._deficit: dict[str | None, float] = {}
+        self._credited = False  # front tenant already got this turn's quantum
+
+    def __bool__(self) -> bool:
+        return bool(self._queues)
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def __iter__(self):
+        for q in self._queues.values():
+            yield from q
+
+    def extend(self, slots: list[_Slot]) -> None:
+        for slot in slots:
+            q = self._queues.get(slot.tenant)
+            if q is None:
+                q = self._queues[slot.tenant] = deque()
+                self._deficit[slot.tenant] = 0.0
+            q.append(slot)
+
+    def oldest(self) -> float | None:
+        """Enqueue time of the oldest waiting slot (for starvation aging)."""
+        return min((q[0].enqueued_at for q in self._queues.values()), default=None)
+
+    def peek(self) -> _Slot:
+        """The slot DRR serves next. Idempotent until popleft(): crediting the
+        front tenant happens once per turn."""
+        while True:
+            tenant, q = next(iter(self._queues.items()))
+            head = q[0]
+            if not self._credited:
+                self._deficit[tenant] += self._quantum * max(head.weight, 1e-3)
+                self._credited = True
+            if self._deficit[tenant] >= head.cost:
+                return head
+            # Turn over: keep the remaining credit, go to the back of the round.
+            self._queues.move_to_end(tenant)
+            self._credited = False
+
+    def popleft(self) -> _Slot:
+        slot = self.peek()
+        tenant = slot.tenant
+        q = self._queues[tenant]
+        q.popleft()
+        self._deficit[tenant] -= slot.cost
+        if not q:
+            # Idle tenants don't bank credit (standard DRR).
+            del self._queues[tenant]
+            del self._deficit[tenant]
+            self._credited = False
+        return slot
+
+    def clear(self) -> None:
+        self._queues.clear()
+        self._deficit.clear()
+        self._credited = False
+
 
 class DynamicBatcher:
     def __init__(
@@ -38,45 +236,144 @@ class DynamicBatcher:
         batch_fn: Callable[[list], list],
         max_batch: int = 16,
         max_wait_s: float = 0.02,
+        max_tokens: int | None = None,
+        cost_fn: Callable[[Any], int] | None = None,
+        beams: int = 1,
+        starvation_s: float = 2.0,
+        fair_quantum: int = 64,
     ):
         if max_batch < 1:
             raise ValueError("max_batch must be >= 1")
         self._batch_fn = batch_fn
         self._max_batch = max_batch
         self._max_wait_s = max_wait_s
-        self._q: queue.Queue[_Slot] = queue.Queue()
+        self._max_tokens = max_tokens or None
+        self._cost_fn = cost_fn or (lambda _item: 1)
+        self._beams = max(1, beams)
+        self._starvation_s = starvation_s
+        self._lanes: dict[str, FairQueue] = {p: FairQueue(fair_quantum) for p in PRIORITIES}
+        self._cond = threading.Condition()
         self._stop = threading.Event()
         self._worker = threading.Thread(target=self._run, daemon=True)
         self._worker.start()
 
-    def submit(self, item: Any) -> Any:
-        slot = _Slot(item)
-        self._q.put(slot)
-        slot.event.wait()
-        if slot.error is not None:
-            raise slot.error
-        return slot.result
+    def submit(self, item: Any, hints: SchedulingHints | None = None) -> Any:
+        return self.submit_many([item], hints)[0]
+
+    def submit_many(self, items: list, hints: SchedulingHints | None = None) -> list:
+        """Enqueue ``items`` together and block until all have results (in order)."""
+        hints = hints or SchedulingHints()
+        lane = self._lanes.get(hints.priority)
+        if lane is None:
+            raise ValueError(f"unknown priority {hints.priority!r}")
+        hints.check()
+        slots = [_Slot(item, self._cost_fn(item), hints) for item in items]
+        with self._cond:
+            if self._stop.is_set():
+                raise BatcherStopped("batcher is stopped")
+            lane.extend(slots)
+            self._cond.notify()
+        for slot in slots:
+            self._wait(slot, hints, slots)
+        for slot in slots:
+            if slot.error is not None:
+                raise slot.error
+        return [slot.result for slot in slots]
+
+    @staticmethod
+    def _wait(slot: _Slot, hints: SchedulingHints, siblings: list[_Slot]) -> None:
+        if hints.deadline is None and hints.cancelled is None:
+            slot.event.wait()
+            return
+        # Poll so a cancellation (no deadline) is noticed promptly too.
+        while True:
+            remaining = 0.05 if hints.deadline is None else min(0.05, hints.deadline - time.monotonic())
+            if remaining > 0 and slot.event.wait(remaining):
+                return
+            if slot.event.is_set():
+                return
+            if hints.expired():
+                # Let the worker drop whatever of ours is still queued.
+                for s in siblings:
+                    s.abandoned = True
+                hints.check()
+
+    def _has_pending(self) -> bool:
+        return any(self._lanes.values())
+
+    def _lane_order(self) -> list[FairQueue]:
+        """Lanes in service order: starving lanes (oldest item first), then the
+        rest by priority. Caller holds _cond."""
+        cutoff = time.monotonic() - self._starvation_s
+        starving = sorted(
+            (lane for lane in self._lanes.values() if lane and lane.oldest() <= cutoff),
+            key=lambda lane: lane.oldest(),
+        )
+        starving_ids = {id(lane) for lane in starving}
+        return starving + [lane for lane in self._lanes.values() if id(lane) not in starving_ids]
+
+    def _take_fitting(self, batch: list[_Slot], longest: int) -> tuple[int, bool]:
+        """Move queued slots into ``batch`` while they fit, highest-priority
+        lanes first. Caller holds _cond. Returns the new longest cost and
+        whether the batch is full."""
+        now = time.monotonic()
+        for lane in self._lane_order():
+            while lane:
+                if len(batch) >= self._max_batch:
+                    return longest, True
+                slot = lane.peek()
+                if slot.expired(now):
+                    lane.popleft()
+                    self._drop(slot)
+                    continue
+                new_longest = max(longest, slot.cost)
+                if batch and self._max_tokens and (
+                    padded_cost(len(batch) + 1, new_longest, self._beams) > self._max_tokens
+                ):
+                    return longest, True
+                lane.popleft()
+                batch.append(slot)
+                longest = new_longest
+        return longest, len(batch) >= self._max_batch
 
     def _collect_batch(self) -> list[_Slot]:
         # Block for the first item, then greedily gather more until the batch is
-        # full or the time window since the first item elapses.
-        first = self._q.get()
-        batch = [first]
-        deadline = time.monotonic() + self._max_wait_s
-        while len(batch) < self._max_batch:
-            remaining = deadline - time.monotonic()
-            if remaining <= 0:
-                break
-            try:
-                slot = self._q.get(timeout=remaining)
-            except queue.Empty:
-                break
-            batch.append(slot)
-        return batch
+        # full (by count or token budget) or the time window since the first
+        # item elapses.
+        with self._cond:
+            while not self._has_pending() and not self._stop.is_set():
+                self._cond.wait()
+            if self._stop.is_set():
+                return []
+            batch: list[_Slot] = []
+            longest, full = self._take_fitting(batch, 0)
+            deadline = time.monotonic() + self._max_wait_s
+            while not full and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                longest, full = self._take_fitting(batch, longest)
+            return batch
+
+    @staticmethod
+    def _drop(slot: _Slot) -> None:
+        INFERENCE_DROPPED.labels(reason="cancelled" if slot.hints.cancelled and slot.hints.cancelled.is_set()
+                                 else "expired").inc()
+        slot.fail(DeadlineExceeded("deadline exceeded before inference ran"))
 
     def _run(self) -> None:
         while not self._stop.is_set():
             batch = self._collect_batch()
+            # Items can expire while the batch window was open; drop them last-minute.
+            now = time.monotonic()
+            live = []
+            for slot in batch:
+                if slot.expired(now):
+                    self._drop(slot)
+                else:
+                    live.append(slot)
+            batch = live
             if not batch:
                 continue
             try:
@@ -90,8 +387,17 @@ class DynamicBatcher:
                     slot.event.set()
             except BaseException as e:  # noqa: BLE001 - propagate to all callers
                 for slot in batch:
-                    slot.error = e
-                    slot.event.set()
+                    slot.fail(e)
 
     def stop(self) -> None:
-        self._stop.set()
+        with self._cond:
+            self._stop.set()
+            self._cond.notify_all()  # wake the worker if it is waiting for items
+        self._worker.join(timeout=1.0)
+        # Anything still queued (submitted in the race with stop) fails fast.
+        with self._cond:
+            leftover = [slot for lane in self._lanes.values() for slot in lane]
+            for lane in self._lanes.values():
+                lane.clear()
+        for slot in leftover:
+            slot.fail(BatcherStopped("batcher is stopped"))
@@ -0,0 +1,357 @@
+"""Continuous (iteration-level) batching for seq2seq generation.
+
+With ``generate()`` a batch runs until its longest output finishes: short
+sentences that emitted EOS early sit idle (still padded, still computed) behind
+long ones, and requests arriving mid-batch wait for the whole batch to drain.
+Here a background thread drives the decoder one token at a time instead:
+
+  * after every step, finished rows (EOS or their ``max_new_tokens``) are
+    retired immediately and their callers released,
+  * queued requests are admitted into free slots at the next step: they are
+    encoded together and join as a new *cohort*,
+  * rows whose caller gave up (``deadline`` passed) are dropped before the
+    next step, queued or mid-decode, instead of decoding to completion.
+
+Rows inside a cohort share decode length, so their KV caches stay aligned and
+one decoder forward advances the whole cohort. Cohorts admitted at different
+steps have different lengths and are stepped separately (one forward each) but
+within the same loop iteration; retiring rows shrinks a cohort's tensors, so
+compute tracks live sequences rather than the padded worst case.
+
+The scheduler is model-agnostic: it drives a *stepper* (``admit`` / ``step`` /
+``select`` / ``detokenize``) so it can be tested without torch.
+``HFGreedyStepper`` adapts the existing Marian/NLLB ``AutoModelForSeq2SeqLM``
+models. Only greedy decoding is supported; beam search keeps using
+``generate()`` (see ModelManager).
+"""
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, Protocol
+
+import structlog
+
+from app.inference.batcher import BatcherStopped, DeadlineExceeded
+
+log = structlog.get_logger()
+
+
+class Stepper(Protocol):
+    eos_token_id: int
+    forces_eos: bool  # the last allowed position is reserved for EOS (as generate() does)
+
+    def admit(self, texts: list[str], input_ids: list[list[int]] | None) -> Any:
+        """Encode a new cohort; returns its opaque decoder state."""
+
+    def step(self, state: Any) -> list[int]:
+        """Advance every row of the cohort by one token; returns the tokens."""
+
+    def select(self, state: Any, keep: list[int]) -> Any:
+        """Shrink the cohort to the rows at indices ``keep``."""
+
+    def detokenize(self, ids: list[int]) -> str:
+        ...
+
+
+class _Row:
+    __slots__ = ("text", "input_ids", "max_new_tokens", "deadline", "abandoned", "tokens", "event", "result", "error")
+
+    def __init__(self, text: str, input_ids: list[int] | None, max_new_tokens: int, deadline: float | None = None):
+        self.text = text
+        self.input_ids = input_ids
+        self.max_new_tokens = max(1, max_new_tokens)
+        self.deadline = deadline  # time.monotonic(); None = no deadline
+        self.abandoned = False  # the caller stopped waiting
+        self.tokens: list[int] = []
+        self.event = threading.Event()
+        self.result: str | None = None
+        self.error: BaseException | None = None
+
+    def expired(self, now: float) -> bool:
+        return self.abandoned or (self.deadline is not None and now >= self.deadline)
+
+
+class _Cohort:
+    __slots__ = ("rows", "state")
+
+    def __init__(self, rows: list[_Row], state: Any):
+        self.rows = rows
+        self.state = state
+
+
+class ContinuousBatcher:
+    """Token-level scheduler over one model. ``max_active`` bounds the number of
+    sequences being decoded at once (the memory knob)."""
+
+    def __init__(
+        self,
+        stepper: Stepper,
+        max_active: int = 32,
+        step_context: Callable[[], AbstractContextManager] | None = None,
+    ):
+        if max_active < 1:
+            raise ValueError("max_active must be >= 1")
+        self._stepper = stepper
+        # Entered around each admit/step on the scheduler thread (an executor
+        # slot: concurrency limit and torch thread share), never while idle.
+        self._step_context = step_context or nullcontext
+        self._max_active = max_active
+        self._pending: deque[_Row] = deque()
+        self._cohorts: list[_Cohort] = []
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit_many(
+        self,
+        texts: list[str],
+        max_new_tokens: int,
+        input_ids: list[list[int]] | None = None,
+        return_lengths: bool = False,
+        deadline: float | None = None,
+    ) -> list[str] | tuple[list[str], list[int]]:
+        """Decode ``texts``; with ``return_lengths`` also return the number of
+        tokens generated per row (EOS excluded). With ``deadline``
+        (time.monotonic()) waits at most until then, else raises
+        DeadlineExceeded and the rows are dropped from the schedule."""
+        rows = [
+            _Row(t, input_ids[i] if input_ids is not None else None, max_new_tokens, deadline)
+            for i, t in enumerate(texts)
+        ]
+        with self._cond:
+            if self._stop.is_set():
+                raise BatcherStopped("continuous batcher is stopped")
+            self._pending.extend(rows)
+            self._cond.notify()
+        for row in rows:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not row.event.wait(timeout):
+                for r in rows:
+                    r.abandoned = True  # the scheduler drops them at its next step
+                raise DeadlineExceeded("deadline exceeded during continuous decoding")
+        for row in rows:
+            if row.error is not None:
+                raise row.error
+        outs = [row.result or "" for row in rows]
+        if return_lengths:
+            return outs, [len(row.tokens) for row in rows]
+        return outs
+
+    def _active(self) -> int:
+        return sum(len(c.rows) for c in self._cohorts)
+
+    def _admit(self) -> None:
+        with self._cond:
+            while not self._pending and not self._cohorts and not self._stop.is_set():
+                self._cond.wait()
+            free = self._max_active - self._active()
+            rows = [self._pending.popleft() for _ in range(min(free, len(self._pending)))]
+        rows = self._drop_expired(rows)
+        if not rows:
+            return
+        ids = [r.input_ids for r in rows]
+        try:
+            with self._step_context():
+                state = self._stepper.admit(
+                    [r.text for r in rows], ids if all(i is not None for i in ids) else None
+                )
+        except BaseException as e:  # noqa: BLE001 - propagate to the callers
+            self._fail(rows, e)
+            return
+        self._cohorts.append(_Cohort(rows, state))
+
+    @staticmethod
+    def _drop_expired(rows: list[_Row]) -> list[_Row]:
+        """``rows`` minus those past their deadline (their callers are failed,
+        if still waiting). Expired rows never reach the model again."""
+        now = time.monotonic()
+        live = [r for r in rows if not r.expired(now)]
+        if len(live) < len(rows):
+            ContinuousBatcher._fail(
+                [r for r in rows if r.expired(now)], DeadlineExceeded("deadline exceeded before decoding finished"),
+            )
+        return live
+
+    def _advance(self, cohort: _Cohort) -> bool:
+        """One decoder step for a cohort; returns False once it is empty."""
+        live = self._drop_expired(cohort.rows)
+        if not live:
+            return False
+        if len(live) < len(cohort.rows):
+            keep = [i for i, row in enumerate(cohort.rows) if row in live]
+            cohort.rows = live
+            cohort.state = self._stepper.select(cohort.state, keep)
+        tokens = self._stepper.step(cohort.state)
+        reserve = 1 if getattr(self._stepper, "forces_eos", False) else 0
+        keep: list[int] = []
+        for i, (row, tok) in enumerate(zip(cohort.rows, tokens, strict=True)):
+            if tok == self._stepper.eos_token_id:
+                self._finish(row)
+                continue
+            row.tokens.append(tok)
+            if len(row.tokens) >= row.max_new_tokens - reserve:
+                self._finish(row)
+            else:
+                keep.append(i)
+        if not keep:
+            return False
+        if len(keep) < len(cohort.rows):
+            cohort.rows = [cohort.rows[i] for i in keep]
+            cohort.state = self._stepper.select(cohort.state, keep)
+        return True
+
+    def _finish(self, row: _Row) -> None:
+        row.result = self._stepper.detokenize(row.tokens).strip()
+        row.event.set()
+
+    @staticmethod
+    def _fail(rows: list[_Row], error: BaseException) -> None:
+        for row in rows:
+            row.error = error
+            row.event.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._admit()
+            if not self._cohorts:
+                continue
+            still_running: list[_Cohort] = []
+            with self._step_context():
+                for cohort in self._cohorts:
+                    try:
+                        if self._advance(cohort):
+                            still_running.append(cohort)
+                    except BaseException as e:  # noqa: BLE001 - propagate to the callers
+                        log.warning("continuous_step_failed", error=str(e))
+                        self._fail([r for r in cohort.rows if not r.event.is_set()], e)
+            self._cohorts = still_running
+        # Stopped: release everyone still waiting.
+        with self._cond:
+            leftover = list(self._pending)
+            self._pending.clear()
+        for cohort in self._cohorts:
+            leftover.extend(cohort.rows)
+        self._cohorts = []
+        self._fail(leftover, BatcherStopped("continuous batcher is stopped"))
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop.set()
+            self._cond.notify_all()
+        self._worker.join(timeout=5.0)
+
+
+class HFGreedyStepper:
+    """Greedy, KV-cached stepping over an HF encoder-decoder (Marian, NLLB).
+
+    Mirrors the generate() settings the translators use: ``no_repeat_ngram_size``
+    and (for NLLB) ``repetition_penalty`` and a forced target-language BOS.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        device: Any,
+        forced_bos_token_id: int | None = None,
+        no_repeat_ngram_size: int = 3,
+        repetition_penalty: float | None = None,
+    ):
+        import torch
+
+        self._torch = torch
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.forced_bos_token_id = forced_bos_token_id
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.repetition_penalty = repetition_penalty
+        self.eos_token_id = model.config.eos_token_id
+        gen_cfg = getattr(model, "generation_config", None)
+        self.forces_eos = getattr(gen_cfg, "forced_eos_token_id", None) is not None
+        self._start_id = model.config.decoder_start_token_id
+        self._encoder = model.get_encoder()
+
+    def admit(self, texts: list[str], input_ids: list[list[int]] | None) -> dict:
+        if input_ids is not None:
+            enc = self.tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="pt")
+        else:
+            enc = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+        enc = {k: v.to(self.device) for k, v in enc.items()}
+        with self._torch.no_grad():
+            hidden = self._encoder(input_ids=enc["input_ids"], attention_mask=enc["attention_mask"])
+        batch = enc["input_ids"].shape[0]
+        return {
+            "encoder_hidden": hidden.last_hidden_state,
+            "attention_mask": enc["attention_mask"],
+            "past": None,
+            "last": self._torch.full((batch, 1), self._start_id, dtype=self._torch.long, device=self.device),
+            "history": [[self._start_id] for _ in range(batch)],
+        }
+
+    def step(self, state: dict) -> list[int]:
+        torch = self._torch
+        with torch.no_grad():
+            out = self.model(
+                encoder_outputs=(state["encoder_hidden"],),
+                attention_mask=state["attention_mask"],
+                decoder_input_ids=state["last"],
+                past_key_values=state["past"],
+                use_cache=True,
+            )
+        logits = out.logits[:, -1, :].float()
+        history = state["history"]
+        if len(history[0]) == 1 and self.forced_bos_token_id is not None:
+            forced = torch.full_like(logits, float("-inf"))
+            forced[:, self.forced_bos_token_id] = 0.0
+            logits = forced
+        else:
+            self._apply_repetition_rules(logits, history)
+        next_tokens = logits.argmax(dim=-1)
+        state["past"] = out.past_key_values
+        state["last"] = next_tokens.unsqueeze(-1)
+        tokens = next_tokens.tolist()
+        for h, tok in zip(history, tokens, strict=True):
+            h.append(tok)
+        return tokens
+
+    def _apply_repetition_rules(self, logits: Any, history: list[list[int]]) -> None:
+        n = self.no_repeat_ngram_size
+        for row, hist in enumerate(history):
+            if self.repetition_penalty and self.repetition_penalty != 1.0:
+                seen = self._torch.tensor(sorted(set(hist)), device=logits.device)
+                scores = logits[row, seen]
+                logits[row, seen] = self._torch.where(
+                    scores < 0, scores * self.repetition_penalty, scores / self.repetition_penalty
+                )
+            if n and len(hist) >= n:
+                prefix = tuple(hist[-(n - 1):]) if n > 1 else ()
+                banned = {
+                    hist[i + n - 1]
+                    for i in range(len(hist) - n + 1)
+                    if tuple(hist[i:i + n - 1]) == prefix
+                }
+                if banned:
+                    logits[row, list(banned)] = float("-inf")
+
+    def select(self, state: dict, keep: list[int]) -> dict:
+        torch = self._torch
+        idx = torch.tensor(keep, dtype=torch.long, device=self.device)
+        past = state["past"]
+        if hasattr(past, "reorder_cache"):
+            past.reorder_cache(idx)  # Cache objects: index_select along the batch dim
+        else:
+            past = tuple(tuple(t.index_select(0, idx) for t in layer) for layer in past)
+        return {
+            "encoder_hidden": state["encoder_hidden"].index_select(0, idx),
+            "attention_mask": state["attention_mask"].index_select(0, idx),
+            "past": past,
+            "last": state["last"].index_select(0, idx),
+            "history": [state["history"][i] for i in keep],
+        }
+
+    def detokenize(self, ids: list[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
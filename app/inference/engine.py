@@ -1,19 +1,65 @@
-import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any
 
 import spacy
 import structlog
 
+from app.inference.batcher import BatcherStopped, DynamicBatcher, SchedulingHints, plan_batches
+from app.inference.expansion import ExpansionTracker
 from app.inference.model_manager import ModelManager
+from app.settings import settings
 from infra.cache import RedisCache
+from infra.cache_codec import cache_key
+from infra.singleflight import Singleflight
 
 log = structlog.get_logger()
 
-def _hash_key(*parts: str) -> str:
-    h = hashlib.sha256()
-    for p in parts:
-        h.update(p.encode("utf-8"))
-        h.update(b"|")
-    return h.hexdigest()
+# Upper bound on live (model, beam_size, max_new_tokens) batchers. max_new_tokens
+# comes from the request, so without a cap a client could spawn one worker
+# thread per distinct value; the least-recently-used batcher is stopped instead.
+_MAX_BATCHERS = 32
+
+# Translator keyword arguments that hold one value per input row.
+_ROW_KWARGS = ("input_ids", "src_langs", "tgt_langs")
+
+
+def _stop_batchers(batchers: list[DynamicBatcher]) -> None:
+    for batcher in batchers:
+        batcher.stop()
+
+
+def _approx_tokens(text: str) -> int:
+    """Cheap subword-count estimate for batch planning (no tokenizer needed).
+
+    SentencePiece vocabularies average roughly 4 ASCII characters per token,
+    while CJK and other non-ASCII scripts are closer to one token per character.
+    The +2 accounts for the language/EOS special tokens.
+    """
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return (len(text) - non_ascii) // 4 + non_ascii + 2
+
+
+def _item_tokens(item: tuple) -> int:
+    """Batcher cost of a (text, token ids or None[, languages]) item."""
+    text, ids = item[0], item[1]
+    return len(ids) if ids is not None else _approx_tokens(text)
+
+
+def _output_text(r: dict) -> str:
+    # Distinguish a missing key (real error) from an empty string (a valid, if
+    # poor, model output). Collapsing "" to None here used to raise and 500 the
+    # whole request; instead keep the empty segment so the rest of the
+    # translation still returns.
+    out = r.get("translation_text")
+    if out is None:
+        out = r.get("generated_text")
+    if out is None:
+        raise ValueError("pipeline output missing translation/generated text")
+    return out.strip()
+
 
 class InferenceEngine:
     """
@@ -21,13 +67,44 @@ class InferenceEngine:
     - sentence segmentation
     - sentence-level caching and dedupe
     - HF pipeline execution (batch)
+
+    With ``settings.enable_dynamic_batching`` the engine owns one
+    ``DynamicBatcher`` per (model, beam_size, max_new_tokens): uncached
+    sentences from concurrent requests (threadpool handlers, streaming) are
+    coalesced into a single ``generate`` call instead of one per request.
+
+    Translators that name a ``batch_group`` (every nllb:src:tgt pair names
+    the shared NLLB group) are batched under that group instead, each item
+    carrying its ``batch_langs``, so different language pairs on the same
+    weights share generate calls.
+
+    With ``settings.adaptive_max_new_tokens`` each generate call is capped by
+    the batch's longest source times the model's learned expansion ratio (see
+    ``ExpansionTracker``); the request's ``max_new_tokens`` remains the ceiling.
+    Rows that hit the cap are rerun uncapped, so a cap never truncates output.
     """
-    def __init__(self, model_manager: ModelManager):
+    def __init__(
+        self,
+        model_manager: ModelManager,
+        dynamic_batching: bool | None = None,
+        adaptive_max_new_tokens: bool | None = None,
+    ):
         self.mm = model_manager
         # spaCy sentence splitter without large models:
         self.nlp = spacy.blank("xx")
         self.nlp.add_pipe("sentencizer")
 
+        if dynamic_batching is None:
+            dynamic_batching = settings.enable_dynamic_batching
+        self._dynamic_batching = dynamic_batching
+        self._batchers: OrderedDict[tuple[str, int, int], DynamicBatcher] = OrderedDict()
+        self._batchers_lock = threading.Lock()
+
+        if adaptive_max_new_tokens is None:
+            adaptive_max_new_tokens = settings.adaptive_max_new_tokens
+        self.expansion = ExpansionTracker() if adaptive_max_new_tokens else None
+        self._flights = Singleflight()
+
     def _split_sentences(self, text: str) -> list[str]:
         doc = self.nlp(text.strip())
         sents = [s.text.strip() for s in doc.sents if s.text.strip()]
@@ -37,6 +114,245 @@ class InferenceEngine:
         """Public sentence splitter (used by streaming translation)."""
         return self._split_sentences(" ".join(text.strip().split()))
 
+    def _make_batch_fn(self, model_name: str, beam_size: int, max_new_tokens: int) -> Callable:
+        def _batch_fn(items: list[tuple]) -> list[str]:
+            # Resolve the pipeline per batch: the model may have been evicted
+            # and reloaded since the batcher was created.
+            pipe = self.mm.get_pipeline(model_name)
+            texts = [item[0] for item in items]
+            ids = [item[1] for item in items]
+            kwargs = {}
+            if len(items[0]) > 2:  # batch group: (text, ids, (src, tgt)) per row
+                kwargs["src_langs"] = [item[2][0] for item in items]
+                kwargs["tgt_langs"] = [item[2][1] for item in items]
+                # Expansion ratios stay per language pair (the pair's own
+                # model name), not one ratio for the whole group.
+                kwargs["expansion_keys"] = [f"nllb:{src}:{tgt}" for src, tgt in (item[2] for item in items)]
+            log.info("hf_batch_translate", model=model_name, batch=len(items), coalesced=True)
+            return self._run_pipe(model_name, pipe, texts, ids, beam_size, max_new_tokens, **kwargs)
+
+        return _batch_fn
+
+    def _run_pipe(
+        self,
+        model_name: str,
+        pipe: Callable,
+        texts: list[str],
+        ids: list[list[int] | None],
+        beam_size: int,
+        max_new_tokens: int,
+        deadline: float | None = None,
+        expansion_keys: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """``expansion_keys`` names each row's expansion-ratio series (default:
+        ``model_name`` for every row)."""
+        if deadline is not None and getattr(pipe, "takes_deadline", False):
+            kwargs["deadline"] = deadline  # bounds the wait for an executor slot
+        keys = expansion_keys or [model_name] * len(texts)
+        tokenized = all(i is not None for i in ids)
+        requested = max_new_tokens
+        if tokenized:
+            kwargs["input_ids"] = ids  # already tokenized by _encode: skip re-tokenizing
+            if self.expansion is not None:
+                # Only cap on true token lengths: the character estimate can
+                # undercount and would truncate outputs. The batch gets the
+                # largest cap any of its rows needs.
+                longest: dict[str, int] = {}
+                for key, i in zip(keys, ids, strict=True):
+                    longest[key] = max(longest.get(key, 0), len(i))
+                max_new_tokens = max(self.expansion.cap(key, n, max_new_tokens) for key, n in longest.items())
+        results = pipe(texts, num_beams=beam_size, max_new_tokens=max_new_tokens, **kwargs)
+        if max_new_tokens < requested:
+            results = self._rerun_cut_rows(pipe, texts, results, beam_size, max_new_tokens, requested, kwargs)
+        if tokenized and self.expansion is not None:
+            generated = [r.get("generated_tokens") for r in results]
+            if all(n is not None for n in generated):
+                rows: dict[str, tuple[list[int], list[int]]] = {}
+                for key, i, n in zip(keys, ids, generated, strict=True):
+                    src_lens, gen_lens = rows.setdefault(key, ([], []))
+                    src_lens.append(len(i))
+                    gen_lens.append(n)
+                for key, (src_lens, gen_lens) in rows.items():
+                    self.expansion.observe(key, src_lens, gen_lens)
+        return [_output_text(r) for r in results]
+
+    @staticmethod
+    def _rerun_cut_rows(
+        pipe: Callable,
+        texts: list[str],
+        results: list[dict],
+        beam_size: int,
+        cap: int,
+        requested: int,
+        kwargs: dict[str, Any],
+    ) -> list[dict]:
+        """Rows that used the whole adaptive cap may have been cut off before
+        EOS: run them again with the request's ``max_new_tokens``, so truncated
+        text is never returned (or cached under the request's key). Rows that
+        do not report ``generated_tokens`` count as cut off."""
+        generated = [r.get("generated_tokens") for r in results]
+        cut = [j for j, n in enumerate(generated) if n is None or n >= cap]
+        if not cut:
+            return results
+        log.info("adaptive_cap_rerun", rows=len(cut), cap=cap, max_new_tokens=requested)
+        row_kwargs = {k: [v[j] for j in cut] if k in _ROW_KWARGS else v for k, v in kwargs.items()}
+        rerun = pipe([texts[j] for j in cut], num_beams=beam_size, max_new_tokens=requested, **row_kwargs)
+        results = list(results)
+        for j, r in zip(cut, rerun, strict=True):
+            results[j] = r
+        return results
+
+    def _pin(self, model_name: str) -> AbstractContextManager:
+        """Pin the model against eviction while this request's work for it is
+        queued or running (managers without pinning get a no-op)."""
+        pin = getattr(self.mm, "pin", None)
+        return pin(model_name) if pin is not None else nullcontext()
+
+    @staticmethod
+    def _encode(pipe: Callable, texts: list[str]) -> tuple[list[list[int] | None], list[int]]:
+        """Tokenize once with the model's own tokenizer when the translator
+        exposes ``encode`` (real HF translators do); otherwise fall back to the
+        character-based estimate. Returns (ids or None per text, token lengths)."""
+        encode = getattr(pipe, "encode", None)
+        if encode is None:
+            return [None] * len(texts), [_approx_tokens(t) for t in texts]
+        ids = encode(texts)
+        return list(ids), [len(i) for i in ids]
+
+    def _get_batcher(self, model_name: str, beam_size: int, max_new_tokens: int) -> DynamicBatcher:
+        key = (model_name, beam_size, max_new_tokens)
+        with self._batchers_lock:
+            batcher = self._batchers.get(key)
+            if batcher is not None:
+                self._batchers.move_to_end(key)
+                return batcher
+            batcher = DynamicBatcher(
+                self._make_batch_fn(model_name, beam_size, max_new_tokens),
+                max_batch=settings.batch_max_size,
+                max_wait_s=settings.batch_max_wait_ms / 1000.0,
+                max_tokens=settings.batch_max_tokens,
+                cost_fn=_item_tokens,
+                beams=beam_size,
+                starvation_s=settings.batch_starvation_ms / 1000.0,
+            )
+            self._batchers[key] = batcher
+            evicted = []
+            while len(self._batchers) > _MAX_BATCHERS:
+                _, old = self._batchers.popitem(last=False)
+                evicted.append(old)
+        if evicted:
+            # stop() joins the worker thread (up to a second): keep that off
+            # the request path. Items that race with it fail with
+            # BatcherStopped and are resubmitted to a fresh batcher.
+            threading.Thread(target=_stop_batchers, args=(evicted,), name="batcher-stop", daemon=True).start()
+        return batcher
+
+    def generate(
+        self,
+        model_name: str,
+        texts: list[str],
+        beam_size: int,
+        max_new_tokens: int,
+        hints: SchedulingHints | None = None,
+    ) -> list[str]:
+        """Translate ``texts`` with no cache or sentence splitting: the
+        entry point of the model-host sidecar. Outputs are in input order."""
+        return self._generate(model_name, texts, beam_size, max_new_tokens, hints)
+
+    def _generate(
+        self,
+        model_name: str,
+        texts: list[str],
+        beam_size: int,
+        max_new_tokens: int,
+        hints: SchedulingHints | None = None,
+    ) -> list[str]:
+        """Translate unique, uncached sentences; returns outputs in input order.
+
+        Sentences are tokenized once, sorted by token length and run in
+        contiguous length buckets (split by count and padded-token budget), so
+        padding is dictated by similar-length neighbours rather than by the
+        longest sentence of the request. Results are scattered back to the
+        caller's order.
+
+        With a model-host sidecar (``RemoteModelManager``) all of this runs on
+        the host, whose batcher is shared by every process on the node.
+        """
+        remote_generate = getattr(self.mm, "generate", None)
+        if remote_generate is not None:
+            return remote_generate(model_name, texts, beam_size, max_new_tokens, hints)
+        with self._pin(model_name):
+            return self._generate_pinned(model_name, texts, beam_size, max_new_tokens, hints)
+
+    def _generate_pinned(
+        self,
+        model_name: str,
+        texts: list[str],
+        beam_size: int,
+        max_new_tokens: int,
+        hints: SchedulingHints | None,
+    ) -> list[str]:
+        pipe = self.mm.get_pipeline(model_name)
+        ids, lengths = self._encode(pipe, texts)
+        order = sorted(range(len(texts)), key=lambda i: (lengths[i], len(texts[i])))
+        sorted_out: list[str] = []
+        group = getattr(pipe, "batch_group", None)
+        if self._dynamic_batching and group is not None:
+            items = [(texts[i], ids[i], pipe.batch_langs) for i in order]
+            with self._pin(group):
+                sorted_out = self._submit_batched(group, items, beam_size, max_new_tokens, hints)
+        elif self._dynamic_batching:
+            items = [(texts[i], ids[i]) for i in order]
+            sorted_out = self._submit_batched(model_name, items, beam_size, max_new_tokens, hints)
+        else:
+            buckets = plan_batches(
+                [lengths[i] for i in order],
+                max_batch=max(1, settings.batch_max_size),
+                max_tokens=settings.batch_max_tokens,
+                beams=beam_size,
+            )
+            for bucket in buckets:
+                if hints is not None:
+                    hints.check()  # don't start work for a caller that has given up
+                idx = [order[j] for j in bucket]
+                log.info("hf_batch_translate", model=model_name, batch=len(idx))
+                sorted_out.extend(self._run_pipe(
+                    model_name, pipe, [texts[i] for i in idx], [ids[i] for i in idx], beam_size, max_new_tokens,
+                    deadline=hints.deadline if hints is not None else None,
+                ))
+        outputs = [""] * len(texts)
+        for i, out in zip(order, sorted_out, strict=True):
+            outputs[i] = out
+        return outputs
+
+    def _submit_batched(
+        self,
+        model_name: str,
+        items: list[tuple],
+        beam_size: int,
+        max_new_tokens: int,
+        hints: SchedulingHints | None = None,
+    ) -> list[str]:
+        while True:
+            batcher = self._get_batcher(model_name, beam_size, max_new_tokens)
+            try:
+                return batcher.submit_many(items, hints)
+            except BatcherStopped:
+                # Lost a race with pool eviction or close(); a fresh batcher is
+                # created on the next lookup (close() raises below instead).
+                if not self._dynamic_batching:
+                    raise
+
+    def close(self) -> None:
+        """Stop all batcher worker threads (app/worker shutdown)."""
+        self._dynamic_batching = False
+        with self._batchers_lock:
+            batchers = list(self._batchers.values())
+            self._batchers.clear()
+        for batcher in batchers:
+            batcher.stop()
+
     def translate_text(
         self,
         model_name: str,
@@ -45,61 +361,71 @@ class InferenceEngine:
         max_new_tokens: int,
         split_long: bool,
         cache: RedisCache,
+        hints: SchedulingHints | None = None,
     ) -> tuple[str, int]:
-        pipe = self.mm.get_pipeline(model_name)
+        return self.translate_texts(
+            model_name=model_name,
+            texts=[text],
+            beam_size=beam_size,
+            max_new_tokens=max_new_tokens,
+            split_long=split_long,
+            cache=cache,
+            hints=hints,
+        )[0]
+
+    def translate_texts(
+        self,
+        model_name: str,
+        texts: list[str],
+        beam_size: int,
+        max_new_tokens: int,
+        split_long: bool,
+        cache: RedisCache,
+        hints: SchedulingHints | None = None,
+    ) -> list[tuple[str, int]]:
+        """Translate several texts with one model as a single flattened batch.
 
-        text_norm = " ".join(text.strip().split())
-        sents = self._split_sentences(text_norm) if split_long else [text_norm]
+        Every text is split into sentences, the sentence-cache misses are
+        deduplicated across the *whole* list and translated together, then the
+        results are scattered back. Returns ``(translation, sentence_count)``
+        per input text, in order. ``hints`` (priority lane etc.) only matter
+        when dynamic batching is enabled.
+        """
+        per_text: list[list[str]] = []
+        for text in texts:
+            text_norm = " ".join(text.strip().split())
+            per_text.append(self._split_sentences(text_norm) if split_long else [text_norm])
 
-        # Sentence-level cache and dedupe
+        # Sentence-level cache and dedupe (across all texts of the request):
+        # one MGET for every unique sentence, one pipelined write for the misses.
+        unique = list(dict.fromkeys(s for sents in per_text for s in sents))
+        keys = {s: cache_key("sx", model_name, str(beam_size), str(max_new_tokens), s) for s in unique}
+        translated: dict[str, str] = {}
         to_translate: list[str] = []
-        sent_keys: list[str] = []
-        cached_map: dict[str, str] = {}
-
-        for s in sents:
-            k = "sx:" + _hash_key(model_name, str(beam_size), str(max_new_tokens), s)
-            sent_keys.append(k)
-            cached = cache.get_json(k)
+        for s, cached in zip(unique, cache.mget_json(list(keys.values())), strict=True):
             if cached is not None:
-                cached_map[k] = cached["t"]
+                translated[s] = cached["t"]
             else:
                 to_translate.append(s)
 
-        # Deduplicate misses to reduce compute
-        uniq = list(dict.fromkeys(to_translate))
+        if to_translate:
+            by_key = {keys[s]: s for s in to_translate}
 
-        translated_lookup: dict[str, str] = {}
-        if uniq:
-            log.info("hf_batch_translate", model=model_name, batch=len(uniq))
-            results = pipe(
-                uniq,
-                num_beams=beam_size,
-                max_new_tokens=max_new_tokens,
-            )
-            for src, r in zip(uniq, results, strict=True):
-                # Distinguish a missing key (real error) from an empty string (a
-                # valid, if poor, model output). Collapsing "" to None here used
-                # to raise and 500 the whole request; instead keep the empty
-                # segment so the rest of the translation still returns.
-                out = r.get("translation_text")
-                if out is None:
-                    out = r.get("generated_text")
-                if out is None:
-                    raise ValueError("pipeline output missing translation/generated text")
-                translated_lookup[src] = out.strip()
-
-            # write back cache
-            for src in uniq:
-                k = "sx:" + _hash_key(model_name, str(beam_size), str(max_new_tokens), src)
-                cache.set_json(k, {"t": translated_lookup[src]})
-
-        # Reconstruct in original order
-        out_sents: list[str] = []
-        for s, k in zip(sents, sent_keys, strict=True):
-            if k in cached_map:
-                out_sents.append(cached_map[k])
+            def compute(batch: list) -> dict:
+                outputs = self._generate(model_name, [by_key[k] for k in batch], beam_size, max_new_tokens, hints)
+                cache.mset_json({k: {"t": out} for k, out in zip(batch, outputs, strict=True)})
+                return dict(zip(batch, outputs, strict=True))
+
+            if settings.singleflight:
+                # Sentences another request is already translating are waited for.
+                done = self._flights.run(
+                    list(by_key), compute, deadline=hints.deadline if hints else None,
+                    cache=cache, cached=lambda entry: entry["t"],
+                )
             else:
-                out_sents.append(translated_lookup[s])
+                done = compute(list(by_key))
+            for k, out in done.items():
+                translated[by_key[k]] = out
 
-        final = " ".join(out_sents).strip()
-        return final, len(sents)
+        # Reconstruct each text in original sentence order
+        return [(" ".join(translated[s] for s in sents).strip(), len(sents)) for sents in per_text]
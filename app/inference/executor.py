@@ -0,0 +1,141 @@
+"""Bounded inference execution: per-model concurrency and torch thread budgets.
+
+Left alone, every threadpool / batcher thread that calls a translator runs
+``generate`` concurrently and each asks torch for *all* cores, so at
+concurrency 16 a 16-core box runs 256 intra-op threads and latency becomes
+erratic. ``InferenceExecutor`` puts every translator call through:
+
+  * a per-model semaphore (``settings.model_concurrency``, overridable per model
+    with ``settings.model_concurrency_overrides``),
+  * a global semaphore bounding concurrent executions across all models
+    (``settings.inference_max_concurrency``),
+  * a fixed intra-op thread share for the executing thread:
+    ``total_threads // inference_max_concurrency``. With torch's OpenMP backend
+    the thread count is a per-calling-thread setting, so concurrent executions
+    partition the cores instead of oversubscribing them.
+
+A caller with a deadline waits for a slot only until then
+(``DeadlineExceeded``). Greedy calls to a continuous-batching translator
+(``continuous_greedy``) skip the caller-side slot: the caller only waits on
+the scheduler, whose own thread takes a slot around every step.
+
+Inter-op threads are process-wide and can only be set before torch's first
+parallel work, so ``configure`` sets them once, best effort.
+"""
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import structlog
+import torch
+
+from app.inference.batcher import DeadlineExceeded
+from app.metrics import INFERENCE_IN_FLIGHT
+from app.settings import settings
+
+log = structlog.get_logger()
+
+
+def _parse_overrides(raw: str) -> dict[str, int]:
+    """"model=N,model2=M" -> {model: N, model2: M}; bad entries are skipped."""
+    out: dict[str, int] = {}
+    for part in (raw or "").split(","):
+        name, sep, value = part.strip().rpartition("=")
+        if not sep or not name:
+            continue
+        try:
+            out[name.strip()] = max(1, int(value))
+        except ValueError:
+            log.warning("bad_model_concurrency_override", entry=part)
+    return out
+
+
+class InferenceExecutor:
+    def __init__(
+        self,
+        total_threads: int | None = None,
+        max_concurrency: int | None = None,
+        model_concurrency: int | None = None,
+        overrides: dict[str, int] | None = None,
+    ):
+        self._max_concurrency = max(1, max_concurrency or settings.inference_max_concurrency)
+        self._model_concurrency = max(1, model_concurrency or settings.model_concurrency)
+        self._overrides = overrides if overrides is not None else _parse_overrides(
+            settings.model_concurrency_overrides
+        )
+        self._global = threading.BoundedSemaphore(self._max_concurrency)
+        self._per_model: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.configure(total_threads or settings.inference_threads or os.cpu_count() or 1)
+
+    def configure(self, total_threads: int) -> None:
+        """Set the core budget (e.g. a pool worker's share of the machine)."""
+        self.total_threads = max(1, total_threads)
+        self.threads_per_execution = max(1, self.total_threads // self._max_concurrency)
+        try:
+            torch.set_num_interop_threads(max(1, min(self._max_concurrency, self.total_threads)))
+        except RuntimeError:
+            pass  # torch already did parallel work in this process; keep its setting
+
+    def limit(self, model_name: str) -> int:
+        """Concurrent executions allowed for ``model_name``."""
+        return self._overrides.get(model_name, self._model_concurrency)
+
+    def _semaphore(self, model_name: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._per_model.get(model_name)
+            if sem is None:
+                sem = self._per_model[model_name] = threading.BoundedSemaphore(self.limit(model_name))
+            return sem
+
+    @staticmethod
+    def _acquire(sem: threading.BoundedSemaphore, deadline: float | None) -> None:
+        if deadline is None:
+            sem.acquire()
+        elif not sem.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise DeadlineExceeded("deadline exceeded waiting for an inference slot")
+
+    @contextmanager
+    def slot(self, model_name: str, deadline: float | None = None) -> Iterator[None]:
+        """Hold one execution slot for ``model_name`` with this thread's torch
+        thread count set to its share. With ``deadline`` (time.monotonic())
+        waits at most until then, else raises DeadlineExceeded."""
+        model_sem = self._semaphore(model_name)
+        self._acquire(model_sem, deadline)
+        try:
+            self._acquire(self._global, deadline)
+            try:
+                torch.set_num_threads(self.threads_per_execution)
+                INFERENCE_IN_FLIGHT.labels(model=model_name).inc()
+                try:
+                    yield
+                finally:
+                    INFERENCE_IN_FLIGHT.labels(model=model_name).dec()
+            finally:
+                self._global.release()
+        finally:
+            model_sem.release()
+
+    def wrap(self, model_name: str, translator: Callable) -> Callable:
+        """A translator that runs ``translator`` inside a slot; its attributes
+        (``encode``, ``close``) are carried over. The wrapper also takes a
+        ``deadline`` keyword for the slot wait; continuous greedy calls, which
+        take no slot here, hand it to the scheduler instead."""
+        self_bounded = getattr(translator, "continuous_greedy", False)
+
+        def _bounded(*args: Any, deadline: float | None = None, **kwargs: Any):
+            num_beams = kwargs.get("num_beams", args[1] if len(args) > 1 else 1)
+            if self_bounded and num_beams == 1:
+                # The scheduler thread holds the slot; the deadline bounds the wait for rows.
+                if deadline is not None:
+                    kwargs["deadline"] = deadline
+                return translator(*args, **kwargs)
+            with self.slot(model_name, deadline):
+                return translator(*args, **kwargs)
+
+        _bounded.__dict__.update(translator.__dict__)
+        _bounded.takes_deadline = True
+        return _bounded
@@ -0,0 +1,59 @@
+"""Per-batch ``max_new_tokens`` derived from source lengths.
+
+A fixed ``max_new_tokens`` (256 by default) lets one runaway, repetitive
+generation keep a whole batch alive and sizes beam buffers for the worst case.
+Translation output length is tightly coupled to input length, so we learn, per
+model (i.e. per language pair), how many target tokens a source token turns
+into and cap each batch at::
+
+    min(request max_new_tokens, ceil(longest_source * ratio) + slack)
+
+``ratio`` is a high quantile of recently observed output/input ratios (times a
+safety margin), so normal outputs are never truncated; until enough samples are
+seen a conservative default ratio is used. The request's value stays a hard
+ceiling.
+"""
+import math
+import threading
+from collections import deque
+
+from app.settings import settings
+
+_WINDOW = 512        # recent ratios kept per model
+_MIN_SAMPLES = 32    # below this, use the default ratio
+_QUANTILE = 0.99
+_MARGIN = 1.2
+
+
+class ExpansionTracker:
+    def __init__(
+        self,
+        default_ratio: float | None = None,
+        slack: int | None = None,
+    ):
+        self._default_ratio = default_ratio if default_ratio is not None else settings.max_new_tokens_ratio
+        self._slack = slack if slack is not None else settings.max_new_tokens_slack
+        self._ratios: dict[str, deque[float]] = {}
+        self._quantile: dict[str, float] = {}  # cached, refreshed as samples arrive
+        self._lock = threading.Lock()
+
+    def observe(self, model_name: str, source_lengths: list[int], generated_lengths: list[int]) -> None:
+        with self._lock:
+            window = self._ratios.setdefault(model_name, deque(maxlen=_WINDOW))
+            for src, gen in zip(source_lengths, generated_lengths, strict=True):
+                if src > 0:
+                    window.append(gen / src)
+            if len(window) >= _MIN_SAMPLES:
+                ordered = sorted(window)
+                self._quantile[model_name] = ordered[min(len(ordered) - 1, int(_QUANTILE * len(ordered)))]
+
+    def ratio(self, model_name: str) -> float:
+        with self._lock:
+            q = self._quantile.get(model_name)
+        return self._default_ratio if q is None else q * _MARGIN
+
+    def cap(self, model_name: str, longest_source: int, requested: int) -> int:
+        """max_new_tokens for a batch whose longest source has ``longest_source``
+        tokens; never above ``requested``."""
+        budget = math.ceil(longest_source * self.ratio(model_name)) + self._slack
+        return max(1, min(requested, budget))
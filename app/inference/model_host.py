@@ -0,0 +1,424 @@
+"""Model-host sidecar: one process per node owns the models and the batcher.
+
+Run ``python -m app.inference.model_host`` next to the API and Celery
+workers and point them at it with ``settings.model_host_socket``. The host
+owns a ``ModelManager`` and a batching ``InferenceEngine`` and serves
+inference over a Unix domain socket. Clients keep segmentation, the sentence
+cache and dedupe; their ``InferenceEngine`` hands the cache misses to
+``RemoteModelManager.generate``. Every API and worker process on the node then
+feeds the same batcher, so cross-request batching sees all of the node's
+traffic, and the weights are loaded once.
+
+Wire protocol: every message is a frame, a ``!I`` byte length followed by a
+payload. Integers are big-endian ``struct`` fields, and strings are a ``!I``
+length followed by UTF-8 bytes (length ``0xFFFFFFFF`` encodes None).
+
+  request   op:B, then by op
+            TRANSLATE  beams:H max_new_tokens:I priority:B weight:d
+                       timeout_s:d (<0 = none) model tenant count:I text*
+            WARMUP     model
+            INFO, LOADED
+  response  status:B (0 = ok), then
+            ok         TRANSLATE count:I text* | INFO json | LOADED count:I name*
+            error      kind:B message (kind selects the exception raised)
+
+A connection carries one call at a time. Clients keep a pool of connections,
+so concurrent calls from one process run concurrently on the host.
+
+Cancellation is the connection itself. A client whose request is cancelled
+(``hints.cancelled``, e.g. an SSE client went away) or past its deadline
+closes the connection. The host watches every connection while a call is in
+flight and marks that call's hints cancelled when the peer goes away, so the
+batcher drops its queued work.
+"""
+import json
+import os
+import queue
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import structlog
+
+from app.inference.batcher import PRIORITIES, BatcherStopped, DeadlineExceeded, SchedulingHints
+from app.settings import settings
+
+log = structlog.get_logger()
+
+OP_TRANSLATE, OP_WARMUP, OP_INFO, OP_LOADED = 1, 2, 3, 4
+_OK, _ERROR = 0, 1
+# Exceptions that keep their type across the socket (index = wire kind).
+_ERRORS: tuple[type[BaseException], ...] = (RuntimeError, ValueError, DeadlineExceeded, BatcherStopped)
+
+_FRAME = struct.Struct("!I")
+_U8 = struct.Struct("!B")
+_U32 = struct.Struct("!I")
+_TRANSLATE = struct.Struct("!HIBdd")
+_NONE = 0xFFFFFFFF
+_MAX_FRAME = 64 * 1024 * 1024
+_POLL_S = 0.05  # how often in-flight calls check for cancellation / a dead peer
+
+
+class _Writer:
+    def __init__(self, op_or_status: int):
+        self.buf = bytearray(_U8.pack(op_or_status))
+
+    def pack(self, fmt: struct.Struct, *values: Any) -> "_Writer":
+        self.buf += fmt.pack(*values)
+        return self
+
+    def string(self, value: str | None) -> "_Writer":
+        if value is None:
+            self.buf += _U32.pack(_NONE)
+        else:
+            data = value.encode("utf-8")
+            self.buf += _U32.pack(len(data))
+            self.buf += data
+        return self
+
+    def strings(self, values: list[str]) -> "_Writer":
+        self.buf += _U32.pack(len(values))
+        for v in values:
+            self.string(v)
+        return self
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._pos = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self._data, self._pos)
+        self._pos += fmt.size
+        return values
+
+    def u8(self) -> int:
+        return self.unpack(_U8)[0]
+
+    def string(self) -> str | None:
+        (n,) = self.unpack(_U32)
+        if n == _NONE:
+            return None
+        value = self._data[self._pos:self._pos + n].decode("utf-8")
+        self._pos += n
+        return value
+
+    def strings(self) -> list[str]:
+        (count,) = self.unpack(_U32)
+        return [self.string() for _ in range(count)]
+
+
+def _send(sock: socket.socket, payload: bytes | bytearray) -> None:
+    sock.sendall(_FRAME.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes | None:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> bytes | None:
+    """One frame's payload, or None when the peer closed the connection."""
+    head = _recv_exact(sock, _FRAME.size)
+    if head is None:
+        return None
+    (n,) = _FRAME.unpack(head)
+    if n > _MAX_FRAME:
+        raise ValueError(f"frame of {n} bytes exceeds the {_MAX_FRAME} byte limit")
+    return _recv_exact(sock, n)
+
+
+# ---------------------------------------------------------------- server
+
+
+def _watch_peer(sock: socket.socket, done: threading.Event, cancelled: threading.Event) -> None:
+    """Set ``cancelled`` if the client closes ``sock`` before ``done``."""
+    while not done.is_set():
+        try:
+            readable, _, _ = select.select([sock], [], [], _POLL_S)
+            if not readable:
+                continue
+            if sock.recv(1, socket.MSG_PEEK) == b"":
+                cancelled.set()
+        except OSError:
+            cancelled.set()
+        return  # peer closed, or sent data out of turn: stop watching either way
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "_Server"
+
+    def handle(self) -> None:
+        while True:
+            try:
+                payload = _recv(self.request)
+            except (OSError, ValueError) as e:
+                log.warning("model_host_bad_frame", error=str(e))
+                return
+            if payload is None:
+                return
+            done, cancelled = threading.Event(), threading.Event()
+            watcher = threading.Thread(target=_watch_peer, args=(self.request, done, cancelled), daemon=True)
+            watcher.start()
+            try:
+                reply = self.server.host.dispatch(payload, cancelled)
+            finally:
+                done.set()
+                watcher.join()
+            if cancelled.is_set():
+                return  # the client is gone: nobody to reply to
+            _send(self.request, reply)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    host: "ModelHost"
+
+
+class ModelHost:
+    """Serves ``engine`` (a batching InferenceEngine over a local
+    ModelManager) on the Unix socket at ``path``."""
+
+    def __init__(self, path: str, engine: Any):
+        self.path = path
+        self.engine = engine
+        self._server: _Server | None = None
+
+    def dispatch(self, payload: bytes, cancelled: threading.Event | None = None) -> bytes:
+        """Run one request; ``cancelled`` is set if its client disconnects."""
+        reader = _Reader(payload)
+        try:
+            op = reader.u8()
+            if op == OP_TRANSLATE:
+                return self._translate(reader, cancelled)
+            if op == OP_WARMUP:
+                self.engine.mm.warmup(reader.string())
+                return bytes(_Writer(_OK).buf)
+            if op == OP_INFO:
+                info = {**self.engine.mm.device_info(), "executor": "model_host"}
+                return bytes(_Writer(_OK).string(json.dumps(info)).buf)
+            if op == OP_LOADED:
+                return bytes(_Writer(_OK).strings(self.engine.mm.loaded_models()).buf)
+            raise ValueError(f"unknown model host op {op}")
+        except BaseException as e:  # noqa: BLE001 - reported to the client
+            kind = next((i for i, cls in enumerate(_ERRORS) if isinstance(e, cls)), 0)
+            if kind == 0:
+                log.exception("model_host_call_failed")
+            return bytes(_Writer(_ERROR).pack(_U8, kind).string(f"{type(e).__name__}: {e}").buf)
+
+    def _translate(self, reader: _Reader, cancelled: threading.Event | None) -> bytes:
+        beams, max_new_tokens, priority, weight, timeout_s = reader.unpack(_TRANSLATE)
+        model_name, tenant, texts = reader.string(), reader.string(), reader.strings()
+        hints = SchedulingHints(
+            priority=PRIORITIES[priority],
+            tenant=tenant,
+            weight=weight,
+            deadline=time.monotonic() + timeout_s if timeout_s >= 0 else None,
+            cancelled=cancelled,
+        )
+        outputs = self.engine.generate(model_name, texts, beams, max_new_tokens, hints)
+        return bytes(_Writer(_OK).strings(outputs).buf)
+
+    def bind(self) -> None:
+        """Create the socket (clients can connect once this returns)."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # stale socket from a previous run
+        self._server = _Server(self.path, _Handler)
+        self._server.host = self
+        os.chmod(self.path, 0o660)
+        log.info("model_host_listening", socket=self.path)
+
+    def serve_forever(self) -> None:
+        if self._server is None:
+            self.bind()
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.engine.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# ---------------------------------------------------------------- client
+
+
+class _RemoteTranslator:
+    """``get_pipeline`` result for callers that run a translator directly
+    (warmup, tools); the engine uses ``RemoteModelManager.generate``."""
+
+    def __init__(self, mm: "RemoteModelManager", model_name: str):
+        self._mm = mm
+        self.model_name = model_name
+
+    def __call__(self, texts: Any, num_beams: int, max_new_tokens: int, input_ids: list | None = None):
+        if isinstance(texts, str):
+            texts = [texts]
+        outputs = self._mm.generate(self.model_name, list(texts), num_beams, max_new_tokens)
+        return [{"translation_text": out} for out in outputs]
+
+
+class RemoteModelManager:
+    """ModelManager stand-in that forwards inference to the model host."""
+
+    def __init__(self, path: str, timeout_s: float | None = None):
+        self.path = path
+        self._timeout_s = timeout_s or settings.model_host_timeout_s
+        self._idle: queue.LifoQueue[socket.socket] = queue.LifoQueue()
+        self._pid = os.getpid()
+        self._device: str | None = None
+
+    def _connect(self) -> socket.socket:
+        if os.getpid() != self._pid:  # forked: never share the parent's connections
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout_s)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise RuntimeError(f"model host unavailable at {self.path}: {e}") from e
+        return sock
+
+    def _await_reply(self, sock: socket.socket, hints: SchedulingHints | None) -> bytes | None:
+        """The reply frame, waiting at most ``model_host_timeout_s`` and never
+        past the request's deadline. A cancelled or expired request raises
+        DeadlineExceeded (the caller then drops the connection, which tells
+        the host to cancel the call)."""
+        give_up = time.monotonic() + self._timeout_s
+        deadline = hints.deadline if hints is not None else None
+        cancelled = hints.cancelled if hints is not None else None
+        while True:
+            if hints is not None:
+                hints.check()
+            now = time.monotonic()
+            if now >= give_up:
+                raise TimeoutError(f"no reply from the model host within {self._timeout_s:g}s")
+            wait = give_up - now
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - now))
+            if cancelled is not None:
+                wait = min(wait, _POLL_S)
+            readable, _, _ = select.select([sock], [], [], wait)
+            if readable:
+                sock.settimeout(max(0.001, give_up - time.monotonic()))
+                try:
+                    return _recv(sock)
+                finally:
+                    sock.settimeout(self._timeout_s)
+
+    def _call(
+        self, payload: bytearray, parse: Callable[[_Reader], Any], hints: SchedulingHints | None = None,
+    ) -> Any:
+        sock = self._connect()
+        try:
+            _send(sock, payload)
+            reply = self._await_reply(sock, hints)
+        except DeadlineExceeded:
+            sock.close()
+            raise
+        except (OSError, ValueError) as e:
+            sock.close()
+            raise RuntimeError(f"model host call failed: {e}") from e
+        if reply is None:
+            sock.close()
+            raise RuntimeError("model host closed the connection")
+        self._idle.put(sock)
+        reader = _Reader(reply)
+        if reader.u8() != _OK:
+            kind = reader.u8()
+            raise _ERRORS[kind if kind < len(_ERRORS) else 0](reader.string())
+        return parse(reader)
+
+    def generate(
+        self,
+        model_name: str,
+        texts: list[str],
+        beam_size: int,
+        max_new_tokens: int,
+        hints: SchedulingHints | None = None,
+    ) -> list[str]:
+        """Translate ``texts`` on the host (its batcher, pinning and
+        adaptive caps apply). Outputs are in input order."""
+        hints = hints or SchedulingHints()
+        hints.check()
+        # Deadlines travel as time remaining (-1 = none).
+        timeout_s = max(0.0, hints.deadline - time.monotonic()) if hints.deadline is not None else -1.0
+        payload = (
+            _Writer(OP_TRANSLATE)
+            .pack(_TRANSLATE, beam_size, max_new_tokens, PRIORITIES.index(hints.priority), hints.weight, timeout_s)
+            .string(model_name)
+            .string(hints.tenant)
+            .strings(texts)
+        )
+        return self._call(payload.buf, _Reader.strings, hints)
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            self._device = self.device_info().get("device", "unknown")
+        return self._device
+
+    def device_info(self) -> dict:
+        return {**self._call(_Writer(OP_INFO).buf, lambda r: json.loads(r.string())), "socket": self.path}
+
+    def loaded_models(self) -> list[str]:
+        return self._call(_Writer(OP_LOADED).buf, _Reader.strings)
+
+    def warmup(self, model_name: str) -> None:
+        self._call(_Writer(OP_WARMUP).string(model_name).buf, lambda r: None)
+
+    def get_pipeline(self, model_name: str) -> Callable:
+        return _RemoteTranslator(self, model_name)
+
+    def stop(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def main() -> None:
+    from app.inference.engine import InferenceEngine
+    from app.inference.model_manager import ModelManager
+    from app.inference.shared_weights import warmup_model_names
+    from app.logging_config import configure_logging
+
+    configure_logging()
+    path = settings.model_host_socket or "/tmp/translator-model-host.sock"
+    engine = InferenceEngine(ModelManager(), dynamic_batching=True)
+    for name in warmup_model_names():
+        try:
+            engine.mm.warmup(name)
+        except Exception as e:  # best effort, like app warmup
+            log.warning("warmup_failed", model=name, error=str(e))
+    host = ModelHost(path, engine)
+    try:
+        host.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.shutdown()
+
+
+if __name__ == "__main__":
+    main()
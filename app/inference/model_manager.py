@@ -1,8 +1,11 @@
 import os
 import threading
 import time
-from collections import OrderedDict
-from collections.abc import Callable
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from functools import partial
 from typing import Any
 
 from app.settings import settings
@@ -24,12 +27,33 @@ if "HF_HOME" not in os.environ:
 
 import structlog  # noqa: E402
 import torch  # noqa: E402
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer  # noqa: E402
-
-from app.metrics import MODEL_LOAD_SECONDS  # noqa: E402
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, LogitsProcessor, LogitsProcessorList  # noqa: E402
+
+from app.inference.batcher import BatcherStopped  # noqa: E402
+from app.inference.continuous import ContinuousBatcher, HFGreedyStepper  # noqa: E402
+from app.inference.ct2_backend import ct2_model_dir, load_ct2_translator, make_ct2_translate  # noqa: E402
+from app.inference.executor import InferenceExecutor  # noqa: E402
+from app.inference.model_store import load_parallel, pretrained_source, weight_load_kwargs  # noqa: E402
+from app.inference.onnx_backend import load_ort_model, onnx_model_dir  # noqa: E402
+from app.metrics import (  # noqa: E402
+    MODEL_EVICTIONS,
+    MODEL_LOAD_SECONDS,
+    MODEL_LOADS,
+    MODEL_RESIDENT_BYTES,
+    MODEL_THRASH_RELOADS,
+    MODEL_THRASHING,
+)
 
 log = structlog.get_logger()
 
+_BACKENDS = ("torch", "ctranslate2", "onnx")
+
+# Pseudo-model for mixed-language NLLB batches: one translator over the shared
+# weights, taking per-row source/target languages. Every nllb:src:tgt
+# translator names it as its ``batch_group`` (see InferenceEngine).
+NLLB_BATCH_GROUP = "nllb:*"
+_NLLB_GROUP_TOKENIZER_LANG = "eng_Latn"  # any: group inputs are tagged by hand
+
 
 def _resolve_device(setting: str) -> int:
     """Map the DEVICE setting to a torch device index (0=cuda, -1=cpu).
@@ -52,16 +76,247 @@ def _resolve_device(setting: str) -> int:
 
 def _resolve_dtype(setting: str, on_cuda: bool):
     """Resolve the torch dtype. fp16 only makes sense on CUDA; on CPU we always
-    use float32 regardless of the setting."""
+    load float32 regardless of the setting (``int8`` quantizes after loading,
+    see ``_wants_int8``)."""
     choice = (setting or "auto").lower()
     if not on_cuda:
         return torch.float32
     if choice == "float32":
         return torch.float32
-    # auto or float16 -> half precision on GPU (saves memory, faster)
+    # auto, float16 or int8 -> half precision on GPU (saves memory, faster)
     return torch.float16
 
 
+def _wants_int8(setting: str, on_cuda: bool) -> bool:
+    """``torch_dtype=int8``: dynamic int8 quantization of Linear layers. CPU
+    only (the quantized kernels are fbgemm/qnnpack); on CUDA we keep fp16."""
+    if (setting or "").lower() != "int8":
+        return False
+    if on_cuda:
+        log.warning("int8_quantization_is_cpu_only_using_float16")
+        return False
+    return True
+
+
+def _quantize_int8(model):
+    """Dynamically quantize every nn.Linear to int8 weights (activations are
+    quantized on the fly per batch). Roughly quarters the Linear weights, which
+    dominate Marian/NLLB size, and speeds up CPU matmuls. Embeddings and
+    LayerNorm stay float32."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _make_encoder(tokenizer) -> Callable[[list[str]], list[list[int]]]:
+    """Tokenize without padding. Exposed on each translator as ``.encode`` so the
+    engine can measure true token lengths (for length-sorted batching) once and
+    hand the ids back via ``input_ids=`` instead of tokenizing twice."""
+
+    def encode(texts: list[str]) -> list[list[int]]:
+        return tokenizer(list(texts), truncation=True)["input_ids"]
+
+    return encode
+
+
+def _encode_batch(tokenizer, texts: list[str], input_ids: list | None):
+    """Padded model inputs, from pre-tokenized ids when the caller has them."""
+    if input_ids is not None:
+        return tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="pt")
+    return tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+
+
+def _continuous_or_none(
+    stepper_factory: Callable[[], HFGreedyStepper],
+    step_context: Callable[[], AbstractContextManager] | None = None,
+) -> ContinuousBatcher | None:
+    """A token-level ContinuousBatcher for this translator when
+    ``settings.generation_mode == "continuous"``, else None (plain generate()).
+    ``step_context`` (an executor slot) bounds the scheduler thread's work."""
+    if (settings.generation_mode or "standard").lower() != "continuous":
+        return None
+    return ContinuousBatcher(
+        stepper_factory(), max_active=settings.continuous_max_active, step_context=step_context,
+    )
+
+
+def _run_continuous(
+    continuous: ContinuousBatcher | None, texts, num_beams, max_new_tokens, input_ids, deadline: float | None = None,
+):
+    """Greedy requests go through the continuous batcher; returns None when the
+    caller must fall back to generate() (beam search, or the batcher was
+    stopped because the model was evicted mid-call)."""
+    if continuous is None or num_beams != 1:
+        return None
+    try:
+        outs, lengths = continuous.submit_many(
+            texts, max_new_tokens, input_ids, return_lengths=True, deadline=deadline,
+        )
+    except BatcherStopped:
+        return None
+    return [{"translation_text": t, "generated_tokens": n} for t, n in zip(outs, lengths, strict=True)]
+
+
+def _decode_outputs(tokenizer, outputs) -> list[dict]:
+    """Pipeline-style results from generate() output ids. ``generated_tokens``
+    (non-pad tokens after the decoder start) feeds the engine's adaptive
+    max_new_tokens."""
+    decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    lengths = (outputs[:, 1:] != tokenizer.pad_token_id).sum(dim=-1).tolist()
+    return [{"translation_text": t, "generated_tokens": n} for t, n in zip(decoded, lengths, strict=True)]
+
+
+class _PerRowForcedBOS(LogitsProcessor):
+    """Force each row's first generated token to its own target-language
+    token; HF's ``forced_bos_token_id`` is a single id for the whole batch.
+    Rows are batch-major with ``num_beams`` consecutive beams per input."""
+
+    def __init__(self, token_ids: list[int], num_beams: int):
+        self._tokens = torch.tensor(token_ids).repeat_interleave(num_beams)
+
+    def __call__(self, input_ids, scores):
+        if input_ids.shape[-1] != 1:  # only the step after the decoder start token
+            return scores
+        forced = torch.full_like(scores, -float("inf"))
+        rows = torch.arange(scores.shape[0], device=scores.device)
+        forced[rows, self._tokens.to(scores.device)] = 0.0
+        return forced
+
+
+def _nllb_tagged_ids(tokenizer, texts: list[str], src_langs: list[str]) -> list[list[int]]:
+    """``[src_lang] tokens </s>`` per row from one tokenizer: what a tokenizer
+    with ``src_lang`` set produces, but with a different source per row."""
+    body = tokenizer(
+        list(texts), add_special_tokens=False, truncation=True, max_length=tokenizer.model_max_length - 2,
+    )["input_ids"]
+    return [
+        [tokenizer.convert_tokens_to_ids(src), *ids, tokenizer.eos_token_id]
+        for src, ids in zip(src_langs, body, strict=True)
+    ]
+
+
+def _make_nllb_group_translate(model: Any, tokenizer: Any, device: Any, **generate_kwargs: Any) -> Callable:
+    """Translator for ``NLLB_BATCH_GROUP``: one generate() over rows with
+    different source and target languages (``src_langs`` / ``tgt_langs``)."""
+
+    def _translate(
+        texts: Any,
+        num_beams: int,
+        max_new_tokens: int,
+        input_ids: list | None = None,
+        src_langs: list[str] | None = None,
+        tgt_langs: list[str] | None = None,
+    ):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not tgt_langs or len(tgt_langs) != len(texts):
+            raise ValueError("NLLB group translation needs one target language per row")
+        ids = input_ids if input_ids is not None else _nllb_tagged_ids(tokenizer, texts, src_langs)
+        inputs = tokenizer.pad({"input_ids": ids}, padding=True, return_tensors="pt")
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        forced = _PerRowForcedBOS([tokenizer.convert_tokens_to_ids(t) for t in tgt_langs], num_beams)
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs, num_beams=num_beams, max_new_tokens=max_new_tokens,
+                logits_processor=LogitsProcessorList([forced]), **generate_kwargs,
+            )
+        return _decode_outputs(tokenizer, outputs)
+
+    return _translate
+
+
+def _make_generate_translate(
+    model: Any,
+    tokenizer: Any,
+    device: Any,
+    continuous: ContinuousBatcher | None,
+    **generate_kwargs: Any,
+) -> Callable:
+    """The translator closure around ``model.generate`` (HF eager or ONNX
+    Runtime models alike): continuous batching first when enabled, else one
+    padded generate() call. Attaches ``.encode`` and, with continuous
+    batching, ``.close``."""
+
+    def _translate(
+        texts: Any, num_beams: int, max_new_tokens: int, input_ids: list | None = None, deadline: float | None = None,
+    ):
+        if isinstance(texts, str):
+            texts = [texts]
+        streamed = _run_continuous(continuous, texts, num_beams, max_new_tokens, input_ids, deadline)
+        if streamed is not None:
+            return streamed
+        inputs = _encode_batch(tokenizer, texts, input_ids)
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with torch.no_grad():
+            outputs = model.generate(
+                **inputs, num_beams=num_beams, max_new_tokens=max_new_tokens, **generate_kwargs,
+            )
+        return _decode_outputs(tokenizer, outputs)
+
+    _translate.encode = _make_encoder(tokenizer)
+    if continuous is not None:
+        _translate.close = continuous.stop
+        _translate.continuous_greedy = True  # greedy calls are bounded by the scheduler
+    return _translate
+
+
+def _module_bytes(model: Any) -> int:
+    """Resident size of a torch model: every tensor in its state dict (params
+    and buffers; dynamic-int8 packed weights included)."""
+    total = 0
+    for value in model.state_dict().values():
+        tensors = value if isinstance(value, tuple) else (value,)
+        for t in tensors:
+            if torch.is_tensor(t):
+                total += t.numel() * t.element_size()
+    return total
+
+
+def _dir_bytes(path: str) -> int:
+    """On-disk size of a converted/exported model (CTranslate2, ONNX): the
+    weights are loaded whole, so this approximates their resident size."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def _parse_cost_weights(raw: str) -> dict[str, float]:
+    """"name=w,..." reload-cost weights. A key matches the model name exactly,
+    or as a prefix before ":" (so "nllb=4" covers every nllb:src:tgt)."""
+    out: dict[str, float] = {}
+    for part in (raw or "").split(","):
+        name, sep, value = part.strip().rpartition("=")
+        if not sep or not name:
+            continue
+        try:
+            out[name.strip()] = max(0.01, float(value))
+        except ValueError:
+            log.warning("bad_model_cost_weight", entry=part)
+    return out
+
+
+def _close_all(translators: list[Callable]) -> None:
+    """Stop evicted translators' continuous-batching threads (outside _lock)."""
+    for translator in translators:
+        close = getattr(translator, "close", None)
+        if close is not None:
+            close()
+
+
+# Every ModelManager alive in this process; the thrash alarm reads them all.
+_live_managers: "weakref.WeakSet[ModelManager]" = weakref.WeakSet()
+
+
+def _thrashing_alarm() -> float:
+    return max((mm._thrashing() for mm in list(_live_managers)), default=0.0)
+
+
+MODEL_THRASHING.set_function(_thrashing_alarm)
+
+
 class ModelManager:
     """
     Loads and caches HF pipelines per model_name.
@@ -71,26 +326,72 @@ class ModelManager:
     double-checked locking with a per-model load lock so that:
       * only one thread loads any given model (no duplicate ``from_pretrained``),
       * different models can still load concurrently.
-
-    Memory: resident models are capped at ``settings.max_loaded_models`` with
-    LRU eviction. Dropping the pipeline from the dict releases the only strong
-    reference to the underlying model/tokenizer; on CUDA we then reclaim the
-    freed blocks with ``empty_cache()``.
+    Every translator returned is wrapped by ``InferenceExecutor`` (per-model
+    concurrency limit + torch thread share).
+
+    Memory: residency is bounded by ``settings.max_loaded_models`` and, when
+    set, by a byte budget (``settings.model_memory_budget_mb``) computed from
+    each model's parameter and buffer sizes; the shared NLLB weights count once
+    while any nllb:* pseudo-model is resident and are released with the last
+    one. The victim is the model with the highest idle time / cost weight
+    (``settings.model_cost_weights``: a higher weight means a costlier reload,
+    kept longer); with equal weights this is plain LRU.
+
+    Thrash control: callers ``pin`` a model while they have work running or
+    queued for it, and pinned models are never evicted; neither is a model
+    loaded less than ``settings.model_min_resident_s`` ago, unless the byte
+    budget is exceeded (residency only defers count-cap evictions). If every
+    candidate is protected the caps are exceeded briefly and enforced again
+    when a pin is released or the next model loads. Reloads of a recently evicted model
+    are counted as thrash (``model_thrash_reloads_total``) and raise the
+    ``model_eviction_thrashing`` alarm. Dropping the pipeline
+    from the dict releases the only strong reference to the underlying
+    model/tokenizer; on CUDA we then reclaim the freed blocks with
+    ``empty_cache()``.
     """
 
-    def __init__(self, max_loaded_models: int | None = None):
+    def __init__(
+        self,
+        max_loaded_models: int | None = None,
+        memory_budget_mb: int | None = None,
+        min_resident_s: float | None = None,
+    ):
         self._pipelines: OrderedDict[str, Callable] = OrderedDict()
         self._lock = threading.Lock()          # guards _pipelines and _load_locks
         self._load_locks: dict[str, threading.Lock] = {}
         self._max_loaded = max_loaded_models or settings.max_loaded_models
+        budget_mb = settings.model_memory_budget_mb if memory_budget_mb is None else memory_budget_mb
+        self._budget_bytes = budget_mb * 1024 * 1024
+        self._cost_weights = _parse_cost_weights(settings.model_cost_weights)
+        self._last_used: dict[str, float] = {}
+        self._pins: dict[str, int] = {}           # model -> callers with work running/queued
+        self._loaded_at: dict[str, float] = {}
+        self._evicted_at: dict[str, float] = {}
+        self._thrash_reloads: deque[float] = deque()
+        self._min_resident_s = settings.model_min_resident_s if min_resident_s is None else min_resident_s
+        _live_managers.add(self)
         # Shared NLLB model + per-source-language tokenizers (see _build_nllb_*).
         # A single 600M model backs every "nllb:src:tgt" pseudo-model.
         self._nllb: tuple | None = None
         self._nllb_tokenizers: dict[str, Any] = {}
+        self._nllb_tokenizers_lock = threading.Lock()
+        self._encoders: dict[str, Callable] = {}  # tokenizer-only encoders (see get_encoder)
+        self._encoders_lock = threading.Lock()
         self._nllb_lock = threading.Lock()
+        self._nllb_ct2: Any = None
+        self._nllb_onnx: Any = None
+        self._nllb_builds = 0  # nllb:* translators being built (guarded by _lock)
+        # "torch" (HF generate), "ctranslate2" (see ct2_backend) or "onnx"
+        # (ONNX Runtime, see onnx_backend).
+        self._backend = (settings.inference_backend or "torch").lower()
+        if self._backend not in _BACKENDS:
+            raise ValueError(f"unknown inference_backend: {settings.inference_backend!r}")
+        # Per-model concurrency + torch thread budget for every translator call.
+        self.executor = InferenceExecutor()
 
         self._device = _resolve_device(settings.device)
         self._dtype = _resolve_dtype(settings.torch_dtype, on_cuda=self._device == 0)
+        self._int8 = _wants_int8(settings.torch_dtype, on_cuda=self._device == 0)
         if self._device == 0:
             try:
                 log.info("gpu_selected", name=torch.cuda.get_device_name(0), dtype=str(self._dtype))
@@ -102,7 +403,11 @@ class ModelManager:
         return "cuda" if self._device == 0 else "cpu"
 
     def device_info(self) -> dict:
-        info = {"device": self.device, "dtype": str(self._dtype).replace("torch.", "")}
+        info = {
+            "device": self.device,
+            "dtype": "int8" if self._int8 else str(self._dtype).replace("torch.", ""),
+            "backend": self._backend,
+        }
         if self._device == 0:
             try:
                 info["gpu_name"] = torch.cuda.get_device_name(0)
@@ -118,7 +423,7 @@ class ModelManager:
         with self._lock:
             pipe = self._pipelines.get(model_name)
             if pipe is not None:
-                self._pipelines.move_to_end(model_name)
+                self._touch(model_name)
                 return pipe
             load_lock = self._load_locks.setdefault(model_name, threading.Lock())
 
@@ -128,32 +433,202 @@ class ModelManager:
             with self._lock:
                 pipe = self._pipelines.get(model_name)
                 if pipe is not None:  # another thread loaded it while we waited
-                    self._pipelines.move_to_end(model_name)
+                    self._touch(model_name)
                     return pipe
 
             log.info("loading_model", model=model_name, device=self.device)
             _t0 = time.perf_counter()
-            if model_name.startswith("nllb:"):
-                translator = self._build_nllb_translator(model_name)
-            else:
-                translator = self._build_seq2seq_translator(model_name)
+            nllb = model_name.startswith("nllb:")
+            if nllb:
+                with self._lock:
+                    self._nllb_builds += 1  # holds the shared weights until registered
+            try:
+                if nllb:
+                    translator = self._build_nllb_translator(model_name)
+                else:
+                    translator = self._build_seq2seq_translator(model_name)
+                translator = self.executor.wrap(model_name, translator)
+            except BaseException:
+                if nllb:
+                    with self._lock:
+                        self._nllb_builds -= 1
+                        self._release_unused_shared()
+                raise
             MODEL_LOAD_SECONDS.labels(model=model_name).observe(time.perf_counter() - _t0)
+            MODEL_LOADS.labels(model=model_name).inc()
 
             with self._lock:
+                if nllb:
+                    self._nllb_builds -= 1
                 self._pipelines[model_name] = translator
-                self._pipelines.move_to_end(model_name)
-                self._evict_if_needed()
+                self._touch(model_name)
+                self._record_load(model_name)
+                evicted = self._evict_if_needed(keep=model_name)
+            _close_all(evicted)
             return translator
 
-    def _evict_if_needed(self) -> None:
-        """Evict least-recently-used models past the cap. Caller holds _lock."""
-        evicted = False
-        while len(self._pipelines) > self._max_loaded:
-            old_name, _ = self._pipelines.popitem(last=False)
-            log.info("evicting_model", model=old_name)
-            evicted = True
+    @contextmanager
+    def pin(self, model_name: str) -> Iterator[None]:
+        """Keep ``model_name`` resident while the caller has work for it
+        (running or queued). Pins are reference counted and may be taken
+        before the model is loaded. Evictions deferred by the pin happen when
+        the last one is released."""
+        with self._lock:
+            self._pins[model_name] = self._pins.get(model_name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                left = self._pins[model_name] - 1
+                if left:
+                    self._pins[model_name] = left
+                    evicted = []
+                else:
+                    del self._pins[model_name]
+                    evicted = self._evict_if_needed()
+            _close_all(evicted)
+
+    def _record_load(self, model_name: str) -> None:
+        """Count a reload soon after eviction as thrash. Caller holds _lock."""
+        now = time.monotonic()
+        self._loaded_at[model_name] = now
+        evicted_at = self._evicted_at.pop(model_name, None)
+        if evicted_at is None or now - evicted_at > settings.model_thrash_window_s:
+            return
+        MODEL_THRASH_RELOADS.labels(model=model_name).inc()
+        self._thrash_reloads.append(now)
+        log.warning("model_thrash_reload", model=model_name, evicted_s_ago=round(now - evicted_at, 1),
+                    loaded=len(self._pipelines))
+
+    def _thrashing(self) -> float:
+        """1.0 while recent thrash reloads reach the alarm threshold."""
+        cutoff = time.monotonic() - settings.model_thrash_window_s
+        with self._lock:
+            while self._thrash_reloads and self._thrash_reloads[0] < cutoff:
+                self._thrash_reloads.popleft()
+            count = len(self._thrash_reloads)
+        return 1.0 if count >= settings.model_thrash_alarm_reloads else 0.0
+
+    def _touch(self, model_name: str) -> None:
+        """Mark as most recently used. Caller holds _lock."""
+        self._pipelines.move_to_end(model_name)
+        self._last_used[model_name] = time.monotonic()
+
+    def _cost_weight(self, model_name: str) -> float:
+        weight = self._cost_weights.get(model_name)
+        if weight is None:
+            weight = self._cost_weights.get(model_name.split(":", 1)[0], 1.0)
+        return weight
+
+    def _shared_groups(self) -> dict[str, int]:
+        """Shared weight groups in use (e.g. the NLLB base model) -> bytes.
+        Caller holds _lock."""
+        groups: dict[str, int] = {}
+        for p in self._pipelines.values():
+            group = getattr(p, "shared_weights", None)
+            if group is not None:
+                groups[group] = max(groups.get(group, 0), getattr(p, "shared_bytes", 0))
+        return groups
+
+    def _resident_bytes(self) -> int:
+        """Own bytes of every resident pipeline plus each shared weight group
+        in use, counted once. Caller holds _lock."""
+        own = sum(getattr(p, "resident_bytes", 0) for p in self._pipelines.values())
+        return own + sum(self._shared_groups().values())
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return self._resident_bytes()
+
+    def _over_count(self) -> bool:
+        return len(self._pipelines) > self._max_loaded
+
+    def _over_bytes(self) -> bool:
+        return bool(self._budget_bytes) and self._resident_bytes() > self._budget_bytes
+
+    def _pick_victim(self, keep: str | None, min_residency: bool = True) -> str | None:
+        """Highest idle time / cost weight (LRU when weights are equal) among
+        models that are not pinned and, with ``min_residency``, not within
+        their minimum residency."""
+        now = time.monotonic()
+        best, best_score = None, -1.0
+        for name in self._pipelines:  # oldest first: ties resolve to LRU
+            if name == keep or name in self._pins:
+                continue
+            if min_residency and now - self._loaded_at.get(name, 0.0) < self._min_resident_s:
+                continue
+            score = (now - self._last_used.get(name, 0.0)) / self._cost_weight(name)
+            if score > best_score:
+                best, best_score = name, score
+        return best
+
+    def _evict_if_needed(self, keep: str | None = None) -> list[Callable]:
+        """Evict models while over the count cap or the byte budget, never
+        ``keep`` (the model just loaded, even if it alone exceeds the budget)
+        or pinned models. Minimum residency only defers count-cap evictions:
+        the byte budget protects device memory and is always enforced.
+        Caller holds _lock. Returns the evicted translators so the caller can
+        close them."""
+        evicted: list[Callable] = []
+        while True:
+            over_bytes = self._over_bytes()
+            if not over_bytes and not self._over_count():
+                break
+            victim = self._pick_victim(keep, min_residency=not over_bytes)
+            if victim is None:
+                log.info("eviction_deferred", loaded=len(self._pipelines), pinned=len(self._pins))
+                break
+            old_pipe = self._pipelines.pop(victim)
+            self._last_used.pop(victim, None)
+            self._loaded_at.pop(victim, None)
+            self._evicted_at[victim] = time.monotonic()
+            log.info("evicting_model", model=victim, resident_bytes=self._resident_bytes())
+            MODEL_EVICTIONS.labels(model=victim).inc()
+            evicted.append(old_pipe)
+            MODEL_RESIDENT_BYTES.labels(model=victim).set(0)
+            self._release_unused_shared()
+        for name, pipe in self._pipelines.items():
+            MODEL_RESIDENT_BYTES.labels(model=name).set(getattr(pipe, "resident_bytes", 0))
+        for group, nbytes in self._shared_groups().items():
+            MODEL_RESIDENT_BYTES.labels(model=group).set(nbytes)
         if evicted and self._device == 0:
             torch.cuda.empty_cache()
+        return evicted
+
+    def _release_unused_shared(self) -> None:
+        """Drop the shared NLLB weights once no nllb:* pipeline is resident
+        or being built (a build holds the weights before it is registered).
+        Caller holds _lock."""
+        from app.core.routing import NLLB_MODEL
+        if self._nllb is None and self._nllb_ct2 is None and self._nllb_onnx is None:
+            return
+        if self._nllb_builds or NLLB_MODEL in self._shared_groups():
+            return
+        log.info("releasing_shared_weights", model=NLLB_MODEL)
+        MODEL_RESIDENT_BYTES.labels(model=NLLB_MODEL).set(0)
+        self._nllb = self._nllb_ct2 = self._nllb_onnx = None
+
+    def get_encoder(self, model_name: str) -> Callable[[list[str]], list[list[int]]] | None:
+        """The ``encode`` of ``model_name``'s translator, loading only its
+        tokenizer (no weights) when the model is not resident here. Lets a
+        process that forwards generation elsewhere (``ProcessPoolModelManager``)
+        tokenize locally. None for translators without ``encode``."""
+        with self._lock:
+            pipe = self._pipelines.get(model_name)
+        if pipe is not None:
+            return getattr(pipe, "encode", None)
+        if model_name == NLLB_BATCH_GROUP:
+            return None
+        with self._encoders_lock:
+            encoder = self._encoders.get(model_name)
+            if encoder is None:
+                if model_name.startswith("nllb:"):
+                    tokenizer = self._get_nllb_tokenizer(model_name.split(":")[1])
+                else:
+                    source, source_kwargs = pretrained_source(model_name)
+                    tokenizer = AutoTokenizer.from_pretrained(source, **source_kwargs)
+                encoder = self._encoders[model_name] = _make_encoder(tokenizer)
+            return encoder
 
     def loaded_models(self) -> list[str]:
         with self._lock:
@@ -166,41 +641,56 @@ class ModelManager:
         pipe("warmup", num_beams=1, max_new_tokens=1)
 
     def _build_seq2seq_translator(self, model_name: str) -> Callable:
-        # Pass cache_dir explicitly: huggingface_hub freezes its cache location at
-        # import time, so setting HF_HOME later (see __init__) is too late and the
+        # pretrained_source() gives the cached snapshot path when the model is
+        # on disk (no hub round trips), else the hub name with cache_dir set
+        # explicitly: huggingface_hub freezes its cache location at import
+        # time, so setting HF_HOME later (see __init__) is too late and the
         # download would land in ~/.cache/huggingface instead of our persistent
-        # volume, forcing a re-download on every fresh process. The cache_dir kwarg
-        # is honored at call time and always wins.
-        cache_dir = settings.hf_model_cache
-        tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+        # volume, forcing a re-download on every fresh process. The cache_dir
+        # kwarg is honored at call time and always wins.
+        source, source_kwargs = pretrained_source(model_name)
+
+        def load_tokenizer():
+            return AutoTokenizer.from_pretrained(source, **source_kwargs)
+
+        if self._backend == "ctranslate2":
+            tokenizer, ct2_model = load_parallel(load_tokenizer, lambda: self._load_ct2(model_name))
+            translator = make_ct2_translate(ct2_model, tokenizer)
+            translator.resident_bytes = _dir_bytes(ct2_model_dir(model_name))
+            return translator
+        if self._backend == "onnx":
+            tokenizer, ort_model = load_parallel(load_tokenizer, lambda: self._load_onnx(model_name))
+            translator = _make_generate_translate(
+                ort_model, tokenizer, torch.device(self.device), None,
+                no_repeat_ngram_size=3,
+            )
+            translator.resident_bytes = _dir_bytes(onnx_model_dir(model_name))
+            return translator
+        tokenizer, (model, device) = load_parallel(load_tokenizer, lambda: self._load_torch_model(model_name))
+
+        continuous = _continuous_or_none(
+            lambda: HFGreedyStepper(model, tokenizer, device), partial(self.executor.slot, model_name),
+        )
+        translator = _make_generate_translate(
+            model, tokenizer, device, continuous,
+            no_repeat_ngram_size=3,  # curb "你好。 你好。"-style repetition
+        )
+        translator.resident_bytes = _module_bytes(model)
+        return translator
+
+    def _load_torch_model(self, model_name: str) -> tuple:
+        """Load weights in eval mode (quantized when configured) onto the
+        device. Returns (model, device)."""
+        source, source_kwargs = pretrained_source(model_name)
         model = AutoModelForSeq2SeqLM.from_pretrained(
-            model_name, torch_dtype=self._dtype, cache_dir=cache_dir
+            source, torch_dtype=self._dtype, **source_kwargs, **weight_load_kwargs()
         )
         model.eval()
+        if self._int8:
+            model = _quantize_int8(model)
         device = torch.device("cuda" if self._device == 0 else "cpu")
         model.to(device)
-
-        def _translate(texts: Any, num_beams: int, max_new_tokens: int):
-            if isinstance(texts, str):
-                texts = [texts]
-            inputs = tokenizer(
-                texts,
-                return_tensors="pt",
-                padding=True,
-                truncation=True,
-            )
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    num_beams=num_beams,
-                    max_new_tokens=max_new_tokens,
-                    no_repeat_ngram_size=3,  # curb "你好。 你好。"-style repetition
-                )
-            decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
-            return [{"translation_text": t} for t in decoded]
-
-        return _translate
+        return model, device
 
     def _get_nllb(self) -> tuple:
         """Load the shared NLLB model once (it's ~600M — one copy backs every
@@ -208,54 +698,127 @@ class ModelManager:
         with self._nllb_lock:
             if self._nllb is None:
                 from app.core.routing import NLLB_MODEL
-                cache_dir = settings.hf_model_cache
-                model = AutoModelForSeq2SeqLM.from_pretrained(
-                    NLLB_MODEL, torch_dtype=self._dtype, cache_dir=cache_dir
-                )
-                model.eval()
-                device = torch.device("cuda" if self._device == 0 else "cpu")
-                model.to(device)
-                self._nllb = (model, device)
+                self._nllb = self._load_torch_model(NLLB_MODEL)
             return self._nllb
 
+    def _load_ct2(self, model_name: str) -> Any:
+        """A CTranslate2 translator sized to the executor: one inter-op worker
+        per allowed concurrent call, each with the executor's thread share."""
+        return load_ct2_translator(
+            model_name,
+            device=self.device,
+            intra_threads=self.executor.threads_per_execution,
+            inter_threads=self.executor.limit(model_name),
+        )
+
+    def _get_nllb_ct2(self) -> Any:
+        """Shared CTranslate2 NLLB model (the ct2 counterpart of _get_nllb)."""
+        with self._nllb_lock:
+            if self._nllb_ct2 is None:
+                from app.core.routing import NLLB_MODEL
+                self._nllb_ct2 = self._load_ct2(NLLB_MODEL)
+            return self._nllb_ct2
+
+    def _load_onnx(self, model_name: str) -> Any:
+        return load_ort_model(model_name, device=self.device, intra_threads=self.executor.threads_per_execution)
+
+    def _get_nllb_onnx(self) -> Any:
+        """Shared ONNX Runtime NLLB model (the onnx counterpart of _get_nllb)."""
+        with self._nllb_lock:
+            if self._nllb_onnx is None:
+                from app.core.routing import NLLB_MODEL
+                self._nllb_onnx = self._load_onnx(NLLB_MODEL)
+            return self._nllb_onnx
+
     def _get_nllb_tokenizer(self, src_code: str):
         """One tokenizer per source language (its src_lang prefix is fixed), so
         concurrent translations with different source languages don't race on a
-        shared mutable tokenizer.src_lang."""
-        with self._nllb_lock:
+        shared mutable tokenizer.src_lang. Own lock, so it can load while the
+        weights do (see _build_nllb_translator)."""
+        with self._nllb_tokenizers_lock:
             tok = self._nllb_tokenizers.get(src_code)
             if tok is None:
                 from app.core.routing import NLLB_MODEL
-                tok = AutoTokenizer.from_pretrained(
-                    NLLB_MODEL, cache_dir=settings.hf_model_cache, src_lang=src_code
-                )
+                source, source_kwargs = pretrained_source(NLLB_MODEL)
+                tok = AutoTokenizer.from_pretrained(source, **source_kwargs, src_lang=src_code)
                 self._nllb_tokenizers[src_code] = tok
             return tok
 
     def _build_nllb_translator(self, model_name: str) -> Callable:
-        # model_name is "nllb:<src_code>:<tgt_code>", e.g. nllb:zho_Hans:kor_Hang.
-        _, src_code, tgt_code = model_name.split(":")
-        model, device = self._get_nllb()
-        tokenizer = self._get_nllb_tokenizer(src_code)
+        # model_name is "nllb:<src_code>:<tgt_code>", e.g. nllb:zho_Hans:kor_Hang,
+        # or NLLB_BATCH_GROUP. The weights are shared by every nllb:* pipeline:
+        # they are accounted once, as the NLLB_MODEL group (see _resident_bytes).
+        from app.core.routing import NLLB_MODEL
+        if model_name == NLLB_BATCH_GROUP:
+            translator, weights = self._build_nllb_group_translator()
+        else:
+            _, src_code, tgt_code = model_name.split(":")
+            translator, weights = self._build_nllb_pair_translator(src_code, tgt_code)
+            if (settings.generation_mode or "standard").lower() != "continuous":
+                # Let the engine batch this pair with other NLLB pairs.
+                translator.batch_group = NLLB_BATCH_GROUP
+                translator.batch_langs = (src_code, tgt_code)
+        translator.shared_weights = NLLB_MODEL
+        translator.shared_bytes = self._nllb_shared_bytes(weights)
+        return translator
+
+    def _nllb_shared_bytes(self, weights: Any) -> int:
+        """Size of the shared NLLB ``weights`` a translator was built on."""
+        from app.core.routing import NLLB_MODEL
+        if self._backend == "ctranslate2":
+            return _dir_bytes(ct2_model_dir(NLLB_MODEL))
+        if self._backend == "onnx":
+            return _dir_bytes(onnx_model_dir(NLLB_MODEL))
+        return _module_bytes(weights[0])
+
+    def _build_nllb_group_translator(self) -> tuple[Callable, Any]:
+        """The group translator and the shared weights it holds."""
+
+        def load_tokenizer():
+            return self._get_nllb_tokenizer(_NLLB_GROUP_TOKENIZER_LANG)
+
+        if self._backend == "ctranslate2":
+            weights, tokenizer = load_parallel(self._get_nllb_ct2, load_tokenizer)
+            ct2_translate = make_ct2_translate(weights, tokenizer, repetition_penalty=1.1)
+
+            def _translate(texts, num_beams, max_new_tokens, input_ids=None, src_langs=None, tgt_langs=None):
+                if input_ids is None:
+                    input_ids = _nllb_tagged_ids(tokenizer, texts, src_langs)
+                return ct2_translate(texts, num_beams, max_new_tokens, input_ids=input_ids, target_prefixes=tgt_langs)
+
+            return _translate, weights
+        load_weights = self._get_nllb_onnx if self._backend == "onnx" else self._get_nllb
+        weights, tokenizer = load_parallel(load_weights, load_tokenizer)
+        model, device = (weights, torch.device(self.device)) if self._backend == "onnx" else weights
+        translator = _make_nllb_group_translate(
+            model, tokenizer, device, no_repeat_ngram_size=3, repetition_penalty=1.1,
+        )
+        return translator, weights
+
+    def _build_nllb_pair_translator(self, src_code: str, tgt_code: str) -> tuple[Callable, Any]:
+        """The pair translator and the shared weights it holds."""
+        if self._backend == "ctranslate2":
+            weights, tokenizer = load_parallel(self._get_nllb_ct2, lambda: self._get_nllb_tokenizer(src_code))
+            return make_ct2_translate(weights, tokenizer, target_prefix=tgt_code, repetition_penalty=1.1), weights
+        load_weights = self._get_nllb_onnx if self._backend == "onnx" else self._get_nllb
+        weights, tokenizer = load_parallel(load_weights, lambda: self._get_nllb_tokenizer(src_code))
         forced_bos = tokenizer.convert_tokens_to_ids(tgt_code)
-
-        def _translate(texts: Any, num_beams: int, max_new_tokens: int):
-            if isinstance(texts, str):
-                texts = [texts]
-            inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                outputs = model.generate(
-                    **inputs,
-                    forced_bos_token_id=forced_bos,
-                    num_beams=num_beams,
-                    max_new_tokens=max_new_tokens,
-                    # NLLB tends to repeat ("こんにちは こんにちは"); block repeated
-                    # trigrams and lightly penalize repetition.
-                    no_repeat_ngram_size=3,
-                    repetition_penalty=1.1,
-                )
-            decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
-            return [{"translation_text": t} for t in decoded]
-
-        return _translate
+        if self._backend == "onnx":
+            model, device, continuous = weights, torch.device(self.device), None
+        else:
+            model, device = weights
+            continuous = _continuous_or_none(
+                lambda: HFGreedyStepper(
+                    model, tokenizer, device, forced_bos_token_id=forced_bos, repetition_penalty=1.1,
+                ),
+                partial(self.executor.slot, f"nllb:{src_code}:{tgt_code}"),
+            )
+        translator = _make_generate_translate(
+            model, tokenizer, device, continuous,
+            forced_bos_token_id=forced_bos,
+            # NLLB tends to repeat ("こんにちは こんにちは"); block repeated
+            # trigrams and lightly penalize repetition.
+            no_repeat_ngram_size=3,
+            repetition_penalty=1.1,
+        )
+        return translator, weights
@@ -0,0 +1,141 @@
+"""Local model store: fast, offline cold starts from the HF cache volume.
+
+``from_pretrained(name, cache_dir=...)`` asks the hub which revision ``main``
+points to (an HTTP round trip per file, retried on a flaky network) before it
+reads anything from disk, and then loads the weights, and only afterwards the
+tokenizer. On an autoscaled pod with a warm ``/models`` volume none of that
+network time is needed. This module:
+
+  * resolves ``<cache>/models--org--name/refs/<revision>`` to its snapshot
+    directory directly (also under ``<cache>/hub/``, the HF_HOME layout), so
+    ``from_pretrained`` gets a local path and never contacts the hub; models
+    not in the cache fall back to the normal download path,
+  * only treats a snapshot as cached when its config, weights (every shard
+    of a sharded checkpoint) and tokenizer files are all present; a partial
+    download goes through the hub path, which completes it,
+  * loads the weights with ``low_cpu_mem_usage`` (``accelerate``: no
+    throwaway random init before the checkpoint is read),
+  * runs the tokenizer and weight loads concurrently (``load_parallel``).
+
+Controlled by ``settings.local_model_store`` and ``settings.model_revision``.
+"""
+import json
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import structlog
+
+from app.settings import settings
+
+log = structlog.get_logger()
+
+
+def _repo_dirs(model_name: str) -> list[str]:
+    repo = "models--" + model_name.replace("/", "--")
+    root = settings.hf_model_cache
+    return [os.path.join(root, repo), os.path.join(root, "hub", repo)]
+
+
+_WEIGHT_INDEXES = ("model.safetensors.index.json", "pytorch_model.bin.index.json")
+_WEIGHT_FILES = ("model.safetensors", "pytorch_model.bin")
+_VOCAB_SUFFIXES = (".spm", ".model", "vocab.json", "vocab.txt")
+
+
+def _has_weights(snapshot: str) -> bool:
+    """A single-file checkpoint, or a sharded one with every shard present."""
+    if any(os.path.isfile(os.path.join(snapshot, f)) for f in _WEIGHT_FILES):
+        return True
+    for index in _WEIGHT_INDEXES:
+        try:
+            with open(os.path.join(snapshot, index), encoding="utf-8") as f:
+                shards = set(json.load(f)["weight_map"].values())
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            continue
+        if shards and all(os.path.isfile(os.path.join(snapshot, s)) for s in shards):
+            return True
+    return False
+
+
+def _has_tokenizer(snapshot: str) -> bool:
+    """A fast tokenizer file, or a tokenizer config with its vocabulary
+    (sentencepiece models, vocab.json)."""
+    if os.path.isfile(os.path.join(snapshot, "tokenizer.json")):
+        return True
+    if not os.path.isfile(os.path.join(snapshot, "tokenizer_config.json")):
+        return False
+    # os.path.isfile follows the snapshot's symlinks: a missing blob is absent.
+    return any(
+        f.endswith(_VOCAB_SUFFIXES) and os.path.isfile(os.path.join(snapshot, f)) for f in os.listdir(snapshot)
+    )
+
+
+def _is_complete(snapshot: str) -> bool:
+    return (
+        os.path.isfile(os.path.join(snapshot, "config.json"))
+        and _has_weights(snapshot)
+        and _has_tokenizer(snapshot)
+    )
+
+
+def resolve_snapshot(model_name: str, revision: str | None = None) -> str | None:
+    """Local snapshot directory for ``model_name`` at ``revision`` (a branch
+    or tag with a ``refs/`` entry, or a commit hash), or None if it is not
+    fully in the cache."""
+    revision = revision or settings.model_revision
+    for repo_dir in _repo_dirs(model_name):
+        ref = os.path.join(repo_dir, "refs", revision)
+        try:
+            with open(ref, encoding="utf-8") as f:
+                commit = f.read().strip()
+        except OSError:
+            commit = revision  # maybe pinned to a commit hash
+        snapshot = os.path.join(repo_dir, "snapshots", commit)
+        if os.path.isdir(snapshot):
+            if _is_complete(snapshot):
+                return snapshot
+            log.info("incomplete_local_snapshot", model=model_name, snapshot=snapshot)
+    return None
+
+
+def local_snapshot(model_name: str) -> str:
+    """Snapshot directory of ``model_name`` in our cache, downloading it
+    first when it is missing or incomplete. For tools that take a path and
+    no ``cache_dir`` (e.g. the CTranslate2 converter)."""
+    snapshot = resolve_snapshot(model_name)
+    if snapshot is not None:
+        return snapshot
+    from huggingface_hub import snapshot_download
+
+    return snapshot_download(model_name, cache_dir=settings.hf_model_cache, revision=settings.model_revision)
+
+
+def pretrained_source(model_name: str) -> tuple[str, dict]:
+    """``(name_or_path, kwargs)`` for ``from_pretrained``: the local snapshot
+    with hub access disabled when it is cached, else the hub name with our
+    cache_dir (see ModelManager for why cache_dir is always explicit)."""
+    if settings.local_model_store:
+        snapshot = resolve_snapshot(model_name)
+        if snapshot is not None:
+            return snapshot, {"local_files_only": True}
+        log.info("model_not_in_local_store", model=model_name)
+    return model_name, {"cache_dir": settings.hf_model_cache, "revision": settings.model_revision}
+
+
+def weight_load_kwargs() -> dict[str, Any]:
+    """Extra ``from_pretrained`` kwargs for the model weights (not the
+    tokenizer). transformers already prefers safetensors when a checkpoint
+    has them; ``low_cpu_mem_usage`` needs ``accelerate`` (a dependency)."""
+    return {"low_cpu_mem_usage": True}
+
+
+def load_parallel(*loaders: Callable[[], Any]) -> list[Any]:
+    """Run independent loaders (tokenizer, weights) concurrently; results in
+    argument order. Both are mostly file I/O and native code that release
+    the GIL. The first failure is re-raised."""
+    if len(loaders) < 2:
+        return [load() for load in loaders]
+    with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="model-load") as pool:
+        futures = [pool.submit(load) for load in loaders]
+        return [f.result() for f in futures]
@@ -0,0 +1,87 @@
+"""ONNX Runtime inference backend (``settings.inference_backend = "onnx"``).
+
+Marian and NLLB are exported once (encoder, decoder and decoder-with-past
+graphs, via optimum) to ``<hf_model_cache>/onnx/`` and then run through ONNX
+Runtime's ``ORTModelForSeq2SeqLM``:
+
+  * ``use_cache=True``: the decoder-with-past graph reuses past key/values, so
+    each step only feeds the newest token,
+  * ``use_io_binding=True`` on CUDA only: inputs/outputs (incl. the KV cache)
+    stay on the device instead of round-tripping through host memory every
+    step. On CPU the tensors already live in host memory, so optimum leaves IO
+    binding off and the flag is not passed.
+
+The ORT model exposes the HF ``generate()`` API, so translators are the same
+closure the torch backend uses (see ``_make_generate_translate``) and
+``InferenceEngine`` is unchanged. Export ahead of time with
+``python -m scripts.prefetch_models --onnx``. ``optimum[onnxruntime]`` is an
+optional dependency (``pip install -e ".[onnx]"``), imported only when this
+backend is selected.
+"""
+import os
+import threading
+from typing import Any
+
+import structlog
+
+from app.inference.model_store import local_snapshot
+from app.settings import settings
+
+log = structlog.get_logger()
+
+_export_lock = threading.Lock()  # one export at a time (CPU/RAM heavy)
+
+
+def _import_ort_model():
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:  # pragma: no cover - depends on the install
+        raise RuntimeError(
+            'inference_backend="onnx" needs optimum with onnxruntime: pip install -e ".[onnx]"'
+        ) from e
+    return ORTModelForSeq2SeqLM
+
+
+def onnx_model_dir(model_name: str) -> str:
+    """Where the exported graphs live, e.g. /models/onnx/Helsinki-NLP--opus-mt-en-zh."""
+    return os.path.join(settings.hf_model_cache, "onnx", model_name.replace("/", "--"))
+
+
+def _exported(out_dir: str) -> bool:
+    return os.path.isdir(out_dir) and any(f.endswith(".onnx") for f in os.listdir(out_dir))
+
+
+def export_to_onnx(model_name: str, force: bool = False) -> str:
+    """Export an HF checkpoint to ONNX (no-op if already exported). Returns the
+    output directory."""
+    ort_model = _import_ort_model()
+    out_dir = onnx_model_dir(model_name)
+    with _export_lock:
+        if not force and _exported(out_dir):
+            return out_dir
+        # Export from the snapshot in our cache (as convert_to_ct2 does), so
+        # the pinned revision is used and nothing is fetched twice.
+        source = local_snapshot(model_name)
+        log.info("onnx_exporting", model=model_name, source=source, out_dir=out_dir)
+        model = ort_model.from_pretrained(source, export=True, use_cache=True)
+        model.save_pretrained(out_dir)
+    return out_dir
+
+
+def load_ort_model(model_name: str, device: str, intra_threads: int) -> Any:
+    """Load (exporting first if needed) an ``ORTModelForSeq2SeqLM`` with KV
+    reuse (plus IO binding on CUDA), sized to ``intra_threads`` per session."""
+    import onnxruntime
+
+    ort_model = _import_ort_model()
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_threads
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    kwargs = {"use_io_binding": True} if device == "cuda" else {}
+    return ort_model.from_pretrained(
+        export_to_onnx(model_name),
+        use_cache=True,
+        provider="CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider",
+        session_options=options,
+        **kwargs,
+    )
@@ -0,0 +1,475 @@
+"""Multiprocess CPU inference: N model-hosting worker processes.
+
+In one process, tokenization, Python-side generation overhead and the batcher
+all serialise on the GIL, and every concurrent ``generate`` asks torch for all
+cores. ``ProcessPoolModelManager`` instead forks ``workers`` processes, each with
+``cores // workers`` torch threads, and exposes the usual ``get_pipeline``
+interface so the engine, batcher and orchestrator are unchanged:
+
+  * models named in ``preload`` are loaded in the parent *before* forking, so
+    their weights are shared copy-on-write by every worker (see
+    ``app.inference.shared_weights``),
+  * each call goes to the worker with the fewest calls in flight over that
+    worker's pipe; one dispatcher thread waits on every pipe and worker
+    sentinel and hands results back to the waiting callers,
+  * a worker that dies (OOM kill, segfault) fails its in-flight calls with
+    ``RuntimeError`` and is replaced. Workers are forked by a *template*
+    process, itself forked when the pool starts: forking the multithreaded
+    parent later (from the dispatcher thread) could hand the child a lock
+    that some request thread held at that moment. The template never runs
+    threads; it gets the worker's pipe end over ``SCM_RIGHTS`` and returns
+    a pidfd the parent watches,
+  * a call with a deadline stops waiting at the deadline
+    (``DeadlineExceeded``); a worker skips calls already past theirs,
+  * ``encode`` runs in the parent, with tokenizers loaded there (see
+    ``ModelManager.get_encoder``): tokenizing is cheap and does not need a
+    round trip through a worker that may be busy generating.
+
+Worker metrics (model loads, evictions, executor waits) live in the worker
+processes. They are exported through ``prometheus_client``'s multiprocess
+mode: start the API with ``PROMETHEUS_MULTIPROC_DIR`` set to an empty
+directory and ``/metrics`` aggregates every process (see
+``app.metrics.render_metrics``).
+
+Models not preloaded are loaded lazily, privately, by each worker that needs
+them. Linux only (``fork`` and pidfds, kernel 5.3+). Calls travel over
+``multiprocessing`` pipes rather than raw shared memory; payloads are sentence
+batches and token ids, small next to a generate() call.
+"""
+import itertools
+import multiprocessing as mp
+import multiprocessing.connection as mp_connection
+import os
+import signal
+import threading
+import time
+from collections.abc import Callable, Iterable
+from multiprocessing import reduction
+from typing import Any
+
+import structlog
+import torch
+from prometheus_client import multiprocess
+
+from app.inference.batcher import DeadlineExceeded
+from app.inference.model_manager import ModelManager
+from app.inference.shared_weights import preload_before_fork
+from app.settings import settings
+
+log = structlog.get_logger()
+
+_POLL_S = 0.5  # dispatcher wake-up interval (to notice stop())
+
+
+def _worker_main(mm: Any, conn: Any, torch_threads: int) -> None:
+    """Worker process loop. ``mm`` is the parent's manager, inherited by fork."""
+    torch.set_num_threads(torch_threads)
+    executor = getattr(mm, "executor", None)
+    if executor is not None:
+        executor.configure(torch_threads)  # budget this worker's share, not the machine
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:  # parent went away
+            return
+        if msg is None:
+            return
+        call_id, op, model_name, args = msg
+        try:
+            pipe = mm.get_pipeline(model_name)
+            if op == "translate":
+                texts, num_beams, max_new_tokens, input_ids, deadline = args
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded("deadline exceeded")  # the caller stopped waiting
+                kwargs: dict[str, Any] = {"input_ids": input_ids} if input_ids is not None else {}
+                if deadline is not None and getattr(pipe, "takes_deadline", False):
+                    kwargs["deadline"] = deadline
+                value = pipe(texts, num_beams=num_beams, max_new_tokens=max_new_tokens, **kwargs)
+            else:  # "probe": load the model, report its capabilities
+                value = {"encode": hasattr(pipe, "encode")}
+            reply = (call_id, True, value)
+        except BaseException as e:  # noqa: BLE001 - reported to the caller
+            reply = (call_id, False, _picklable(e))
+        conn.send(reply)
+
+
+def _template_main(mm: Any, conn: Any, torch_threads: int) -> None:
+    """Template process loop: fork a worker per request. Single-threaded, so
+    the fork is safe; the workers still share ``mm``'s preloaded weights
+    copy-on-write. Replies with the worker's pid and a pidfd for it."""
+    children: set[int] = set()
+    while True:
+        if mp_connection.wait([conn], timeout=_POLL_S):
+            try:
+                msg = conn.recv()
+            except EOFError:  # parent went away
+                return
+            if msg is None:
+                return
+            fd = reduction.recv_handle(conn)
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    conn.close()
+                    _worker_main(mm, mp_connection.Connection(fd), torch_threads)
+                    code = 0
+                finally:
+                    os._exit(code)
+            os.close(fd)
+            pidfd = os.pidfd_open(pid)  # before any waitpid: the pid cannot be reused yet
+            conn.send(pid)
+            reduction.send_handle(conn, pidfd, os.getppid())
+            os.close(pidfd)
+            children.add(pid)
+        for pid in list(children):  # reap exited workers
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                children.discard(pid)
+
+
+class _WorkerProcess:
+    """A worker forked by the template. It is not our child: it is watched
+    through its pidfd, and its exit code is not available."""
+
+    __slots__ = ("pid", "sentinel")
+    exitcode = None
+
+    def __init__(self, pid: int, pidfd: int):
+        self.pid = pid
+        self.sentinel = pidfd  # readable once the process has exited
+
+    def join(self, timeout: float | None = None) -> None:
+        mp_connection.wait([self.sentinel], timeout)
+
+    def is_alive(self) -> bool:
+        return not mp_connection.wait([self.sentinel], 0)
+
+    def terminate(self) -> None:
+        try:
+            signal.pidfd_send_signal(self.sentinel, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def close(self) -> None:
+        os.close(self.sentinel)
+
+
+def _picklable(error: BaseException) -> BaseException:
+    import pickle
+
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class _Call:
+    __slots__ = ("event", "ok", "value", "worker")
+
+    def __init__(self, worker: "_Worker"):
+        self.event = threading.Event()
+        self.ok = False
+        self.value: Any = None
+        self.worker = worker
+
+
+class _Worker:
+    __slots__ = ("proc", "conn", "send_lock", "in_flight")
+
+    def __init__(self, proc: _WorkerProcess, conn: Any):
+        self.proc = proc
+        self.conn = conn  # duplex pipe to the worker: calls out, results back
+        self.send_lock = threading.Lock()
+        self.in_flight = 0
+
+
+class _RemoteTranslator:
+    """Translator proxy with the ModelManager closure's call signature.
+    ``deadline`` (monotonic; the clock is shared by forked processes) bounds
+    the wait for the worker's result."""
+
+    takes_deadline = True
+
+    def __init__(self, pool: "ProcessPoolModelManager", model_name: str):
+        self._pool = pool
+        self.model_name = model_name
+
+    def __call__(
+        self,
+        texts: Any,
+        num_beams: int,
+        max_new_tokens: int,
+        input_ids: list | None = None,
+        deadline: float | None = None,
+    ):
+        if isinstance(texts, str):
+            texts = [texts]
+        args = (list(texts), num_beams, max_new_tokens, input_ids, deadline)
+        return self._pool._call("translate", self.model_name, args, deadline)
+
+
+class _RemoteEncodingTranslator(_RemoteTranslator):
+    """Proxy whose ``encode`` tokenizes in this process."""
+
+    def __init__(self, pool: "ProcessPoolModelManager", model_name: str, encode: Callable):
+        super().__init__(pool, model_name)
+        self.encode = encode
+
+
+class ProcessPoolModelManager:
+    """ModelManager stand-in that runs inference in forked worker processes."""
+
+    def __init__(
+        self,
+        workers: int,
+        torch_threads: int | None = None,
+        preload: Iterable[str] = (),
+        manager_factory: Callable[[], Any] = ModelManager,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self._ctx = mp.get_context("fork")
+        self._torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+        self._local = manager_factory()
+        preload_before_fork(self._local, preload)  # shared copy-on-write by the workers
+
+        self._calls: dict[int, _Call] = {}
+        self._lock = threading.Lock()  # guards _calls, _workers and in_flight counts
+        self._workers_changed = threading.Condition(self._lock)
+        self._respawn_failed = False
+        self._ids = itertools.count()
+        self._proxies: dict[str, _RemoteTranslator] = {}
+        self._proxies_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._template_lock = threading.Lock()  # one spawn request at a time
+        self._template_conn, child_conn = self._ctx.Pipe()
+        self._template = self._ctx.Process(
+            target=_template_main, args=(self._local, child_conn, self._torch_threads), daemon=True,
+        )
+        self._template.start()
+        child_conn.close()
+        self._workers = [self._spawn() for _ in range(workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        log.info("process_pool_started", workers=workers, torch_threads=self._torch_threads,
+                 preloaded=self._local.loaded_models())
+        if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            log.warning("process_pool_metrics_not_aggregated",
+                        hint="set PROMETHEUS_MULTIPROC_DIR to export the workers' metrics")
+
+    def _spawn(self) -> _Worker:
+        """A new worker, forked by the template process."""
+        parent_conn, child_conn = self._ctx.Pipe()
+        try:
+            with self._template_lock:
+                self._template_conn.send("spawn")
+                reduction.send_handle(self._template_conn, child_conn.fileno(), self._template.pid)
+                pid = self._template_conn.recv()
+                pidfd = reduction.recv_handle(self._template_conn)
+        except (EOFError, OSError) as e:
+            parent_conn.close()
+            raise RuntimeError(f"inference worker template process is gone: {e}") from e
+        finally:
+            child_conn.close()
+        return _Worker(_WorkerProcess(pid, pidfd), parent_conn)
+
+    @property
+    def device(self) -> str:
+        return self._local.device
+
+    def device_info(self) -> dict:
+        return {**self._local.device_info(), "executor": "process", "workers": len(self._workers)}
+
+    def loaded_models(self) -> list[str]:
+        with self._proxies_lock:
+            seen = list(self._proxies)
+        return list(dict.fromkeys([*self._local.loaded_models(), *seen]))
+
+    def warmup(self, model_name: str) -> None:
+        self.get_pipeline(model_name)
+
+    def get_pipeline(self, model_name: str) -> Callable:
+        with self._proxies_lock:
+            proxy = self._proxies.get(model_name)
+        if proxy is not None:
+            return proxy
+        caps = self._call("probe", model_name, None)  # loads it in one worker; surfaces load errors
+        encode = self._local.get_encoder(model_name) if caps.get("encode") else None
+        if encode is not None:
+            proxy: _RemoteTranslator = _RemoteEncodingTranslator(self, model_name, encode)
+        else:
+            proxy = _RemoteTranslator(self, model_name)
+        with self._proxies_lock:
+            return self._proxies.setdefault(model_name, proxy)
+
+    def _call(self, op: str, model_name: str, args: Any, deadline: float | None = None) -> Any:
+        """Send one call to the least-busy worker and wait for its result, at
+        most until ``deadline`` (monotonic). Calls are routed to a specific
+        worker (rather than a shared queue) so that if it dies we know
+        exactly which calls were lost."""
+        with self._lock:
+            while not self._workers:  # a dead worker is being replaced
+                if self._stopping.is_set() or self._respawn_failed:
+                    break
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise DeadlineExceeded("deadline exceeded")
+                self._workers_changed.wait(timeout)
+            if self._stopping.is_set():
+                raise RuntimeError("inference process pool is stopped")
+            if not self._workers:
+                raise RuntimeError("no inference workers: replacing a dead worker failed")
+            worker = min(self._workers, key=lambda w: w.in_flight)
+            worker.in_flight += 1
+            call_id = next(self._ids)
+            call = self._calls[call_id] = _Call(worker)
+        try:
+            with worker.send_lock:
+                worker.conn.send((call_id, op, model_name, args))
+        except OSError:
+            pass  # worker is dead; the dispatcher fails the call when it reaps it
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not call.event.wait(timeout):
+            # Only this waiter gives up. The worker is still busy with the
+            # call, so it keeps counting towards in_flight until _complete
+            # (or _reap) retires it.
+            raise DeadlineExceeded("deadline exceeded")
+        if not call.ok:
+            raise call.value
+        return call.value
+
+    def _dispatch(self) -> None:
+        while not self._stopping.is_set():
+            with self._lock:
+                workers = list(self._workers)
+            by_handle: dict[Any, _Worker] = {}
+            for w in workers:
+                by_handle[w.conn] = w
+                by_handle[w.proc.sentinel] = w
+            for ready in mp_connection.wait(list(by_handle), timeout=_POLL_S):
+                worker = by_handle[ready]
+                if ready is worker.conn:
+                    try:
+                        self._complete(*worker.conn.recv())
+                        continue
+                    except (EOFError, OSError):
+                        pass  # died mid-reply: fall through to the reaper
+                self._reap(worker)
+
+    def _complete(self, call_id: int, ok: bool, value: Any) -> None:
+        with self._lock:
+            call = self._calls.pop(call_id, None)
+            if call is None:
+                return
+            call.worker.in_flight -= 1
+        call.ok, call.value = ok, value
+        call.event.set()
+
+    def _reap(self, worker: _Worker) -> None:
+        """Replace a dead worker and fail the calls routed to it. Only the
+        bookkeeping runs under _lock; the join and the respawn do not."""
+        with self._lock:
+            if worker not in self._workers or self._stopping.is_set():
+                return
+            self._workers.remove(worker)  # no new calls are routed to it
+            lost = [cid for cid, c in self._calls.items() if c.worker is worker]
+            calls = [self._calls.pop(cid) for cid in lost]
+        proc = worker.proc
+        proc.join(timeout=1.0)
+        log.warning("inference_worker_died", pid=proc.pid, lost_calls=len(calls))
+        worker.conn.close()
+        proc.close()
+        _mark_dead(proc.pid)
+        for call in calls:
+            call.value = RuntimeError(f"inference worker {proc.pid} died")
+            call.event.set()
+        try:
+            replacement = self._spawn()
+        except RuntimeError as e:
+            log.error("inference_worker_respawn_failed", error=str(e))
+            with self._lock:
+                self._respawn_failed = True
+                self._workers_changed.notify_all()
+            return
+        with self._lock:
+            if not self._stopping.is_set():
+                self._workers.append(replacement)
+                self._workers_changed.notify_all()
+                return
+        self._shutdown_workers([replacement])  # stop() ran meanwhile
+
+    def stop(self) -> None:
+        """Shut the workers down and fail anything still waiting."""
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+            self._workers_changed.notify_all()
+            workers = list(self._workers)
+        self._dispatcher.join(timeout=2 * _POLL_S)
+        self._shutdown_workers(workers)
+        with self._template_lock:
+            try:
+                self._template_conn.send(None)
+            except OSError:
+                pass
+            self._template.join(timeout=5.0)
+            if self._template.is_alive():
+                self._template.terminate()
+            self._template_conn.close()
+        with self._lock:
+            calls = list(self._calls.values())
+            self._calls.clear()
+        for call in calls:
+            call.value = RuntimeError("inference process pool is stopped")
+            call.event.set()
+
+    @staticmethod
+    def _shutdown_workers(workers: list[_Worker]) -> None:
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.proc.join(timeout=5.0)
+            if worker.proc.is_alive():
+                worker.proc.terminate()
+            worker.conn.close()
+            worker.proc.close()
+            _mark_dead(worker.proc.pid)
+
+
+def _mark_dead(pid: int | None) -> None:
+    """Drop a dead worker's live gauges from the multiprocess metrics (its
+    counters and histograms are kept, as prometheus_client intends)."""
+    if pid is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def create_model_manager(preload: Iterable[str] = ()) -> Any:
+    """The model manager selected by the settings: a ``RemoteModelManager``
+    when ``model_host_socket`` is set (the sidecar loads its own models),
+    else by ``inference_executor``: in-process ``ModelManager`` ("thread") or
+    a ``ProcessPoolModelManager`` ("process") with ``preload`` loaded before
+    the workers fork."""
+    if settings.model_host_socket:
+        from app.inference.model_host import RemoteModelManager
+
+        return RemoteModelManager(settings.model_host_socket)
+    executor = (settings.inference_executor or "thread").lower()
+    if executor == "thread":
+        return ModelManager()
+    if executor != "process":
+        raise ValueError(f"unknown inference_executor: {settings.inference_executor!r}")
+    if (settings.generation_mode or "standard").lower() == "continuous":
+        # The continuous scheduler's thread would not survive the fork.
+        raise ValueError("generation_mode=continuous requires inference_executor=thread")
+    workers = settings.inference_workers or max(1, (os.cpu_count() or 1) // 4)
+    return ProcessPoolModelManager(workers=workers, preload=preload)
@@ -0,0 +1,89 @@
+"""One copy of the model weights per node, shared by forked workers.
+
+Every API worker and Celery prefork child builds its own ModelManager, so N
+processes normally hold N copies of every model. When the models are loaded
+in the parent *before* it forks, the children inherit the weights
+copy-on-write. Inference never writes to weight tensors, so those pages stay
+shared for the life of the workers:
+
+  * Celery (prefork pool): ``workers/tasks.py`` preloads on ``worker_init``,
+    which runs in the main process before the pool forks,
+  * API behind ``gunicorn --preload -k uvicorn.workers.UvicornWorker``:
+    ``app/main.py`` preloads at import, which ``--preload`` does once in the
+    master. Plain ``uvicorn --workers`` spawns fresh interpreters and cannot
+    share,
+  * ``inference_executor="process"``: the pool preloads the same way.
+
+Two details keep the pages shared. First, loading runs with one torch thread,
+so the parent never starts an OpenMP pool, which would not survive the fork.
+Second, the heap is then ``gc.freeze()``-d, so the children's garbage
+collector does not write to every inherited object, which would copy its page.
+
+The preloaded models are those of ``settings.warmup_pairs``; anything else
+still loads lazily, privately, per process. Enable with
+``settings.shared_weights``.
+"""
+import gc
+from collections.abc import Iterable
+from typing import Any
+
+import structlog
+import torch
+
+from app.core.routing import resolve_model_path
+from app.settings import settings
+
+log = structlog.get_logger()
+
+
+def warmup_model_names() -> list[str]:
+    """Model names on the paths of settings.warmup_pairs (e.g. "en:zh,zh:en"),
+    deduplicated; unknown pairs are logged and skipped."""
+    raw = (settings.warmup_pairs or "").strip()
+    if not raw:
+        return []
+    names: list[str] = []
+    for pair in raw.split(","):
+        pair = pair.strip()
+        if not pair or ":" not in pair:
+            continue
+        src, tgt = (p.strip() for p in pair.split(":", 1))
+        try:
+            models = resolve_model_path(src, tgt)
+        except ValueError:
+            log.warning("warmup_unknown_pair", pair=pair)
+            continue
+        names.extend(models)
+    return list(dict.fromkeys(names))
+
+
+def freeze_for_fork() -> None:
+    """Move every live object to the GC's permanent generation so forked
+    children never scan (and so never copy) the inherited heap."""
+    gc.collect()
+    gc.freeze()
+
+
+def preload_before_fork(mm: Any, model_names: Iterable[str]) -> list[str]:
+    """Load ``model_names`` into ``mm`` in the parent process and freeze the
+    heap, ready to fork. Failures are logged and skipped. Returns the names
+    that loaded."""
+    if (settings.generation_mode or "standard").lower() == "continuous":
+        # The continuous scheduler's thread would not survive the fork.
+        log.warning("shared_weights_skipped", reason="generation_mode=continuous")
+        return []
+    loaded: list[str] = []
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)  # no OpenMP pool in the parent (not fork-safe)
+    try:
+        for name in model_names:
+            try:
+                mm.get_pipeline(name)
+                loaded.append(name)
+            except Exception as e:  # best effort, like app warmup
+                log.warning("preload_failed", model=name, error=str(e))
+    finally:
+        torch.set_num_threads(threads)
+    freeze_for_fork()
+    log.info("shared_weights_preloaded", models=loaded)
+    return loaded
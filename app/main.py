@@ -6,7 +6,7 @@ import structlog
 import structlog.contextvars
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.api.v1_account import router as account_router
 from app.api.v1_auth import router as auth_router
@@ -17,47 +17,45 @@ from app.api.v1_models import router as models_router
 from app.api.v1_translate import router as translate_router
 from app.core.bootstrap import ensure_seed_data
 from app.core.orchestrator import Orchestrator
-from app.core.routing import resolve_model_path
 from app.inference.engine import InferenceEngine
 from app.inference.model_manager import ModelManager
+from app.inference.process_pool import create_model_manager
+from app.inference.shared_weights import preload_before_fork, warmup_model_names
 from app.logging_config import configure_logging
-from app.metrics import REQ_COUNT
+from app.metrics import REQ_COUNT, render_metrics
 from app.settings import settings
 from infra.cache import RedisCache
 from infra.db import SessionLocal, init_db
+from infra.local_cache import LocalCache
 from infra.redis_client import get_redis
 
 configure_logging()
 log = structlog.get_logger()
 
 
+# Under `gunicorn --preload` this module is imported once in the master before
+# it forks the workers: with SHARED_WEIGHTS the warmup models load here, so all
+# workers share one copy of their weights (see app.inference.shared_weights).
+_preloaded_mm: ModelManager | None = None
+if (
+    settings.shared_weights
+    and not settings.model_host_socket
+    and (settings.inference_executor or "thread").lower() == "thread"
+):
+    _preloaded_mm = ModelManager()
+    preload_before_fork(_preloaded_mm, warmup_model_names())
+
+
 def _warmup_models(mm: ModelManager) -> None:
-    """Preload + warm the models for settings.warmup_pairs (e.g. "en:zh,zh:en")
-    so the first real translation doesn't stall. Non-fatal: a bad pair or a
-    failed load is logged and skipped, never blocks startup."""
-    raw = (settings.warmup_pairs or "").strip()
-    if not raw:
-        return
-    seen: set[str] = set()
-    for pair in raw.split(","):
-        pair = pair.strip()
-        if not pair or ":" not in pair:
-            continue
-        src, tgt = (p.strip() for p in pair.split(":", 1))
+    """Preload + warm the models for settings.warmup_pairs so the first real
+    translation doesn't stall. Non-fatal: a bad pair or a failed load is logged
+    and skipped, never blocks startup."""
+    for name in warmup_model_names():
         try:
-            models = resolve_model_path(src, tgt)
-        except ValueError:
-            log.warning("warmup_unknown_pair", pair=pair)
-            continue
-        for name in models:
-            if name in seen:
-                continue
-            seen.add(name)
-            try:
-                mm.warmup(name)
-                log.info("warmup_done", model=name)
-            except Exception as e:  # pragma: no cover - best effort
-                log.warning("warmup_failed", model=name, error=str(e))
+            mm.warmup(name)
+            log.info("warmup_done", model=name)
+        except Exception as e:  # pragma: no cover - best effort
+            log.warning("warmup_failed", model=name, error=str(e))
 
 
 @asynccontextmanager
@@ -72,9 +70,9 @@ async def lifespan(app: FastAPI):
         db.close()
 
     redis_client = get_redis()
-    cache = RedisCache(redis_client)
+    cache = RedisCache(get_redis(binary=True), local=LocalCache.from_settings())
 
-    mm = ModelManager()
+    mm = _preloaded_mm if _preloaded_mm is not None else create_model_manager(preload=warmup_model_names())
     engine = InferenceEngine(mm)
     orchestrator = Orchestrator(engine, cache)
 
@@ -90,6 +88,10 @@ async def lifespan(app: FastAPI):
     yield
 
     # Shutdown (optional cleanup)
+    engine.close()
+    stop = getattr(mm, "stop", None)
+    if stop is not None:
+        stop()  # process executor: shut the inference workers down
     log.info("app_shutdown")
 
 
@@ -148,7 +150,7 @@ async def observability_middleware(request: Request, call_next):
 
 @app.get("/metrics")
 def metrics():
-    data = generate_latest()
+    data = render_metrics()
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
 
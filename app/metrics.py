@@ -1,4 +1,6 @@
-from prometheus_client import Counter, Histogram
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
 
 REQ_COUNT = Counter(
     "http_requests_total",
@@ -15,6 +17,12 @@ TRANSLATE_LATENCY = Histogram(
 CACHE_HITS = Counter("cache_hits_total", "Cache hits total", ["scope"])
 CACHE_MISSES = Counter("cache_misses_total", "Cache misses total", ["scope"])
 CACHE_ERRORS = Counter("cache_errors_total", "Cache backend errors (degraded)", ["op"])
+CACHE_LEGACY_MIGRATIONS = Counter(
+    "cache_legacy_migrations_total", "Pre-compact cache entries read and rewritten in the compact format"
+)
+SINGLEFLIGHT_SHARED = Counter(
+    "singleflight_shared_total", "Cache misses served by another in-flight computation of the same key", ["scope"]
+)
 
 RATE_LIMIT_BLOCKS = Counter("rate_limit_blocks_total", "Rate limit blocks total")
 RATE_LIMIT_ERRORS = Counter("rate_limit_errors_total", "Rate limit backend errors")
@@ -23,11 +31,54 @@ JOBS_CREATED = Counter("jobs_created_total", "Jobs created")
 JOBS_SUCCEEDED = Counter("jobs_succeeded_total", "Jobs succeeded")
 JOBS_FAILED = Counter("jobs_failed_total", "Jobs failed")
 
+INFERENCE_DROPPED = Counter(
+    "inference_items_dropped_total",
+    "Queued inference items dropped before running (deadline passed or caller gone)",
+    ["reason"],
+)
+
+INFERENCE_IN_FLIGHT = Gauge(
+    "inference_executions_in_flight",
+    "Translator calls currently executing (holding an executor slot)",
+    ["model"],
+)
+
 QUOTA_EXCEEDED = Counter("quota_exceeded_total", "Requests rejected for exceeding quota")
 
+MODEL_RESIDENT_BYTES = Gauge(
+    "model_resident_bytes",
+    "Weight bytes held by each resident model (shared NLLB weights under the base model name)",
+    ["model"],
+)
+
+MODEL_LOADS = Counter("model_loads_total", "Model loads (first use or reload after eviction)", ["model"])
+MODEL_EVICTIONS = Counter("model_evictions_total", "Models evicted from memory", ["model"])
+MODEL_THRASH_RELOADS = Counter(
+    "model_thrash_reloads_total",
+    "Reloads of a model evicted less than MODEL_THRASH_WINDOW_S earlier",
+    ["model"],
+)
+MODEL_THRASHING = Gauge(
+    "model_eviction_thrashing",
+    "1 while thrash reloads in the last MODEL_THRASH_WINDOW_S reach MODEL_THRASH_ALARM_RELOADS",
+)
+
 MODEL_LOAD_SECONDS = Histogram(
     "model_load_seconds",
     "Time to load a HF model on first use",
     ["model"],
     buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
 )
+
+
+def render_metrics() -> bytes:
+    """The /metrics payload. With ``PROMETHEUS_MULTIPROC_DIR`` set (before
+    start-up, e.g. for inference_executor="process") it aggregates the
+    metrics of every process writing to that directory, not just this one.
+    Callback gauges (``set_function``) are per process and not included
+    in that mode."""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
@@ -28,9 +28,47 @@ class Settings(BaseSettings):
 
     # Inference
     device: str = "auto"  # "auto" | "cpu" | "cuda" (auto: GPU if available, else CPU)
-    torch_dtype: str = "auto"  # "auto" | "float16" | "float32" (fp16 only used on CUDA)
+    # "auto" | "float16" | "float32" | "int8". fp16 only applies on CUDA; int8 =
+    # dynamic quantization of Linear layers on CPU (compare with
+    # scripts/compare_quantization.py before enabling).
+    torch_dtype: str = "auto"
+    # "torch" (HF generate) | "ctranslate2" (converted int8 models under
+    # <hf_model_cache>/ct2, needs the ct2 extra; several times faster on CPU)
+    # | "onnx" (ONNX Runtime with KV reuse, + IO binding on CUDA; graphs exported once to
+    # <hf_model_cache>/onnx, needs the onnx extra).
+    inference_backend: str = "torch"
+    ct2_quantization: str = "int8"  # ctranslate2 conversion type: int8 | int8_float16 | float16 | float32
     hf_model_cache: str = "/models"
     max_loaded_models: int = 8  # LRU cap on resident HF models
+    # Load cached models straight from their snapshot directory under
+    # HF_MODEL_CACHE (no hub lookups on a warm volume); models not cached are
+    # downloaded as usual. MODEL_REVISION is the branch/tag/commit to load.
+    local_model_store: bool = True
+    # Load the WARMUP_PAIRS models in the parent before it forks (Celery
+    # prefork, gunicorn --preload) so every child shares one copy of the weights.
+    shared_weights: bool = False
+    # Unix socket of the model-host sidecar (python -m app.inference.model_host).
+    # Set it for the API/worker processes to send inference there (one batcher
+    # and one copy of the weights per node); empty = run inference in-process.
+    model_host_socket: str = ""
+    model_host_timeout_s: float = 300.0
+    model_revision: str = "main"
+    # Byte budget for resident model weights (params + buffers; shared NLLB
+    # weights counted once). 0 = count cap only. Eviction picks the highest
+    # idle time / cost weight; MODEL_COST_WEIGHTS ("nllb=4,<model>=2") marks
+    # models that are expensive to reload. Equal weights = plain LRU.
+    model_memory_budget_mb: int = 0
+    model_cost_weights: str = ""
+    # Eviction hysteresis: a model is not evicted for MODEL_MIN_RESIDENT_S after
+    # it was loaded (the count cap is exceeded briefly instead; the byte budget
+    # is always enforced), and never while requests for it are running or
+    # queued. 0 = no minimum residency.
+    model_min_resident_s: float = 15.0
+    # Thrash alarm: a reload within MODEL_THRASH_WINDOW_S of the model's
+    # eviction counts as thrash; MODEL_THRASH_ALARM_RELOADS of them inside the
+    # window raise the model_eviction_thrashing gauge (raise the caps).
+    model_thrash_window_s: float = 120.0
+    model_thrash_alarm_reloads: int = 3
     # Default beam width when a request doesn't specify one. 1 = greedy (fastest,
     # good on CPU); 4-5 = higher quality, worth it on GPU. Override per-deployment
     # via DEFAULT_BEAM_SIZE (the GPU compose overlay bumps this up).
@@ -44,6 +82,42 @@ class Settings(BaseSettings):
     enable_dynamic_batching: bool = False
     batch_max_size: int = 16
     batch_max_wait_ms: int = 20
+    # Padded-token budget per generate() call: batch x longest input x beams.
+    # Bounds memory/compute on mixed-length traffic (one long sentence no longer
+    # drags 15 short ones through a 400-token padded batch). 0 = count cap only.
+    batch_max_tokens: int = 8192
+    # Priority lanes: interactive > stream > bulk (Celery jobs). A lower lane
+    # whose oldest item has waited this long is served first (no starvation).
+    batch_starvation_ms: int = 2000
+    # "standard": each batch runs model.generate() to completion. "continuous":
+    # greedy (beam_size=1) requests are decoded token by token by a per-model
+    # scheduler that retires finished sentences and admits new ones mid-flight
+    # (see app/inference/continuous.py); beam search still uses generate().
+    generation_mode: str = "standard"
+    continuous_max_active: int = 32  # sequences decoded concurrently per model
+    # Cap each generate() call at longest source tokens x a per-model expansion
+    # ratio learned from past outputs (+ slack); the request's max_new_tokens is
+    # still the ceiling. The default ratio applies until enough samples exist.
+    adaptive_max_new_tokens: bool = True
+    max_new_tokens_ratio: float = 3.0
+    max_new_tokens_slack: int = 8
+    # "thread": inference runs in this process (threadpool + batcher threads).
+    # "process": INFERENCE_WORKERS forked model-hosting processes, each with
+    # cores // workers torch threads, so a CPU node isn't bottlenecked on the
+    # GIL. WARMUP_PAIRS models are loaded before the fork and shared
+    # copy-on-write. API process only (Celery prefork is already multiprocess).
+    inference_executor: str = "thread"
+    inference_workers: int = 0  # 0 = cores // 4
+    # Concurrent translator calls: per model, and across all models. Each call
+    # gets INFERENCE_THREADS // INFERENCE_MAX_CONCURRENCY torch intra-op threads
+    # so concurrent generations partition the cores instead of oversubscribing.
+    model_concurrency: int = 2
+    model_concurrency_overrides: str = ""  # e.g. "nllb:eng_Latn:zho_Hans=1,Helsinki-NLP/opus-mt-en-zh=4"
+    inference_max_concurrency: int = 4
+    inference_threads: int = 0  # core budget; 0 = all cores (a pool worker uses its share)
+    # Deadline for a sync /v1/translate call. Queued inference for a request past
+    # its deadline is dropped and the caller gets 504 instead of waiting forever.
+    sync_request_timeout_s: float = 60.0
 
     # Redis
     redis_url: str = "redis://localhost:6379/0"
@@ -65,6 +139,34 @@ class Settings(BaseSettings):
     # Policies
     rate_limit_rpm: int = 60
     cache_ttl_seconds: int = 86400
+    # Popularity-aware TTLs per cache scope, "scope=initial_s:sliding_s":
+    # entries start with the short initial TTL and every hit slides their
+    # expiry out to the sliding TTL (GETEX). sx = sentences, tx = whole texts;
+    # scopes not listed (or an empty policy) use cache_ttl_seconds.
+    cache_ttl_policy: str = "sx=21600:604800,tx=3600:172800"
+    # In-process L1 translation cache in front of Redis (per API/worker
+    # process): LRU with TinyLFU admission, bounded by entries and MB, with a
+    # short TTL. 0 entries = off.
+    l1_cache_max_entries: int = 10000
+    l1_cache_max_mb: int = 64
+    l1_cache_ttl_seconds: int = 300
+    # Cache value codec: "msgpack" (compact binary) or "json". msgpack values
+    # of this many bytes or more are zstd-compressed (0 = never).
+    cache_codec: str = "msgpack"
+    cache_compress_min_bytes: int = 512
+    # On a miss, also read the entry under its pre-compact hex key and
+    # rewrite it in the compact format (turn off once old entries expired).
+    cache_legacy_fallback: bool = True
+    # Singleflight: concurrent misses on the same sentence/text cache key are
+    # computed once per process; the others wait (at most this long without
+    # a request deadline) for that result. With the Redis lease, processes
+    # also wait for each other (the leader holds "lease:<key>" for at most
+    # singleflight_lease_ms; followers poll the cache every _poll_ms).
+    singleflight: bool = True
+    singleflight_wait_s: float = 60.0
+    singleflight_redis_lease: bool = False
+    singleflight_lease_ms: int = 30000
+    singleflight_poll_ms: int = 50
     max_sync_chars: int = 6000       # longer -> force async
     max_sync_texts: int = 64         # batch cap for sync
     max_job_texts: int = 2000        # cap for async jobs
@@ -4,12 +4,38 @@ from typing import Any
 import redis
 import structlog
 
-from app.metrics import CACHE_ERRORS, CACHE_HITS, CACHE_MISSES
+from app.metrics import CACHE_ERRORS, CACHE_HITS, CACHE_LEGACY_MIGRATIONS, CACHE_MISSES
 from app.settings import settings
+from infra.cache_codec import CacheKey, decode_value, encode_value
+from infra.local_cache import LocalCache
 
 log = structlog.get_logger()
 
 
+Key = str | bytes | CacheKey
+
+
+def redis_key(key: Key) -> str | bytes:
+    """The Redis key a ``Key`` is stored under."""
+    return key.key if isinstance(key, CacheKey) else key
+
+
+def _parse_ttl_policy(raw: str) -> dict[str, tuple[int, int]]:
+    """"scope=initial:sliding,..." -> {scope: (initial_s, sliding_s)}; the
+    sliding TTL is never below the initial one."""
+    out: dict[str, tuple[int, int]] = {}
+    for part in (raw or "").split(","):
+        scope, sep, value = part.strip().partition("=")
+        initial, colon, sliding = value.partition(":")
+        if not sep or not scope or not colon:
+            continue
+        try:
+            out[scope.strip()] = (int(initial), max(int(initial), int(sliding)))
+        except ValueError:
+            log.warning("bad_cache_ttl_policy", entry=part)
+    return out
+
+
 class RedisCache:
     """Redis-backed JSON cache that degrades gracefully.
 
@@ -17,28 +43,144 @@ class RedisCache:
     Redis is unreachable, reads report a miss and writes are dropped (both
     counted via ``cache_errors_total``) so translation still succeeds by
     recomputing rather than failing the request.
+
+    With ``local`` (an in-process ``LocalCache``), reads try that L1 first
+    and fill it from Redis hits; writes go to both tiers. Hits and misses
+    are counted per tier (``scope="local"`` / ``scope="redis"``).
+
+    Keys are plain strings or ``CacheKey``s. With a client created with
+    ``decode_responses=False`` values use the compact codec of
+    ``infra.cache_codec``; a decoding client keeps JSON text values.
+
+    TTLs follow popularity for ``CacheKey`` scopes listed in
+    ``settings.cache_ttl_policy``: entries are written with the scope's short
+    initial TTL and every Redis hit reads them with ``GETEX``, which slides
+    the expiry out to the scope's (longer) sliding TTL. One-off strings
+    expire quickly, and anything hit at least once per sliding window stays.
+    Other keys get the flat ``settings.cache_ttl_seconds``.
     """
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, local: LocalCache | None = None):
         self.r = redis_client
+        self.local = local
+        pool_kwargs = getattr(getattr(redis_client, "connection_pool", None), "connection_kwargs", {})
+        self.binary = not pool_kwargs.get("decode_responses", False)
+        self._ttl_policy = _parse_ttl_policy(settings.cache_ttl_policy)
+
+    def _policy(self, key: Key) -> tuple[int, int] | None:
+        return self._ttl_policy.get(key.scope) if isinstance(key, CacheKey) else None
 
-    def get_json(self, key: str) -> Any | None:
+    def _write_ttl(self, key: Key, ttl: int | None) -> int:
+        policy = self._policy(key)
+        return ttl or (policy[0] if policy else settings.cache_ttl_seconds)
+
+    def _encode(self, value: Any) -> bytes | str:
+        return encode_value(value) if self.binary else json.dumps(value, ensure_ascii=False)
+
+    def _local_get(self, key: str | bytes) -> Any | None:
+        if self.local is None:
+            return None
+        value = self.local.get(key)
+        (CACHE_HITS if value is not None else CACHE_MISSES).labels(scope="local").inc()
+        return value
+
+    def _local_put(self, key: str | bytes, value: Any, payload: bytes | str, ttl: int | None = None) -> None:
+        if self.local is not None:
+            self.local.put(key, value, len(payload), ttl)
+
+    def _fetch(self, keys: list[Key]) -> list:
+        """Raw values of ``keys`` in one round trip; keys with a TTL policy
+        are read with GETEX, sliding their expiry on a hit."""
+        policies = [self._policy(k) for k in keys]
+        if not any(policies):
+            rkeys = [redis_key(k) for k in keys]
+            return [self.r.get(rkeys[0])] if len(rkeys) == 1 else self.r.mget(rkeys)
+        pipe = self.r.pipeline(transaction=False)
+        for key, policy in zip(keys, policies, strict=True):
+            if policy:
+                pipe.getex(redis_key(key), ex=policy[1])
+            else:
+                pipe.get(redis_key(key))
+        return pipe.execute()
+
+    def get_json(self, key: Key) -> Any | None:
+        return self._read([key], op="get")[0]
+
+    def mget_json(self, keys: list[Key]) -> list[Any | None]:
+        """``get_json`` for many keys in one round trip (MGET); values in key
+        order, None for misses. On a Redis error every key is a miss."""
+        return self._read(keys, op="mget")
+
+    def _read(self, keys: list[Key], op: str) -> list[Any | None]:
+        out = [self._local_get(redis_key(k)) for k in keys]
+        missing = [i for i, v in enumerate(out) if v is None]
+        if not missing:
+            return out
         try:
-            val = self.r.get(key)
+            vals = self._fetch([keys[i] for i in missing])
         except redis.RedisError as e:
-            CACHE_ERRORS.labels(op="get").inc()
-            log.warning("cache_get_failed", error=str(e))
-            return None
-        if val is None:
-            CACHE_MISSES.labels(scope="redis").inc()
-            return None
-        CACHE_HITS.labels(scope="redis").inc()
-        return json.loads(val)
+            CACHE_ERRORS.labels(op=op).inc()
+            log.warning(f"cache_{op}_failed", error=str(e), keys=len(missing))
+            return out
+        legacy: dict[int, str] = {}
+        for i, val in zip(missing, vals, strict=True):
+            value = decode_value(val) if val is not None else None
+            if value is not None:
+                out[i] = value
+                self._local_put(redis_key(keys[i]), value, val)
+            elif isinstance(keys[i], CacheKey) and settings.cache_legacy_fallback:
+                legacy[i] = keys[i].legacy
+        if legacy:
+            self._read_legacy(keys, legacy, out, op)
+        hits = sum(out[i] is not None for i in missing)
+        if hits:
+            CACHE_HITS.labels(scope="redis").inc(hits)
+        if hits < len(missing):
+            CACHE_MISSES.labels(scope="redis").inc(len(missing) - hits)
+        return out
 
-    def set_json(self, key: str, value: Any, ttl: int | None = None) -> None:
-        payload = json.dumps(value, ensure_ascii=False)
+    def _read_legacy(self, keys: list[Key], legacy: dict[int, str], out: list, op: str) -> None:
+        """Fill ``out`` from pre-compact entries and rewrite them under their
+        compact keys (the old entries are left to expire)."""
         try:
-            self.r.set(key, payload, ex=ttl or settings.cache_ttl_seconds)
+            vals = self._fetch(list(legacy.values()))
+        except redis.RedisError as e:
+            CACHE_ERRORS.labels(op=op).inc()
+            log.warning(f"cache_{op}_failed", error=str(e), keys=len(legacy))
+            return
+        migrated = {}
+        for i, val in zip(legacy, vals, strict=True):
+            value = decode_value(val) if val is not None else None
+            if value is not None:
+                out[i] = value
+                migrated[keys[i]] = value
+        if migrated:
+            CACHE_LEGACY_MIGRATIONS.inc(len(migrated))
+            self.mset_json(migrated)
+
+    def set_json(self, key: Key, value: Any, ttl: int | None = None) -> None:
+        payload = self._encode(value)
+        ex = self._write_ttl(key, ttl)
+        self._local_put(redis_key(key), value, payload, ex)
+        try:
+            self.r.set(redis_key(key), payload, ex=ex)
         except redis.RedisError as e:
             CACHE_ERRORS.labels(op="set").inc()
             log.warning("cache_set_failed", error=str(e))
+
+    def mset_json(self, items: dict[Key, Any], ttl: int | None = None) -> None:
+        """``set_json`` for many keys in one round trip (a non-transactional
+        pipeline of SET ... EX, so every key keeps its TTL)."""
+        if not items:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for key, value in items.items():
+            payload = self._encode(value)
+            ex = self._write_ttl(key, ttl)
+            self._local_put(redis_key(key), value, payload, ex)
+            pipe.set(redis_key(key), payload, ex=ex)
+        try:
+            pipe.execute()
+        except redis.RedisError as e:
+            CACHE_ERRORS.labels(op="mset").inc()
+            log.warning("cache_mset_failed", error=str(e), keys=len(items))
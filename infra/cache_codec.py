@@ -0,0 +1,85 @@
+"""Compact translation-cache keys and values.
+
+Keys were ``"sx:" + 64-hex sha256`` and values JSON dicts, about three times
+the size of the translation they hold. Compact entries use:
+
+  * keys ``<ns>:<version>:`` + a 16-byte BLAKE2b digest (binary, 21 bytes for
+    ``sx``). ``KEY_VERSION`` is part of the namespace, so changing how keys
+    or values are built is a version bump, not a flush,
+  * values tagged by their first byte: ``0x01`` msgpack, ``0x02`` zstd
+    compressed msgpack (payloads of ``cache_compress_min_bytes`` or more).
+    Anything else is legacy JSON text.
+
+``settings.cache_codec = "json"`` writes plain JSON values instead (still
+read by every codec). Entries this process cannot decode count as misses.
+
+During migration a ``CacheKey`` also carries its legacy hex key.
+``RedisCache`` reads that key when the compact one misses (see
+``settings.cache_legacy_fallback``) and rewrites the hit in the new format.
+"""
+import hashlib
+import json
+from typing import Any, NamedTuple
+
+import msgpack
+import structlog
+import zstandard
+
+from app.settings import settings
+
+log = structlog.get_logger()
+
+KEY_VERSION = 2
+_DIGEST_BYTES = 16
+_MSGPACK, _ZSTD_MSGPACK = b"\x01", b"\x02"
+
+
+class CacheKey(NamedTuple):
+    key: bytes  # compact key, read and written
+    legacy: str  # pre-compact key, only read (during migration)
+
+    @property
+    def scope(self) -> str:
+        """The namespace, e.g. ``"sx"``."""
+        return self.legacy.partition(":")[0]
+
+
+def cache_key(namespace: str, *parts: str) -> CacheKey:
+    """Key for ``parts`` in ``namespace`` (e.g. ``"sx"``, ``"tx"``)."""
+    data = b"".join(p.encode("utf-8") + b"|" for p in parts)
+    digest = hashlib.blake2b(data, digest_size=_DIGEST_BYTES).digest()
+    return CacheKey(
+        key=f"{namespace}:{KEY_VERSION}:".encode() + digest,
+        legacy=f"{namespace}:" + hashlib.sha256(data).hexdigest(),
+    )
+
+
+def _use_msgpack() -> bool:
+    return (settings.cache_codec or "msgpack").lower() == "msgpack"
+
+
+def encode_value(value: Any) -> bytes:
+    if not _use_msgpack():
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+    packed = msgpack.packb(value, use_bin_type=True)
+    threshold = settings.cache_compress_min_bytes
+    if threshold > 0 and len(packed) >= threshold:
+        compressed = zstandard.ZstdCompressor(level=3).compress(packed)
+        if len(compressed) < len(packed):
+            return _ZSTD_MSGPACK + compressed
+    return _MSGPACK + packed
+
+
+def decode_value(payload: bytes | str) -> Any | None:
+    """The stored value, or None if ``payload`` is in a format this process
+    cannot read (logged, treated as a miss)."""
+    try:
+        if isinstance(payload, str) or payload[:1] not in (_MSGPACK, _ZSTD_MSGPACK):
+            return json.loads(payload)
+        body = payload[1:]
+        if payload[:1] == _ZSTD_MSGPACK:
+            body = zstandard.ZstdDecompressor().decompress(body)
+        return msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        log.warning("cache_decode_failed", error=str(e))
+        return None
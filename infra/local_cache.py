@@ -0,0 +1,164 @@
+"""In-process L1 cache in front of Redis.
+
+The hottest strings (UI labels, boilerplate) repeat thousands of times an
+hour; serving them from process memory skips the Redis round trip and the
+``json.loads``. The cache is bounded by entry count and by approximate bytes,
+entries expire after a short TTL (so an L1 never outlives its Redis entry by
+much), and eviction is LRU with TinyLFU admission: when the cache is full, a
+new key only displaces the LRU victim if it has been requested more often
+recently. One-off strings therefore never flush the working set.
+
+Access frequencies live in a small count-min sketch of 4-bit counters that
+are halved every ``10 × max_entries`` increments, so popularity ages out.
+
+Values are shared between callers and must be treated as read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.settings import settings
+
+# Per-entry bookkeeping (OrderedDict node, tuple, key object) on top of the
+# payload length, so that many tiny entries still count against the budget.
+_ENTRY_OVERHEAD = 200
+
+
+class FrequencySketch:
+    """Count-min sketch of recent access counts (capped at 15, aged by halving)."""
+
+    _DEPTH = 4
+    _SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, capacity: int):
+        width = 16
+        while width < max(capacity, 1):
+            width <<= 1
+        self._mask = width - 1
+        self._table = [bytearray(width) for _ in range(self._DEPTH)]
+        self._sample_size = 10 * max(capacity, 1)
+        self._additions = 0
+
+    def _indexes(self, key: str | bytes):
+        h = hash(key)
+        for row, seed in zip(self._table, self._SEEDS, strict=True):
+            yield row, ((h ^ seed) * 0x01000193 >> 7) & self._mask
+
+    def increment(self, key: str | bytes) -> None:
+        for row, i in self._indexes(key):
+            if row[i] < 15:
+                row[i] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def estimate(self, key: str | bytes) -> int:
+        return min(row[i] for row, i in self._indexes(key))
+
+    def _age(self) -> None:
+        for row in self._table:
+            for i, v in enumerate(row):
+                if v:
+                    row[i] = v >> 1
+        self._additions //= 2
+
+
+class LocalCache:
+    """Bounded, thread-safe LRU + TinyLFU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[str | bytes, tuple[Any, float, int]] = OrderedDict()  # value, expires_at, size
+        self._bytes = 0
+        self._sketch = FrequencySketch(max_entries)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "LocalCache | None":
+        """The configured L1, or None when ``l1_cache_max_entries`` is 0."""
+        if settings.l1_cache_max_entries <= 0:
+            return None
+        return cls(
+            max_entries=settings.l1_cache_max_entries,
+            max_bytes=settings.l1_cache_max_mb * 1024 * 1024,
+            ttl_s=settings.l1_cache_ttl_seconds,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def used_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str | bytes) -> Any | None:
+        """The cached value, or None on a miss. Every lookup (hit or miss)
+        counts towards the key's admission frequency."""
+        with self._lock:
+            self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str | bytes, value: Any, size: int, ttl_s: float | None = None) -> bool:
+        """Store ``value`` (``size`` ≈ its serialized length). Returns False
+        when admission rejected it in favour of the entries it would evict."""
+        size += len(key) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return False
+        ttl = self.ttl_s if ttl_s is None else min(self.ttl_s, ttl_s)
+        with self._lock:
+            if not self._make_room(key, size):
+                return False  # an existing entry for key stays as it was
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _make_room(self, key: str | bytes, size: int) -> bool:
+        """Pick LRU victims until ``size`` fits. Expired victims always go;
+        live ones only if ``key`` is more popular (TinyLFU), else nothing is
+        evicted and the caller rejects the new entry. An existing entry for
+        ``key`` is not counted (it is replaced) and never picked as a victim."""
+        now = time.monotonic()
+        freq = None
+        victims: list[str | bytes] = []
+        entries, used = len(self._entries), self._bytes
+        current = self._entries.get(key)
+        if current is not None:
+            entries -= 1
+            used -= current[2]
+        for k, (_value, expires_at, s) in self._entries.items():
+            if entries < self.max_entries and used + size <= self.max_bytes:
+                break
+            if k == key:
+                continue
+            if expires_at > now:
+                if freq is None:
+                    freq = self._sketch.estimate(key)
+                if self._sketch.estimate(k) >= freq:
+                    return False
+            victims.append(k)
+            entries -= 1
+            used -= s
+        for k in victims:
+            self._remove(k)
+        return True
+
+    def _remove(self, key: str | bytes) -> None:
+        _value, _exp, size = self._entries.pop(key)
+        self._bytes -= size
@@ -2,17 +2,21 @@ import redis
 
 from app.settings import settings
 
-# Process-wide singleton for the in-memory fake, so cache/rate-limit state is
+# Process-wide singletons for the in-memory fake, so cache/rate-limit state is
 # shared across requests (a fresh FakeRedis() would start empty each call).
-_fake = None
+_fake_server = None
+_fake: dict[bool, redis.Redis] = {}
 
 
-def get_redis() -> redis.Redis:
+def get_redis(binary: bool = False) -> redis.Redis:
+    """Client returning str replies; ``binary=True`` returns raw bytes, as
+    the compact cache codec needs."""
     if settings.use_fake_redis:
-        global _fake
-        if _fake is None:
+        global _fake_server
+        if binary not in _fake:
             import fakeredis
 
-            _fake = fakeredis.FakeRedis(decode_responses=True)
-        return _fake
-    return redis.Redis.from_url(settings.redis_url, decode_responses=True)
+            _fake_server = _fake_server or fakeredis.FakeServer()
+            _fake[binary] = fakeredis.FakeRedis(server=_fake_server, decode_responses=not binary)
+        return _fake[binary]
+    return redis.Redis.from_url(settings.redis_url, decode_responses=not binary)
@@ -0,0 +1,197 @@
+"""Singleflight: concurrent misses on the same cache key compute it once.
+
+The cache only helps once the first translation of a string has finished.
+When 20 requests ask for the same uncached sentence at once (a product
+launch), all 20 would run it. ``Singleflight.run`` splits a batch of keys:
+
+  * keys nobody is computing: this caller *leads* them and computes them,
+  * keys already in flight in this process: this caller *follows* and waits
+    for the leader's result.
+
+A follower whose leader fails (or whose wait runs out) computes the key
+itself. The leader's error may be its own deadline, which says nothing about
+the follower's request.
+
+With ``settings.singleflight_redis_lease`` a leader also takes a short Redis
+lease (``SET NX PX``) per key, so leaders in *other* processes follow as well.
+They poll the cache for the value until it appears, the lease is released or
+expires, or their wait runs out. ``compute`` must therefore write its results
+to the cache before it returns.
+"""
+import threading
+import time
+import uuid
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Any
+
+import redis
+import structlog
+
+from app.metrics import SINGLEFLIGHT_SHARED
+from app.settings import settings
+from infra.cache import RedisCache, redis_key
+
+log = structlog.get_logger()
+
+
+class RedisLeases:
+    """Cross-process leader election per cache key (best effort: any Redis
+    error means "no lease", and the caller computes the key itself)."""
+
+    def __init__(self, cache: RedisCache, ttl_ms: int | None = None, poll_ms: int | None = None):
+        self.cache = cache
+        self.ttl_ms = ttl_ms or settings.singleflight_lease_ms
+        self.poll_s = (poll_ms or settings.singleflight_poll_ms) / 1000.0
+        self.token = uuid.uuid4().hex
+
+    @staticmethod
+    def _lease_key(key: Any) -> bytes | str:
+        k = redis_key(key)
+        return (b"lease:" + k) if isinstance(k, bytes) else "lease:" + k
+
+    def acquire(self, keys: list) -> list:
+        """The subset of ``keys`` whose lease this caller now holds."""
+        pipe = self.cache.r.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self._lease_key(key), self.token, nx=True, px=self.ttl_ms)
+        try:
+            won = pipe.execute()
+        except redis.RedisError as e:
+            log.warning("singleflight_lease_failed", error=str(e))
+            return list(keys)
+        return [key for key, ok in zip(keys, won, strict=True) if ok]
+
+    def release(self, keys: list) -> None:
+        """Drop our leases (a lease that expired and was re-taken by someone
+        else in the meantime is left alone)."""
+        if not keys:
+            return
+        lease_keys = [self._lease_key(k) for k in keys]
+        try:
+            owners = self.cache.r.mget(lease_keys)
+            mine = [lk for lk, owner in zip(lease_keys, owners, strict=True) if owner in (self.token, self.token.encode())]
+            if mine:
+                self.cache.r.delete(*mine)
+        except redis.RedisError as e:
+            log.warning("singleflight_release_failed", error=str(e))
+
+    def wait(self, keys: list, deadline: float) -> dict:
+        """Values other processes computed for ``keys``. Keys whose lease
+        went away without a value, or still missing at ``deadline``, are left
+        out, and the caller computes them. A key whose leader gave up stops
+        being polled; the others are still waited for.
+
+        Polls are raw EXISTS calls on the compact keys and their leases (one
+        pipeline per poll), so waiting does not touch L1, the cache metrics,
+        TTL sliding or the legacy fallback. Keys that appeared are read once,
+        through ``mget_json``, at the end."""
+        ready: list = []
+        pending = list(keys)
+        while pending and time.monotonic() < deadline:
+            time.sleep(self.poll_s)
+            pipe = self.cache.r.pipeline(transaction=False)
+            for key in pending:
+                pipe.exists(redis_key(key))
+                pipe.exists(self._lease_key(key))
+            try:
+                flags = pipe.execute()
+            except redis.RedisError:
+                break
+            still = []
+            for key, has_value, has_lease in zip(pending, flags[::2], flags[1::2], strict=True):
+                if has_value:
+                    ready.append(key)
+                elif has_lease:
+                    still.append(key)
+                # else: its leader gave up; the caller computes it
+            pending = still
+        if not ready:
+            return {}
+        values = self.cache.mget_json(ready)
+        return {key: value for key, value in zip(ready, values, strict=True) if value is not None}
+
+
+class Singleflight:
+    """In-flight registry of cache keys for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def run(
+        self,
+        keys: list,
+        compute: Callable[[list], dict],
+        deadline: float | None = None,
+        cache: RedisCache | None = None,
+        cached: Callable[[Any], Any] = lambda value: value,
+    ) -> dict:
+        """Values for every key in ``keys``. ``compute(keys)`` returns a value
+        per key (and writes them to the cache). ``cached`` maps a cache entry
+        read back under a Redis lease to that value. Followers wait until
+        ``deadline`` (monotonic; default ``settings.singleflight_wait_s``)."""
+        if deadline is None:
+            deadline = time.monotonic() + settings.singleflight_wait_s
+        lead: list = []
+        follow: dict[Hashable, Future] = {}
+        with self._lock:
+            for key in keys:
+                flight = self._calls.get(key)
+                if flight is None:
+                    self._calls[key] = Future()
+                    lead.append(key)
+                else:
+                    follow[key] = flight
+
+        results: dict = {}
+        if lead:
+            try:
+                results.update(self._lead(lead, compute, deadline, cache, cached))
+            except BaseException as e:
+                self._finish(lead, {}, e)
+                raise
+            self._finish(lead, results)
+
+        retry = []
+        for key, flight in follow.items():
+            try:
+                results[key] = flight.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception:
+                retry.append(key)  # leader failed or is too slow for us
+        if follow:
+            SINGLEFLIGHT_SHARED.labels(scope="local").inc(len(follow) - len(retry))
+        if retry:
+            results.update(compute(retry))
+        return results
+
+    def _lead(self, keys: list, compute: Callable, deadline: float, cache: RedisCache | None, cached: Callable) -> dict:
+        if cache is None or not settings.singleflight_redis_lease:
+            return compute(keys)
+        leases = RedisLeases(cache)
+        mine = leases.acquire(keys)
+        results: dict = {}
+        try:
+            if mine:
+                results.update(compute(mine))
+        finally:
+            leases.release(mine)
+        held = set(mine)
+        others = [k for k in keys if k not in held]
+        if others:
+            shared = {k: cached(v) for k, v in leases.wait(others, deadline).items()}
+            SINGLEFLIGHT_SHARED.labels(scope="redis").inc(len(shared))
+            results.update(shared)
+            rest = [k for k in others if k not in shared]
+            if rest:
+                results.update(compute(rest))
+        return results
+
+    def _finish(self, keys: list, results: dict, error: BaseException | None = None) -> None:
+        with self._lock:
+            flights = [self._calls.pop(k) for k in keys]
+        for key, flight in zip(keys, flights, strict=True):
+            if key in results:
+                flight.set_result(results[key])
+            else:
+                flight.set_exception(error or RuntimeError("singleflight leader produced no value"))
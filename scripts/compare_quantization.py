@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Compare float32 vs dynamic-int8 (TORCH_DTYPE=int8) for one model on CPU.
+
+Loads the model once, quantizes a copy the same way ModelManager does, and
+translates the same sentences with both. Reports weight size, latency and how
+closely the int8 output tracks float32 (exact-match rate and mean character
+similarity), so the quality/latency trade-off is visible before flipping the
+setting on a fleet.
+
+Usage:
+    python -m scripts.compare_quantization --pair en zh
+    python -m scripts.compare_quantization --model Helsinki-NLP/opus-mt-en-de \
+        --file sentences.txt --beams 2 --runs 3
+"""
+import argparse
+import copy
+import difflib
+import io
+import statistics
+import sys
+import time
+
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from app.core.routing import resolve_model
+from app.inference.model_manager import _quantize_int8
+from app.settings import settings
+
+_SAMPLE = [
+    "The contract is ready for review.",
+    "Please send the signed documents back by Friday.",
+    "Our servers will be down for maintenance tonight between 1 and 3 a.m.",
+    "Thank you!",
+    "The quarterly report shows a twelve percent increase in revenue, driven mainly by new customers in Asia.",
+    "Could you tell me where the nearest train station is?",
+    "This function returns None when the cache is empty.",
+    "We apologise for the inconvenience.",
+]
+
+
+def _state_bytes(model) -> int:
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def _translate(model, tokenizer, texts, beams, max_new_tokens):
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+    with torch.no_grad():
+        out = model.generate(**inputs, num_beams=beams, max_new_tokens=max_new_tokens, no_repeat_ngram_size=3)
+    return tokenizer.batch_decode(out, skip_special_tokens=True)
+
+
+def _timed(model, tokenizer, texts, beams, max_new_tokens, runs):
+    outputs, times = [], []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        outputs = _translate(model, tokenizer, texts, beams, max_new_tokens)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return outputs, times
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = ap.add_mutually_exclusive_group()
+    target.add_argument("--pair", nargs=2, metavar=("SRC", "TGT"), help="Language pair (e.g. --pair en zh).")
+    target.add_argument("--model", help="HF model name (default: the en->zh model).")
+    ap.add_argument("--file", help="One source sentence per line (default: a built-in sample).")
+    ap.add_argument("--beams", type=int, default=1)
+    ap.add_argument("--max-new-tokens", type=int, default=128)
+    ap.add_argument("--runs", type=int, default=3, help="Timed runs per variant (after one warmup).")
+    args = ap.parse_args()
+
+    model_name = args.model or resolve_model(*(args.pair or ("en", "zh")))
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = _SAMPLE
+
+    print(f"Model: {model_name}  sentences: {len(texts)}  beams: {args.beams}  threads: {torch.get_num_threads()}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=settings.hf_model_cache)
+    fp32 = AutoModelForSeq2SeqLM.from_pretrained(
+        model_name, torch_dtype=torch.float32, cache_dir=settings.hf_model_cache
+    ).eval()
+    int8 = _quantize_int8(copy.deepcopy(fp32))
+
+    results = {}
+    for label, model in (("float32", fp32), ("int8", int8)):
+        _translate(model, tokenizer, texts[:1], args.beams, 8)  # warmup
+        outputs, times = _timed(model, tokenizer, texts, args.beams, args.max_new_tokens, args.runs)
+        results[label] = (outputs, times, _state_bytes(model))
+
+    print(f"\n{'variant':<8} {'weights MB':>10} {'median ms':>10} {'ms/sent':>8}")
+    for label, (_, times, size) in results.items():
+        med = statistics.median(times)
+        print(f"{label:<8} {size / 1e6:>10.1f} {med:>10.1f} {med / len(texts):>8.1f}")
+
+    ref, hyp = results["float32"][0], results["int8"][0]
+    exact = sum(r == h for r, h in zip(ref, hyp, strict=True)) / len(ref)
+    similarity = statistics.mean(difflib.SequenceMatcher(None, r, h).ratio() for r, h in zip(ref, hyp, strict=True))
+    speedup = statistics.median(results["float32"][1]) / statistics.median(results["int8"][1])
+    shrink = results["float32"][2] / results["int8"][2]
+    print(f"\nint8 vs float32: {speedup:.2f}x faster, {shrink:.2f}x smaller weights, "
+          f"exact match {exact:.0%}, mean char similarity {similarity:.3f}")
+
+    diffs = [(s, r, h) for s, r, h in zip(texts, ref, hyp, strict=True) if r != h]
+    if diffs:
+        print("\nDiffering outputs:")
+        for src, r, h in diffs:
+            print(f"  src:  {src}\n  fp32: {r}\n  int8: {h}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
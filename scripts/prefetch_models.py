@@ -7,6 +7,8 @@ already present are skipped by HuggingFace.
 Usage:
     python -m scripts.prefetch_models
     python -m scripts.prefetch_models --pair en zh   # a single model
+    python -m scripts.prefetch_models --ct2          # also convert for CTranslate2
+    python -m scripts.prefetch_models --onnx         # also export ONNX graphs
 """
 import argparse
 import sys
@@ -23,12 +25,34 @@ def _fetch(model_name: str) -> None:
     AutoModelForSeq2SeqLM.from_pretrained(model_name, cache_dir=settings.hf_model_cache)
 
 
+def _convert_ct2(model_name: str) -> None:
+    from app.inference.ct2_backend import convert_to_ct2
+
+    print(f"  converting {model_name} for ctranslate2 ({settings.ct2_quantization}) ...", flush=True)
+    print(f"    -> {convert_to_ct2(model_name)}", flush=True)
+
+
+def _export_onnx(model_name: str) -> None:
+    from app.inference.onnx_backend import export_to_onnx
+
+    print(f"  exporting {model_name} to onnx ...", flush=True)
+    print(f"    -> {export_to_onnx(model_name)}", flush=True)
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument(
         "--pair", nargs=2, metavar=("SRC", "TGT"),
         help="Prefetch only the model for this language pair (e.g. --pair en zh).",
     )
+    parser.add_argument(
+        "--ct2", action="store_true",
+        help="Also convert each model for INFERENCE_BACKEND=ctranslate2 (skipped if already converted).",
+    )
+    parser.add_argument(
+        "--onnx", action="store_true",
+        help="Also export each model for INFERENCE_BACKEND=onnx (skipped if already exported).",
+    )
     args = parser.parse_args()
 
     if args.pair:
@@ -40,6 +64,10 @@ def main() -> int:
     print(f"Cache dir: {settings.hf_model_cache}  ({len(models)} model(s))")
     for name in models:
         _fetch(name)
+        if args.ct2:
+            _convert_ct2(name)
+        if args.onnx:
+            _export_onnx(name)
     print("Done.")
     return 0
 
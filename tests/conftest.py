@@ -49,6 +49,11 @@ def _install_torch_stub():
     torch.cuda = cuda
     torch.float16 = "float16"
     torch.float32 = "float32"
+    threads = {"intra": 1, "inter": 1}
+    torch.set_num_threads = lambda n: threads.__setitem__("intra", n)
+    torch.get_num_threads = lambda: threads["intra"]
+    torch.set_num_interop_threads = lambda n: threads.__setitem__("inter", n)
+    torch.get_num_interop_threads = lambda: threads["inter"]
     sys.modules["torch"] = torch
 
 
@@ -68,8 +73,13 @@ def _install_transformers_stub():
         def from_pretrained(cls, name, **kw):
             return cls()
 
+    class LogitsProcessor:
+        pass
+
     transformers.AutoTokenizer = _FromPretrained
     transformers.AutoModelForSeq2SeqLM = _FromPretrained
+    transformers.LogitsProcessor = LogitsProcessor
+    transformers.LogitsProcessorList = list
     sys.modules["transformers"] = transformers
 
 
@@ -123,6 +123,19 @@ class TranslateApiTests(unittest.TestCase):
         self.assertEqual(len(conf), 1)
         self.assertTrue(0.0 <= conf[0] <= 1.0)
 
+    def test_request_past_deadline_returns_504(self):
+        from app.settings import settings
+
+        client, _ = build_client()
+        orig = settings.sync_request_timeout_s
+        settings.sync_request_timeout_s = 0.0  # already expired on arrival
+        try:
+            resp = client.post("/v1/translate", headers=HEADERS, json={
+                "source_lang": "en", "target_lang": "es", "texts": ["too late"]})
+        finally:
+            settings.sync_request_timeout_s = orig
+        self.assertEqual(resp.status_code, 504)
+
     def test_auto_detect_source_language(self):
         client, _ = build_client()
         resp = client.post("/v1/translate", headers=HEADERS, json={
@@ -1,8 +1,19 @@
 """Tests for the DynamicBatcher micro-batching primitive."""
 import threading
+import time
 import unittest
 
-from app.inference.batcher import DynamicBatcher
+from app.inference.batcher import (
+    BULK,
+    INTERACTIVE,
+    BatcherStopped,
+    DeadlineExceeded,
+    DynamicBatcher,
+    FairQueue,
+    SchedulingHints,
+    _Slot,
+    plan_batches,
+)
 
 
 class BatcherTests(unittest.TestCase):
@@ -81,6 +92,201 @@ class BatcherTests(unittest.TestCase):
         finally:
             b.stop()
 
+    def test_submit_many_preserves_order(self):
+        b = DynamicBatcher(lambda items: [x * 10 for x in items], max_batch=2, max_wait_s=0.01)
+        try:
+            # Five items span several batches of <= 2 but come back in order.
+            self.assertEqual(b.submit_many([1, 2, 3, 4, 5]), [10, 20, 30, 40, 50])
+        finally:
+            b.stop()
+
+    def test_submit_after_stop_fails_fast(self):
+        b = DynamicBatcher(lambda items: items, max_batch=2, max_wait_s=0.01)
+        b.stop()
+        with self.assertRaises(BatcherStopped):
+            b.submit(1)
+
+    def test_token_budget_splits_mixed_lengths(self):
+        batches = []
+        lock = threading.Lock()
+
+        def batch_fn(items):
+            with lock:
+                batches.append(list(items))
+            return items
+
+        # Items are their own token length; budget 40 with 2 beams = 20 per
+        # row-length unit: four 5-token rows fit, a 30-token row must go alone.
+        b = DynamicBatcher(batch_fn, max_batch=16, max_wait_s=0.05,
+                           max_tokens=40, cost_fn=lambda n: n, beams=2)
+        try:
+            self.assertEqual(b.submit_many([5, 5, 5, 5, 30]), [5, 5, 5, 5, 30])
+        finally:
+            b.stop()
+        self.assertEqual(batches, [[5, 5, 5, 5], [30]])
+
+    def test_plan_batches_respects_count_and_budget(self):
+        # Already length-sorted lengths; budget 12 padded tokens, 1 beam.
+        self.assertEqual(
+            plan_batches([2, 2, 3, 3, 6, 13], max_batch=3, max_tokens=12),
+            [[0, 1, 2], [3, 4], [5]],
+        )
+        self.assertEqual(plan_batches([1, 1, 1, 1, 1], max_batch=2), [[0, 1], [2, 3], [4]])
+
+
+class PriorityLaneTests(unittest.TestCase):
+    def _run_with_blocked_worker(self, starvation_s):
+        """Occupy the worker with a first batch, queue bulk then interactive
+        items behind it, release, and return the batches in execution order."""
+        batches = []
+        started = threading.Event()
+        gate = threading.Event()
+
+        def batch_fn(items):
+            if items == ["blocker"]:
+                started.set()
+                gate.wait()
+            batches.append(list(items))
+            return items
+
+        b = DynamicBatcher(batch_fn, max_batch=2, max_wait_s=0.0, starvation_s=starvation_s)
+        threads = [threading.Thread(target=b.submit, args=("blocker",))]
+        threads[0].start()
+        started.wait()
+        bulk = threading.Thread(target=b.submit_many, args=(["b1", "b2"], SchedulingHints(priority=BULK)))
+        bulk.start()
+        while len(b._lanes[BULK]) < 2:
+            time.sleep(0.001)
+        inter = threading.Thread(target=b.submit_many, args=(["i1", "i2"], SchedulingHints(priority=INTERACTIVE)))
+        inter.start()
+        while len(b._lanes[INTERACTIVE]) < 2:
+            time.sleep(0.001)
+        gate.set()
+        for t in [*threads, bulk, inter]:
+            t.join()
+        b.stop()
+        return batches
+
+    def test_interactive_preempts_queued_bulk(self):
+        batches = self._run_with_blocked_worker(starvation_s=60.0)
+        self.assertEqual(batches, [["blocker"], ["i1", "i2"], ["b1", "b2"]])
+
+    def test_starving_lane_is_served_first(self):
+        batches = self._run_with_blocked_worker(starvation_s=0.0)
+        self.assertEqual(batches, [["blocker"], ["b1", "b2"], ["i1", "i2"]])
+
+    def test_unknown_priority_rejected(self):
+        b = DynamicBatcher(lambda items: items)
+        try:
+            with self.assertRaises(ValueError):
+                b.submit(1, SchedulingHints(priority="urgent"))
+        finally:
+            b.stop()
+
+
+class DeadlineTests(unittest.TestCase):
+    def _blocked_batcher(self):
+        seen = []
+        started = threading.Event()
+        gate = threading.Event()
+
+        def batch_fn(items):
+            if items == ["blocker"]:
+                started.set()
+                gate.wait()
+            seen.extend(items)
+            return items
+
+        b = DynamicBatcher(batch_fn, max_batch=4, max_wait_s=0.0)
+        blocker = threading.Thread(target=b.submit, args=("blocker",))
+        blocker.start()
+        started.wait()
+        return b, seen, gate, blocker
+
+    def test_expired_item_is_dropped_and_caller_times_out(self):
+        b, seen, gate, blocker = self._blocked_batcher()
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                b.submit("late", SchedulingHints(deadline=time.monotonic() + 0.05))
+            gate.set()
+            blocker.join()
+            self.assertEqual(b.submit("fresh"), "fresh")
+        finally:
+            gate.set()
+            b.stop()
+        self.assertNotIn("late", seen)
+
+    def test_cancelled_item_is_dropped(self):
+        b, seen, gate, blocker = self._blocked_batcher()
+        cancelled = threading.Event()
+        errors = []
+
+        def waiter():
+            try:
+                b.submit("gone", SchedulingHints(cancelled=cancelled))
+            except DeadlineExceeded as e:
+                errors.append(e)
+
+        t = threading.Thread(target=waiter)
+        try:
+            t.start()
+            while len(b._lanes[INTERACTIVE]) < 1:
+                time.sleep(0.001)
+            cancelled.set()  # client disconnected
+            t.join()
+            gate.set()
+            blocker.join()
+        finally:
+            gate.set()
+            b.stop()
+        self.assertEqual(len(errors), 1)
+        self.assertNotIn("gone", seen)
+
+    def test_already_expired_submission_fails_immediately(self):
+        b = DynamicBatcher(lambda items: items)
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                b.submit(1, SchedulingHints(deadline=time.monotonic() - 1))
+        finally:
+            b.stop()
+
+
+class FairQueueTests(unittest.TestCase):
+    def _drain(self, q, n):
+        return [q.popleft().tenant for _ in range(n)]
+
+    def test_burst_does_not_starve_small_tenant(self):
+        q = FairQueue(quantum=10)
+        q.extend([_Slot(i, 10, SchedulingHints(tenant="heavy")) for i in range(20)])
+        q.extend([_Slot(i, 10, SchedulingHints(tenant="small")) for i in range(2)])
+        # The small tenant's items are served within the first few slots,
+        # not after the heavy tenant's 20-item burst.
+        self.assertEqual(self._drain(q, 4), ["heavy", "small", "heavy", "small"])
+
+    def test_weights_apportion_tokens(self):
+        q = FairQueue(quantum=10)
+        q.extend([_Slot(i, 10, SchedulingHints(tenant="gold", weight=3.0)) for i in range(30)])
+        q.extend([_Slot(i, 10, SchedulingHints(tenant="free", weight=1.0)) for i in range(30)])
+        served = self._drain(q, 20)
+        self.assertEqual(served.count("gold"), 15)
+        self.assertEqual(served.count("free"), 5)
+
+    def test_cost_is_charged_in_tokens(self):
+        q = FairQueue(quantum=10)
+        q.extend([_Slot(i, 40, SchedulingHints(tenant="long")) for i in range(5)])
+        q.extend([_Slot(i, 10, SchedulingHints(tenant="short")) for i in range(10)])
+        served = self._drain(q, 10)
+        # Equal weights -> roughly equal tokens: ~4 short items per long one.
+        self.assertGreaterEqual(served.count("short"), 3 * served.count("long"))
+
+    def test_tenant_weight_follows_key_tier(self):
+        from app.core.policies import tenant_weight
+        from app.settings import settings
+
+        self.assertEqual(tenant_weight(settings.default_key_rpm), 1.0)
+        self.assertEqual(tenant_weight(settings.default_key_rpm * 10), 10.0)
+        self.assertEqual(tenant_weight(None), 1.0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,77 @@
+"""Compact cache tests: key layout, the msgpack/zstd value codec, and reading
+pre-compact (hex key, JSON value) entries during migration."""
+import hashlib
+import json
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from app.settings import settings
+from infra import cache_codec
+from infra.cache import RedisCache
+from infra.cache_codec import cache_key, decode_value, encode_value
+
+
+class CacheKeyTests(unittest.TestCase):
+    def test_compact_key_and_legacy_key(self):
+        key = cache_key("sx", "m", "1", "64", "Hello.")
+        self.assertEqual(len(key.key), len(f"sx:{cache_codec.KEY_VERSION}:") + 16)
+        self.assertTrue(key.key.startswith(f"sx:{cache_codec.KEY_VERSION}:".encode()))
+        # The legacy key is exactly the pre-compact one.
+        self.assertEqual(key.legacy, "sx:" + hashlib.sha256(b"m|1|64|Hello.|").hexdigest())
+        self.assertNotEqual(key, cache_key("sx", "m", "1", "64", "Hello!"))
+
+    def test_json_codec_and_legacy_values_still_decode(self):
+        with mock.patch.object(settings, "cache_codec", "json"):
+            self.assertEqual(decode_value(encode_value({"t": "x"})), {"t": "x"})
+        self.assertEqual(decode_value('{"t": "legacy"}'), {"t": "legacy"})
+
+
+class CodecTests(unittest.TestCase):
+    def test_msgpack_round_trip_is_smaller_than_json(self):
+        value = {"t": "你好，世界"}
+        payload = encode_value(value)
+        self.assertEqual(payload[:1], b"\x01")
+        self.assertLess(len(payload), len(json.dumps(value).encode()))
+        self.assertEqual(decode_value(payload), value)
+
+    def test_large_values_are_compressed(self):
+        value = {"translation": "the same sentence again. " * 100}
+        with mock.patch.object(settings, "cache_compress_min_bytes", 256):
+            payload = encode_value(value)
+        self.assertEqual(payload[:1], b"\x02")
+        self.assertLess(len(payload), 400)
+        self.assertEqual(decode_value(payload), value)
+
+    def test_unreadable_entry_is_a_miss(self):
+        self.assertIsNone(decode_value(b"\x02not zstd"))
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.r = fakeredis.FakeRedis()
+        self.cache = RedisCache(self.r)
+
+    def test_legacy_entry_is_read_and_rewritten(self):
+        key = cache_key("sx", "m", "1", "64", "Hello.")
+        self.r.set(key.legacy, json.dumps({"t": "HELLO."}), ex=600)
+        self.assertEqual(self.cache.mget_json([key, cache_key("sx", "other")]), [{"t": "HELLO."}, None])
+        self.assertEqual(decode_value(self.r.get(key.key)), {"t": "HELLO."})
+        with mock.patch.object(self.r, "mget") as mget:
+            self.assertEqual(self.cache.get_json(key), {"t": "HELLO."})
+        mget.assert_not_called()  # served from the compact key, one GET
+
+    def test_fallback_can_be_turned_off(self):
+        key = cache_key("tx", "route", "T", "x")
+        self.r.set(key.legacy, json.dumps({"translation": "y"}))
+        with mock.patch.object(settings, "cache_legacy_fallback", False):
+            self.assertIsNone(self.cache.get_json(key))
+
+    def test_decoding_client_keeps_json_values(self):
+        r = fakeredis.FakeRedis(decode_responses=True)
+        cache = RedisCache(r)
+        key = cache_key("sx", "m")
+        cache.set_json(key, {"t": "v"})
+        self.assertEqual(json.loads(r.get(key.key)), {"t": "v"})
+        self.assertEqual(cache.get_json(key), {"t": "v"})
@@ -0,0 +1,182 @@
+"""Tests for the continuous (iteration-level) batching scheduler.
+
+A fake stepper "decodes" each text into its uppercase characters, one per step,
+then EOS, so we can drive admission/retirement without a model.
+"""
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+
+from app.inference.batcher import BatcherStopped, DeadlineExceeded
+from app.inference.continuous import ContinuousBatcher
+
+EOS = -1
+
+
+class FakeStepper:
+    eos_token_id = EOS
+
+    def __init__(self, step_delay=0.0):
+        self.step_delay = step_delay
+        self.step_sizes = []  # rows advanced per step() call
+        self.lock = threading.Lock()
+
+    def admit(self, texts, input_ids):
+        return {"targets": [list(t.upper()) for t in texts], "pos": 0}
+
+    def step(self, state):
+        if self.step_delay:
+            time.sleep(self.step_delay)
+        with self.lock:
+            self.step_sizes.append(len(state["targets"]))
+        pos = state["pos"]
+        state["pos"] += 1
+        return [ord(t[pos]) if pos < len(t) else EOS for t in state["targets"]]
+
+    def select(self, state, keep):
+        return {"targets": [state["targets"][i] for i in keep], "pos": state["pos"]}
+
+    def detokenize(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+class ContinuousBatcherTests(unittest.TestCase):
+    def test_roundtrip_preserves_order(self):
+        cb = ContinuousBatcher(FakeStepper(), max_active=8)
+        try:
+            self.assertEqual(cb.submit_many(["abc", "x", "hello"], max_new_tokens=32), ["ABC", "X", "HELLO"])
+        finally:
+            cb.stop()
+
+    def test_finished_rows_are_retired(self):
+        stepper = FakeStepper()
+        cb = ContinuousBatcher(stepper, max_active=8)
+        try:
+            cb.submit_many(["a", "long sentence"], max_new_tokens=32)
+        finally:
+            cb.stop()
+        # Both rows for the first two steps, then only the long one.
+        self.assertEqual(stepper.step_sizes[:2], [2, 2])
+        self.assertTrue(all(n == 1 for n in stepper.step_sizes[2:]))
+
+    def test_short_request_admitted_mid_flight_finishes_first(self):
+        cb = ContinuousBatcher(FakeStepper(step_delay=0.005), max_active=8)
+        done = []
+        lock = threading.Lock()
+
+        def run(text):
+            out = cb.submit_many([text], max_new_tokens=64)
+            with lock:
+                done.append(out[0])
+
+        long_t = threading.Thread(target=run, args=("x" * 40,))
+        try:
+            long_t.start()
+            time.sleep(0.03)  # long request is already decoding
+            short_t = threading.Thread(target=run, args=("hi",))
+            short_t.start()
+            short_t.join()
+            long_t.join()
+        finally:
+            cb.stop()
+        self.assertEqual(done, ["HI", "X" * 40])
+
+    def test_max_new_tokens_caps_each_row(self):
+        cb = ContinuousBatcher(FakeStepper(), max_active=4)
+        try:
+            self.assertEqual(cb.submit_many(["abcdef", "ab"], max_new_tokens=3), ["ABC", "AB"])
+        finally:
+            cb.stop()
+
+    def test_max_active_bounds_concurrent_rows(self):
+        stepper = FakeStepper()
+        cb = ContinuousBatcher(stepper, max_active=2)
+        try:
+            outs = cb.submit_many(["aaa", "bbb", "ccc", "ddd", "e"], max_new_tokens=8)
+        finally:
+            cb.stop()
+        self.assertEqual(outs, ["AAA", "BBB", "CCC", "DDD", "E"])
+        self.assertTrue(all(n <= 2 for n in stepper.step_sizes))
+
+    def test_step_error_propagates(self):
+        class Boom(FakeStepper):
+            def step(self, state):
+                raise RuntimeError("kaboom")
+
+        cb = ContinuousBatcher(Boom(), max_active=4)
+        try:
+            with self.assertRaises(RuntimeError):
+                cb.submit_many(["a"], max_new_tokens=4)
+        finally:
+            cb.stop()
+
+    def test_step_context_runs_on_the_scheduler_thread(self):
+        entered = []
+
+        @contextmanager
+        def step_context():
+            entered.append(threading.current_thread().name)
+            yield
+
+        cb = ContinuousBatcher(FakeStepper(), max_active=8, step_context=step_context)
+        try:
+            self.assertEqual(cb.submit_many(["ab"], 8), ["AB"])
+        finally:
+            cb.stop()
+        self.assertTrue(entered)
+        self.assertNotIn(threading.current_thread().name, entered)
+
+    def test_expired_rows_are_dropped_mid_decode(self):
+        stepper = FakeStepper(step_delay=0.01)
+        cb = ContinuousBatcher(stepper, max_active=8)
+        try:
+            start = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                cb.submit_many(["x" * 500], max_new_tokens=1000, deadline=time.monotonic() + 0.1)
+            self.assertLess(time.monotonic() - start, 0.5)
+            time.sleep(0.05)
+            steps = len(stepper.step_sizes)
+            time.sleep(0.1)
+            self.assertEqual(len(stepper.step_sizes), steps)  # no longer decoded
+            self.assertLess(steps, 100)
+            # Other rows of the same scheduler are unaffected.
+            self.assertEqual(cb.submit_many(["ok"], max_new_tokens=8, deadline=time.monotonic() + 5), ["OK"])
+        finally:
+            cb.stop()
+
+    def test_expired_row_leaves_its_cohort(self):
+        stepper = FakeStepper(step_delay=0.01)
+        cb = ContinuousBatcher(stepper, max_active=8)
+        results = {}
+
+        def run(name, text, deadline):
+            try:
+                results[name] = cb.submit_many([text], max_new_tokens=1000, deadline=deadline)
+            except DeadlineExceeded as e:
+                results[name] = e
+
+        try:
+            threads = [
+                threading.Thread(target=run, args=("late", "y" * 500, time.monotonic() + 0.05)),
+                threading.Thread(target=run, args=("ok", "z" * 20, time.monotonic() + 5)),
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(5)
+        finally:
+            cb.stop()
+        self.assertIsInstance(results["late"], DeadlineExceeded)
+        self.assertEqual(results["ok"], ["Z" * 20])
+        self.assertEqual(max(stepper.step_sizes[-5:]), 1)  # the long row was dropped from the cohort
+
+    def test_submit_after_stop_fails_fast(self):
+        cb = ContinuousBatcher(FakeStepper())
+        cb.stop()
+        with self.assertRaises(BatcherStopped):
+            cb.submit_many(["a"], max_new_tokens=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""CTranslate2 backend tests: the translator contract around a fake
+``ctranslate2.Translator`` (the real package is an optional dependency)."""
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from app.inference import ct2_backend
+from app.inference import model_manager as mm_module
+from app.inference.ct2_backend import convert_to_ct2, ct2_model_dir, make_ct2_translate
+from app.inference.model_manager import ModelManager
+from app.settings import settings
+
+
+class CharTokenizer:
+    """One token per character; token strings are the characters themselves."""
+
+    def __call__(self, texts, **kw):
+        return {"input_ids": [[ord(c) for c in t] for t in texts]}
+
+    def convert_ids_to_tokens(self, ids):
+        return [chr(i) for i in ids]
+
+    def convert_tokens_to_ids(self, tokens):
+        return [ord(t) if len(t) == 1 else 0 for t in tokens]
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(chr(i) for i in ids if i)
+
+
+class FakeCT2Translator:
+    """Echoes the source tokens uppercased, after the target prefix if any."""
+
+    def __init__(self):
+        self.calls = []
+
+    def translate_batch(self, source, target_prefix=None, **kw):
+        self.calls.append({"source": source, "target_prefix": target_prefix, **kw})
+        out = []
+        for i, tokens in enumerate(source):
+            hyp = [t.upper() for t in tokens]
+            if target_prefix:
+                hyp = target_prefix[i] + hyp
+            out.append(types.SimpleNamespace(hypotheses=[hyp]))
+        return out
+
+
+class CT2TranslateTests(unittest.TestCase):
+    def test_contract_and_passthrough_ids(self):
+        fake = FakeCT2Translator()
+        translate = make_ct2_translate(fake, CharTokenizer())
+        ids = translate.encode(["ab"])
+        out = translate(["ab"], num_beams=2, max_new_tokens=16, input_ids=ids)
+        self.assertEqual(out, [{"translation_text": "AB", "generated_tokens": 2}])
+        self.assertEqual(fake.calls[0]["source"], [["a", "b"]])
+        self.assertEqual(fake.calls[0]["beam_size"], 2)
+        self.assertEqual(fake.calls[0]["max_decoding_length"], 16)
+
+    def test_nllb_target_prefix_is_forced_and_stripped(self):
+        fake = FakeCT2Translator()
+        translate = make_ct2_translate(fake, CharTokenizer(), target_prefix="zho_Hans", repetition_penalty=1.1)
+        out = translate("hi", num_beams=1, max_new_tokens=8)
+        self.assertEqual(out, [{"translation_text": "HI", "generated_tokens": 2}])
+        self.assertEqual(fake.calls[0]["target_prefix"], [["zho_Hans"]])
+        self.assertEqual(fake.calls[0]["max_decoding_length"], 9)  # + the language token
+        self.assertEqual(fake.calls[0]["repetition_penalty"], 1.1)
+
+    def test_per_row_target_prefixes(self):
+        fake = FakeCT2Translator()
+        translate = make_ct2_translate(fake, CharTokenizer())
+        out = translate(["ab", "c"], num_beams=1, max_new_tokens=8, target_prefixes=["jpn_Jpan", "kor_Hang"])
+        self.assertEqual([r["translation_text"] for r in out], ["AB", "C"])
+        self.assertEqual(fake.calls[0]["target_prefix"], [["jpn_Jpan"], ["kor_Hang"]])
+
+    def test_model_dir_is_under_hf_cache(self):
+        path = ct2_model_dir("Helsinki-NLP/opus-mt-en-zh", "int8")
+        self.assertTrue(path.startswith(settings.hf_model_cache))
+        self.assertTrue(path.endswith("ct2/Helsinki-NLP--opus-mt-en-zh-int8"))
+
+    def test_conversion_reads_the_local_snapshot(self):
+        converter = mock.MagicMock()
+        fake_ct2 = types.SimpleNamespace(converters=types.SimpleNamespace(TransformersConverter=converter))
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(settings, "hf_model_cache", tmp), \
+                mock.patch.object(ct2_backend, "_import_ctranslate2", return_value=fake_ct2), \
+                mock.patch.object(ct2_backend, "local_snapshot", return_value="/models/snap/abc") as snapshot:
+            out_dir = convert_to_ct2("Helsinki-NLP/opus-mt-en-zh", "int8")
+        snapshot.assert_called_once_with("Helsinki-NLP/opus-mt-en-zh")
+        self.assertEqual(converter.call_args.args[0], "/models/snap/abc")
+        converter.return_value.convert.assert_called_once_with(out_dir, quantization="int8", force=True)
+
+
+class BackendSelectionTests(unittest.TestCase):
+    def test_manager_builds_ct2_translators_when_selected(self):
+        fake = FakeCT2Translator()
+        with mock.patch.object(settings, "inference_backend", "ctranslate2"), \
+                mock.patch.object(mm_module, "load_ct2_translator", return_value=fake) as load, \
+                mock.patch.object(mm_module.AutoTokenizer, "from_pretrained", return_value=CharTokenizer()):
+            mm = ModelManager(max_loaded_models=2)
+            pipe = mm.get_pipeline("Helsinki-NLP/opus-mt-en-zh")
+            out = pipe(["ok"], num_beams=1, max_new_tokens=4)
+        self.assertEqual(out[0]["translation_text"], "OK")
+        self.assertEqual(load.call_args.args[0], "Helsinki-NLP/opus-mt-en-zh")
+        self.assertEqual(mm.device_info()["backend"], "ctranslate2")
+
+    def test_nllb_pairs_share_one_group_translator(self):
+        fake = FakeCT2Translator()
+        with mock.patch.object(settings, "inference_backend", "ctranslate2"), \
+                mock.patch.object(mm_module, "load_ct2_translator", return_value=fake), \
+                mock.patch.object(mm_module.AutoTokenizer, "from_pretrained", return_value=CharTokenizer()):
+            mm = ModelManager(max_loaded_models=4)
+            pair = mm.get_pipeline("nllb:eng_Latn:jpn_Jpan")
+            self.assertEqual(pair.batch_group, mm_module.NLLB_BATCH_GROUP)
+            self.assertEqual(pair.batch_langs, ("eng_Latn", "jpn_Jpan"))
+            group = mm.get_pipeline(pair.batch_group)
+            ids = [[ord("a")], [ord("b")]]
+            out = group(["a", "b"], num_beams=1, max_new_tokens=4, input_ids=ids,
+                        src_langs=["eng_Latn", "fra_Latn"], tgt_langs=["jpn_Jpan", "kor_Hang"])
+        self.assertEqual([r["translation_text"] for r in out], ["A", "B"])
+        self.assertEqual(fake.calls[-1]["target_prefix"], [["jpn_Jpan"], ["kor_Hang"]])
+
+    def test_unknown_backend_rejected(self):
+        with mock.patch.object(settings, "inference_backend", "tensorrt"):
+            with self.assertRaises(ValueError):
+                ModelManager()
+
+
+if __name__ == "__main__":
+    unittest.main()
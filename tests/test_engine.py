@@ -3,11 +3,15 @@
 Inference is faked at the ModelManager boundary (get_pipeline returns a callable
 that records its calls), so these tests drive the *real* caching/dedupe logic.
 """
+import threading
+import time
 import unittest
+from unittest import mock
 
 import fakeredis
 
 from app.inference.engine import InferenceEngine
+from app.settings import settings
 from infra.cache import RedisCache
 
 
@@ -79,6 +83,309 @@ class EngineTests(unittest.TestCase):
                               max_new_tokens=8, split_long=True, cache=cache)
         self.assertEqual(len(mm.calls), 2)
 
+    def test_translate_texts_flattens_and_dedupes_across_texts(self):
+        engine, mm, cache = make_engine()
+        results = engine.translate_texts(
+            model_name="m", texts=["Shared. Alpha.", "Shared. Beta.", "Alpha."],
+            beam_size=1, max_new_tokens=8, split_long=True, cache=cache,
+        )
+        self.assertEqual(results, [("SHARED. ALPHA.", 2), ("SHARED. BETA.", 2), ("ALPHA.", 1)])
+        # One generate call for the whole request, each unique sentence once,
+        # shortest first.
+        self.assertEqual(mm.calls, [["Beta.", "Alpha.", "Shared."]])
+
+    def test_internal_batches_are_capped(self):
+        from app.settings import settings
+
+        engine, mm, cache = make_engine()
+        orig = settings.batch_max_size
+        settings.batch_max_size = 2
+        try:
+            results = engine.translate_texts(
+                model_name="m", texts=["a", "bbb", "cc", "dddd", "e"],
+                beam_size=1, max_new_tokens=8, split_long=False, cache=cache,
+            )
+        finally:
+            settings.batch_max_size = orig
+        self.assertEqual([t for t, _ in results], ["A", "BBB", "CC", "DDDD", "E"])
+        self.assertEqual(mm.calls, [["a", "e"], ["cc", "bbb"], ["dddd"]])
+
+    def test_uses_tokenizer_lengths_and_passes_ids_through(self):
+        calls = []
+
+        def pipe(texts, num_beams, max_new_tokens, input_ids=None):
+            calls.append((list(texts), input_ids))
+            return [{"translation_text": t.upper()} for t in texts]
+
+        # "Token" = whitespace word: "x x x x" is the longest by tokens even
+        # though "Loooooooooong" has more characters.
+        pipe.encode = lambda texts: [[len(w) for w in t.split()] for t in texts]
+
+        class MM:
+            def get_pipeline(self, model_name):
+                return pipe
+
+        engine = InferenceEngine(MM())
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        results = engine.translate_texts(
+            model_name="m", texts=["x x x x", "Loooooooooong", "a b"],
+            beam_size=1, max_new_tokens=8, split_long=False, cache=cache,
+        )
+        self.assertEqual([t for t, _ in results], ["X X X X", "LOOOOOOOOOONG", "A B"])
+        self.assertEqual(len(calls), 1)
+        texts, ids = calls[0]
+        self.assertEqual(texts, ["Loooooooooong", "a b", "x x x x"])
+        self.assertEqual(ids, [[13], [1, 1], [1, 1, 1, 1]])
+
+    def test_adaptive_max_new_tokens_caps_by_source_length(self):
+        caps = []
+
+        def pipe(texts, num_beams, max_new_tokens, input_ids=None):
+            caps.append(max_new_tokens)
+            return [{"translation_text": t.upper(), "generated_tokens": len(i)} for t, i in zip(texts, input_ids, strict=True)]
+
+        pipe.encode = lambda texts: [t.split() for t in texts]
+
+        class MM:
+            def get_pipeline(self, model_name):
+                return pipe
+
+        engine = InferenceEngine(MM(), adaptive_max_new_tokens=True)
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        engine.translate_texts(
+            model_name="m", texts=["a b c"], beam_size=1, max_new_tokens=256, split_long=False, cache=cache,
+        )
+        ratio = engine.expansion.ratio("m")
+        self.assertLess(caps[0], 256)
+        self.assertGreaterEqual(caps[0], 3 * ratio)
+        engine.translate_texts(
+            model_name="m", texts=["x " * 200], beam_size=1, max_new_tokens=64, split_long=False, cache=cache,
+        )
+        self.assertEqual(caps[1], 64)  # request value stays the ceiling
+
+    def test_rows_cut_off_by_the_adaptive_cap_are_rerun_uncapped(self):
+        calls = []
+
+        def pipe(texts, num_beams, max_new_tokens, input_ids=None, src_langs=None):
+            calls.append((list(texts), max_new_tokens, src_langs))
+            # "long" wants 40 tokens: it stops at the cap until the cap allows it.
+            return [
+                {"translation_text": f"{t}:{min(max_new_tokens, 40 if t == 'long' else 2)}",
+                 "generated_tokens": min(max_new_tokens, 40 if t == "long" else 2)}
+                for t in texts
+            ]
+
+        engine = InferenceEngine(RecordingModelManager(), adaptive_max_new_tokens=True)
+        cap = engine.expansion.cap("m", 3, 256)
+        self.assertLess(cap, 40)
+        out = engine._run_pipe("m", pipe, ["short", "long"], [[1] * 3, [1] * 3], 1, 256, src_langs=["a", "b"])
+        self.assertEqual(out, ["short:2", "long:40"])
+        self.assertEqual(calls, [(["short", "long"], cap, ["a", "b"]), (["long"], 256, ["b"])])
+        self.assertEqual(list(engine.expansion._ratios["m"]), [2 / 3, 40 / 3])  # the full length is learned
+
+    def test_group_batches_keep_expansion_ratios_per_language_pair(self):
+        caps = []
+
+        def group(texts, num_beams, max_new_tokens, input_ids=None, src_langs=None, tgt_langs=None):
+            caps.append(max_new_tokens)
+            return [{"translation_text": t, "generated_tokens": 2 * len(i)} for t, i in zip(texts, input_ids, strict=True)]
+
+        engine = InferenceEngine(RecordingModelManager(), adaptive_max_new_tokens=True)
+        for _ in range(50):
+            engine.expansion.observe("nllb:eng_Latn:deu_Hans", [10], [5])  # short outputs
+        short_cap = engine.expansion.cap("nllb:eng_Latn:deu_Hans", 10, 256)
+        wide_cap = engine.expansion.cap("nllb:zho_Hans:eng_Latn", 10, 256)  # no data yet: default ratio
+        engine._run_pipe(
+            "nllb:*", group, ["a", "b"], [[1] * 10, [1] * 10], 1, 256,
+            src_langs=["eng_Latn", "zho_Hans"], tgt_langs=["deu_Hans", "eng_Latn"],
+            expansion_keys=["nllb:eng_Latn:deu_Hans", "nllb:zho_Hans:eng_Latn"],
+        )
+        self.assertLess(short_cap, wide_cap)
+        self.assertEqual(caps, [wide_cap])  # the batch gets the largest per-row cap
+        self.assertNotIn("nllb:*", engine.expansion._ratios)
+        self.assertEqual(list(engine.expansion._ratios["nllb:zho_Hans:eng_Latn"]), [2.0])
+
+    def test_model_is_pinned_while_its_work_runs(self):
+        from contextlib import contextmanager
+
+        events = []
+
+        class MM:
+            @contextmanager
+            def pin(self, model_name):
+                events.append(("pin", model_name))
+                yield
+                events.append(("unpin", model_name))
+
+            def get_pipeline(self, model_name):
+                def _pipe(texts, num_beams, max_new_tokens):
+                    events.append(("run", model_name))
+                    return [{"translation_text": t} for t in texts]
+
+                return _pipe
+
+        engine = InferenceEngine(MM())
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        engine.translate_text("m", "Hello.", beam_size=1, max_new_tokens=8, split_long=False, cache=cache)
+        self.assertEqual(events, [("pin", "m"), ("run", "m"), ("unpin", "m")])
+
+
+class OrchestratorBatchTests(unittest.TestCase):
+    def test_batch_request_uses_one_generate_call_per_stage(self):
+        from app.core.orchestrator import Orchestrator
+
+        engine, mm, cache = make_engine()
+        orch = Orchestrator(engine, cache)
+        texts = [f"Product {i}." for i in range(10)] + ["Product 0."]
+        _, outs, _, hit_rate = orch.translate_sync(
+            source_lang="en", target_lang="es", texts=texts,
+            beam_size=1, max_new_tokens=8, split_long=True,
+        )
+        self.assertEqual(outs, [t.upper() for t in texts])
+        self.assertEqual(len(mm.calls), 1)
+        self.assertEqual(len(mm.calls[0]), 10)
+        # The repeated text is served as a hit, as if cached.
+        self.assertAlmostEqual(hit_rate, 1 / 11)
+
+    def test_batch_request_uses_one_cache_round_trip_each_way(self):
+        from app.core.orchestrator import Orchestrator
+
+        engine, mm, cache = make_engine()
+        orch = Orchestrator(engine, cache)
+        texts = [f"Item {i}. Part two." for i in range(20)]
+        with mock.patch.object(settings, "cache_legacy_fallback", False), \
+                mock.patch.object(cache.r, "get") as get, mock.patch.object(cache.r, "set") as set_, \
+                mock.patch.object(cache.r, "mget", wraps=cache.r.mget) as mget, \
+                mock.patch.object(cache.r, "pipeline", wraps=cache.r.pipeline) as pipeline:
+            _, outs, _, _ = orch.translate_sync(
+                source_lang="en", target_lang="es", texts=texts,
+                beam_size=1, max_new_tokens=8, split_long=True,
+            )
+        self.assertEqual(outs, [t.upper() for t in texts])
+        get.assert_not_called()
+        set_.assert_not_called()
+        # Reads (whole texts, then sentences) and writes (sentences, then whole
+        # texts): four round trips, MGETs or pipelines (GETEX reads).
+        self.assertEqual(mget.call_count + pipeline.call_count, 4)
+        _, outs, _, hit_rate = orch.translate_sync(
+            source_lang="en", target_lang="es", texts=texts,
+            beam_size=1, max_new_tokens=8, split_long=True,
+        )
+        self.assertEqual(hit_rate, 1.0)
+
+    def test_pivot_route_batches_each_stage(self):
+        from app.core.orchestrator import Orchestrator
+
+        engine, mm, cache = make_engine()
+        orch = Orchestrator(engine, cache)
+        orch.translate_sync(
+            source_lang="es", target_lang="de", texts=["Uno.", "Dos.", "Tres."],
+            beam_size=1, max_new_tokens=8, split_long=True,
+        )
+        self.assertEqual(len(mm.calls), 2)  # es->en and en->de, once each
+
+
+class DynamicBatchingTests(unittest.TestCase):
+    def test_concurrent_requests_share_generate_calls(self):
+        mm = RecordingModelManager()
+        engine = InferenceEngine(mm, dynamic_batching=True)
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        results = {}
+        barrier = threading.Barrier(6)
+
+        def worker(i):
+            barrier.wait()
+            out, _ = engine.translate_text(
+                model_name="m", text=f"sentence {i}", beam_size=1,
+                max_new_tokens=8, split_long=True, cache=cache,
+            )
+            results[i] = out
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            engine.close()
+
+        self.assertEqual(results, {i: f"SENTENCE {i}" for i in range(6)})
+        # Six concurrent requests coalesced into fewer generate calls.
+        self.assertLess(len(mm.calls), 6)
+
+    def test_nllb_pairs_with_different_languages_share_generate_calls(self):
+        calls = []
+
+        class MM:
+            def get_pipeline(self, model_name):
+                if model_name == "nllb:*":
+                    def group(texts, num_beams, max_new_tokens, src_langs, tgt_langs):
+                        calls.append(list(zip(texts, src_langs, tgt_langs, strict=True)))
+                        return [{"translation_text": f"{t}>{tgt}"} for t, tgt in zip(texts, tgt_langs, strict=True)]
+
+                    return group
+
+                def pair(texts, num_beams, max_new_tokens):
+                    raise AssertionError("pair translators are not called directly when batching")
+
+                _, src, tgt = model_name.split(":")
+                pair.batch_group, pair.batch_langs = "nllb:*", (src, tgt)
+                return pair
+
+        engine = InferenceEngine(MM(), dynamic_batching=True)
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        routes = ["nllb:eng_Latn:jpn_Jpan", "nllb:eng_Latn:kor_Hang", "nllb:zho_Hans:kor_Hang"]
+        results = {}
+        barrier = threading.Barrier(len(routes))
+
+        def worker(route):
+            barrier.wait()
+            results[route], _ = engine.translate_text(route, "hi", 1, 8, split_long=False, cache=cache)
+
+        threads = [threading.Thread(target=worker, args=(r,)) for r in routes]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            engine.close()
+        self.assertEqual(results, {r: "hi>" + r.rsplit(":", 1)[1] for r in routes})
+        self.assertLess(len(calls), len(routes))  # pairs coalesced on the shared weights
+        rows = {row for call in calls for row in call}
+        self.assertIn(("hi", "zho_Hans", "kor_Hang"), rows)
+
+    def test_evicted_batchers_stop_off_the_request_path(self):
+        engine = InferenceEngine(RecordingModelManager(), dynamic_batching=True)
+        stopped = threading.Event()
+        try:
+            with mock.patch("app.inference.engine._MAX_BATCHERS", 1):
+                old = engine._get_batcher("m", 1, 8)
+                real_stop = old.stop
+
+                def slow_stop():
+                    time.sleep(0.5)
+                    real_stop()
+                    stopped.set()
+
+                old.stop = slow_stop
+                start = time.monotonic()
+                engine._get_batcher("m", 1, 16)  # evicts the first batcher
+                self.assertLess(time.monotonic() - start, 0.25)
+                self.assertTrue(stopped.wait(5))
+        finally:
+            engine.close()
+
+    def test_batchers_are_keyed_by_generation_params(self):
+        engine = InferenceEngine(RecordingModelManager(), dynamic_batching=True)
+        try:
+            a = engine._get_batcher("m", 1, 8)
+            self.assertIs(engine._get_batcher("m", 1, 8), a)
+            self.assertIsNot(engine._get_batcher("m", 4, 8), a)
+        finally:
+            engine.close()
+
 
 if __name__ == "__main__":
     unittest.main()
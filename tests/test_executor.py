@@ -0,0 +1,118 @@
+"""Tests for per-model concurrency limits and torch thread budgeting."""
+import threading
+import time
+import unittest
+
+import torch
+
+from app.inference.batcher import DeadlineExceeded
+from app.inference.executor import InferenceExecutor, _parse_overrides
+
+
+def _max_concurrency(executor, model_names, hold=0.05):
+    """Run one slot per entry of model_names concurrently; return the peak
+    number of slots held at once (overall and per model)."""
+    lock = threading.Lock()
+    active = {"all": 0}
+    peak = {"all": 0}
+
+    def run(name):
+        with executor.slot(name):
+            with lock:
+                active["all"] += 1
+                active[name] = active.get(name, 0) + 1
+                peak["all"] = max(peak["all"], active["all"])
+                peak[name] = max(peak.get(name, 0), active[name])
+            time.sleep(hold)
+            with lock:
+                active["all"] -= 1
+                active[name] -= 1
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in model_names]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return peak
+
+
+class InferenceExecutorTests(unittest.TestCase):
+    def test_per_model_limit(self):
+        ex = InferenceExecutor(total_threads=8, max_concurrency=8, model_concurrency=2, overrides={})
+        peak = _max_concurrency(ex, ["m"] * 6)
+        self.assertEqual(peak["m"], 2)
+
+    def test_override_and_global_limit(self):
+        ex = InferenceExecutor(total_threads=8, max_concurrency=3, model_concurrency=1, overrides={"big": 3})
+        peak = _max_concurrency(ex, ["big"] * 4 + ["a", "b", "c"])
+        self.assertLessEqual(peak["all"], 3)
+        self.assertLessEqual(peak["a"], 1)
+        self.assertGreaterEqual(peak["big"], 1)
+
+    def test_threads_are_partitioned(self):
+        ex = InferenceExecutor(total_threads=16, max_concurrency=4, model_concurrency=1, overrides={})
+        self.assertEqual(ex.threads_per_execution, 4)
+        with ex.slot("m"):
+            self.assertEqual(torch.get_num_threads(), 4)
+        ex.configure(2)  # e.g. a pool worker's share
+        self.assertEqual(ex.threads_per_execution, 1)
+
+    def test_wrap_keeps_translator_attributes(self):
+        ex = InferenceExecutor(total_threads=4, max_concurrency=2, model_concurrency=1, overrides={})
+
+        def pipe(texts, num_beams, max_new_tokens):
+            return [{"translation_text": t} for t in texts]
+
+        pipe.encode = lambda texts: [[1] for _ in texts]
+        wrapped = ex.wrap("m", pipe)
+        self.assertEqual(wrapped(["a"], num_beams=1, max_new_tokens=4), [{"translation_text": "a"}])
+        self.assertIs(wrapped.encode, pipe.encode)
+
+    def test_slot_wait_respects_deadline(self):
+        ex = InferenceExecutor(total_threads=2, max_concurrency=2, model_concurrency=1, overrides={})
+        with ex.slot("m"):
+            t0 = time.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                with ex.slot("m", deadline=time.monotonic() + 0.05):
+                    pass
+            self.assertLess(time.monotonic() - t0, 1.0)
+        with ex.slot("m", deadline=time.monotonic() + 0.05):
+            pass  # released on the failed attempt: available again
+
+    def test_continuous_greedy_calls_skip_the_caller_slot(self):
+        ex = InferenceExecutor(total_threads=2, max_concurrency=2, model_concurrency=1, overrides={})
+        held = []
+
+        def pipe(texts, num_beams, max_new_tokens):
+            held.append(ex._semaphore("m")._value)
+            return texts
+
+        pipe.continuous_greedy = True
+        wrapped = ex.wrap("m", pipe)
+        wrapped(["a"], num_beams=1, max_new_tokens=4)
+        wrapped(["a"], num_beams=4, max_new_tokens=4)  # beam search falls back to generate(): bounded
+        self.assertEqual(held, [1, 0])
+
+    def test_continuous_greedy_calls_get_the_deadline(self):
+        ex = InferenceExecutor(total_threads=2, max_concurrency=2, model_concurrency=1, overrides={})
+        seen = []
+
+        def pipe(texts, num_beams, max_new_tokens, deadline=None):
+            seen.append(deadline)
+            return texts
+
+        pipe.continuous_greedy = True
+        wrapped = ex.wrap("m", pipe)
+        wrapped(["a"], num_beams=1, max_new_tokens=4, deadline=123.0)
+        wrapped(["a"], num_beams=4, max_new_tokens=4, deadline=time.monotonic() + 5)  # used for the slot
+        self.assertEqual(seen, [123.0, None])
+
+    def test_parse_overrides(self):
+        self.assertEqual(
+            _parse_overrides("nllb:eng_Latn:zho_Hans=1, Helsinki-NLP/opus-mt-en-zh=4,bad,x=y"),
+            {"nllb:eng_Latn:zho_Hans": 1, "Helsinki-NLP/opus-mt-en-zh": 4},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+"""Tests for the learned per-model output/input expansion ratio."""
+import unittest
+
+from app.inference.expansion import ExpansionTracker
+
+
+class ExpansionTrackerTests(unittest.TestCase):
+    def test_default_ratio_until_enough_samples(self):
+        tracker = ExpansionTracker(default_ratio=3.0, slack=8)
+        tracker.observe("m", [10] * 5, [10] * 5)
+        self.assertEqual(tracker.cap("m", 10, 256), 38)
+
+    def test_learned_ratio_tightens_cap(self):
+        tracker = ExpansionTracker(default_ratio=3.0, slack=8)
+        tracker.observe("m", [10] * 100, [12] * 100)
+        # ratio 1.2 x 1.2 margin = 1.44 -> ceil(14.4) + 8
+        self.assertEqual(tracker.cap("m", 10, 256), 23)
+        # Other models are unaffected.
+        self.assertEqual(tracker.cap("other", 10, 256), 38)
+
+    def test_request_value_is_the_ceiling(self):
+        tracker = ExpansionTracker(default_ratio=3.0, slack=8)
+        self.assertEqual(tracker.cap("m", 200, 64), 64)
+
+    def test_high_quantile_covers_outliers(self):
+        tracker = ExpansionTracker(default_ratio=3.0, slack=0)
+        tracker.observe("m", [10] * 90 + [10] * 10, [10] * 90 + [20] * 10)
+        self.assertGreaterEqual(tracker.cap("m", 10, 256), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,13 @@
 """Tests for cache degradation and rate-limiter behavior."""
 import unittest
+from unittest import mock
 
 import fakeredis
 import redis
 
-from infra.cache import RedisCache
+from app.settings import settings
+from infra.cache import RedisCache, _parse_ttl_policy
+from infra.cache_codec import cache_key
 from infra.rate_limit import enforce_rate_limit
 
 
@@ -23,6 +26,9 @@ class ExplodingRedis:
     def get(self, key):
         raise redis.ConnectionError("down")
 
+    def mget(self, keys):
+        raise redis.ConnectionError("down")
+
     def set(self, key, value, ex=None):
         raise redis.ConnectionError("down")
 
@@ -32,7 +38,7 @@ class ExplodingRedis:
     def expire(self, key, ttl):
         raise redis.ConnectionError("down")
 
-    def pipeline(self):
+    def pipeline(self, transaction=True):
         return _ExplodingPipeline()
 
 
@@ -54,6 +60,49 @@ class CacheTests(unittest.TestCase):
         cache = RedisCache(ExplodingRedis())
         cache.set_json("k", {"v": 1})  # must not raise
 
+    def test_bulk_roundtrip_keeps_order_and_ttl(self):
+        r = fakeredis.FakeRedis(decode_responses=True)
+        cache = RedisCache(r)
+        cache.mset_json({"a": {"v": 1}, "b": {"v": "二"}}, ttl=60)
+        self.assertEqual(cache.mget_json(["b", "nope", "a"]), [{"v": "二"}, None, {"v": 1}])
+        self.assertTrue(0 < r.ttl("a") <= 60)
+        self.assertEqual(cache.mget_json([]), [])
+
+    def test_bulk_ops_degrade_on_error(self):
+        cache = RedisCache(ExplodingRedis())
+        self.assertEqual(cache.mget_json(["a", "b"]), [None, None])
+        cache.mset_json({"a": {"v": 1}})  # must not raise
+
+
+class TtlPolicyTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(settings, "cache_ttl_policy", "sx=100:1000,tx=50:500")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.r = fakeredis.FakeRedis()
+        self.cache = RedisCache(self.r)
+
+    def test_hits_slide_expiry_out_to_the_scope_ttl(self):
+        sx, tx = cache_key("sx", "a"), cache_key("tx", "a")
+        self.cache.mset_json({sx: {"t": 1}, tx: {"translation": 1}})
+        self.assertTrue(90 < self.r.ttl(sx.key) <= 100)
+        self.assertTrue(40 < self.r.ttl(tx.key) <= 50)
+        self.assertEqual(self.cache.mget_json([sx, tx, cache_key("sx", "miss")]), [{"t": 1}, {"translation": 1}, None])
+        self.assertTrue(990 < self.r.ttl(sx.key) <= 1000)
+        self.assertTrue(490 < self.r.ttl(tx.key) <= 500)
+        self.assertFalse(self.r.exists(cache_key("sx", "miss").key))
+
+    def test_other_keys_keep_the_flat_ttl(self):
+        self.cache.set_json("k", {"v": 1})
+        self.assertEqual(self.cache.get_json("k"), {"v": 1})
+        self.assertTrue(self.r.ttl("k") > settings.cache_ttl_seconds - 10)
+
+    def test_policy_parsing(self):
+        self.assertEqual(
+            _parse_ttl_policy("sx=10:5, tx=1:2,bad,xx=a:b"),
+            {"sx": (10, 10), "tx": (1, 2)},  # sliding never below initial
+        )
+
 
 class RateLimitTests(unittest.TestCase):
     def test_allows_under_limit(self):
@@ -0,0 +1,116 @@
+"""L1 cache tests: TTL expiry, count and byte bounds, TinyLFU admission, and
+the two-tier read/write path through RedisCache."""
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from app.metrics import CACHE_HITS, CACHE_MISSES
+from infra.cache import RedisCache
+from infra.local_cache import FrequencySketch, LocalCache
+
+
+def _count(counter, scope):
+    return counter.labels(scope=scope)._value.get()
+
+
+class FrequencySketchTests(unittest.TestCase):
+    def test_counts_cap_and_age(self):
+        sketch = FrequencySketch(64)
+        for _ in range(20):
+            sketch.increment("hot")
+        sketch.increment("cold")
+        self.assertEqual(sketch.estimate("hot"), 15)
+        self.assertGreaterEqual(sketch.estimate("cold"), 1)
+        for i in range(640):  # one sample period of other keys halves everything
+            sketch.increment(f"k{i}")
+        self.assertLess(sketch.estimate("hot"), 15)
+
+
+class LocalCacheTests(unittest.TestCase):
+    def test_hit_and_ttl_expiry(self):
+        cache = LocalCache(max_entries=10, max_bytes=1 << 20, ttl_s=60)
+        cache.put("k", {"t": "v"}, 10)
+        self.assertEqual(cache.get("k"), {"t": "v"})
+        with mock.patch("infra.local_cache.time.monotonic", return_value=1e12):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(len(cache), 0)
+
+    def test_shorter_entry_ttl_wins(self):
+        cache = LocalCache(max_entries=10, max_bytes=1 << 20, ttl_s=3600)
+        with mock.patch("infra.local_cache.time.monotonic", return_value=100.0):
+            cache.put("k", "v", 1, ttl_s=5)
+        with mock.patch("infra.local_cache.time.monotonic", return_value=106.0):
+            self.assertIsNone(cache.get("k"))
+
+    def test_one_off_keys_do_not_displace_popular_ones(self):
+        cache = LocalCache(max_entries=3, max_bytes=1 << 20, ttl_s=60)
+        for k in ("a", "b", "c"):
+            for _ in range(3):
+                cache.get(k)
+            cache.put(k, k, 1)
+        cache.get("once")
+        self.assertFalse(cache.put("once", "x", 1))
+        self.assertEqual([cache.get(k) for k in ("a", "b", "c")], ["a", "b", "c"])
+
+    def test_popular_newcomer_evicts_lru(self):
+        cache = LocalCache(max_entries=2, max_bytes=1 << 20, ttl_s=60)
+        cache.put("a", "a", 1)
+        cache.put("b", "b", 1)
+        for _ in range(4):
+            cache.get("new")
+        self.assertTrue(cache.put("new", "n", 1))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))  # least recently used
+
+    def test_rejected_update_keeps_the_existing_entry(self):
+        cache = LocalCache(max_entries=10, max_bytes=1000, ttl_s=60)
+        cache.put("a", "old", 100)
+        for _ in range(4):
+            cache.get("b")
+        cache.put("b", "b", 100)
+        # Growing "a" would need to evict the more popular "b": rejected, and
+        # the old "a" stays (it is not removed before admission).
+        self.assertFalse(cache.put("a", "new", 500))
+        self.assertEqual(cache.get("a"), "old")
+        self.assertEqual(cache.get("b"), "b")
+        # Same-size updates replace in place, even with the cache full.
+        full = LocalCache(max_entries=2, max_bytes=1 << 20, ttl_s=60)
+        full.put("x", 1, 1)
+        full.put("y", 2, 1)
+        self.assertTrue(full.put("x", 3, 1))
+        self.assertEqual((full.get("x"), full.get("y"), len(full)), (3, 2, 2))
+
+    def test_byte_budget(self):
+        cache = LocalCache(max_entries=100, max_bytes=2000, ttl_s=60)
+        self.assertFalse(cache.put("huge", "x", 5000))
+        for i in range(10):
+            cache.get(f"k{i}")
+            cache.get(f"k{i}")
+            cache.put(f"k{i}", i, 400)
+        self.assertLessEqual(cache.used_bytes, 2000)
+
+
+class TwoTierCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.r = fakeredis.FakeRedis(decode_responses=True)
+        self.cache = RedisCache(self.r, local=LocalCache(max_entries=100, max_bytes=1 << 20, ttl_s=60))
+
+    def test_redis_hit_fills_l1(self):
+        RedisCache(self.r).set_json("k", {"t": "v"})  # written by another process
+        self.assertEqual(self.cache.get_json("k"), {"t": "v"})
+        local_hits = _count(CACHE_HITS, "local")
+        with mock.patch.object(self.r, "get") as get:
+            self.assertEqual(self.cache.get_json("k"), {"t": "v"})
+        get.assert_not_called()
+        self.assertEqual(_count(CACHE_HITS, "local"), local_hits + 1)
+
+    def test_bulk_reads_only_fetch_l1_misses(self):
+        self.cache.mset_json({"a": {"t": 1}})
+        RedisCache(self.r).set_json("b", {"t": 2})
+        misses = _count(CACHE_MISSES, "local")
+        with mock.patch.object(self.r, "mget", wraps=self.r.mget) as mget:
+            self.assertEqual(self.cache.mget_json(["a", "b", "c"]), [{"t": 1}, {"t": 2}, None])
+            self.assertEqual(self.cache.mget_json(["a", "b"]), [{"t": 1}, {"t": 2}])
+        mget.assert_called_once_with(["b", "c"])
+        self.assertEqual(_count(CACHE_MISSES, "local"), misses + 2)
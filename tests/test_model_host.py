@@ -0,0 +1,180 @@
+"""Model-host sidecar tests: a real ModelHost on a temporary Unix socket,
+serving a batching InferenceEngine over a fake ModelManager, and clients
+talking to it through RemoteModelManager."""
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from app.inference.batcher import BULK, DeadlineExceeded, SchedulingHints
+from app.inference.engine import InferenceEngine
+from app.inference.model_host import ModelHost, RemoteModelManager, _Reader, _watch_peer, _Writer
+from app.settings import settings
+from infra.cache import RedisCache
+
+
+class FakeModelManager:
+    device = "cpu"
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.release = threading.Event()  # model "slow" blocks until set
+
+    def get_pipeline(self, model_name):
+        if model_name == "missing":
+            raise ValueError("no such model")
+
+        def _pipe(texts, num_beams, max_new_tokens):
+            with self.lock:
+                self.calls.append(list(texts))
+            if model_name == "slow":
+                self.release.wait(5)
+            return [{"translation_text": t.upper()} for t in texts]
+
+        return _pipe
+
+    def warmup(self, model_name):
+        self.get_pipeline(model_name)
+
+    def loaded_models(self):
+        return ["m"]
+
+    def device_info(self):
+        return {"device": "cpu"}
+
+
+class ProtocolTests(unittest.TestCase):
+    def test_strings_round_trip(self):
+        w = _Writer(7).string("héllo 你好").string(None).strings(["a", "", "ü"])
+        r = _Reader(bytes(w.buf))
+        self.assertEqual(r.u8(), 7)
+        self.assertEqual(r.string(), "héllo 你好")
+        self.assertIsNone(r.string())
+        self.assertEqual(r.strings(), ["a", "", "ü"])
+
+    def test_watch_peer_flags_a_closed_client(self):
+        host_end, client_end = socket.socketpair()
+        self.addCleanup(host_end.close)
+        done, cancelled = threading.Event(), threading.Event()
+        watcher = threading.Thread(target=_watch_peer, args=(host_end, done, cancelled))
+        watcher.start()
+        client_end.close()
+        watcher.join(2)
+        self.assertTrue(cancelled.is_set())
+
+    def test_watch_peer_stops_when_the_call_finishes(self):
+        host_end, client_end = socket.socketpair()
+        self.addCleanup(host_end.close)
+        self.addCleanup(client_end.close)
+        done, cancelled = threading.Event(), threading.Event()
+        watcher = threading.Thread(target=_watch_peer, args=(host_end, done, cancelled))
+        watcher.start()
+        done.set()
+        watcher.join(2)
+        self.assertFalse(watcher.is_alive())
+        self.assertFalse(cancelled.is_set())
+
+
+class ModelHostTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.path = os.path.join(tmp, "host.sock")
+        self.fake = FakeModelManager()
+        patcher = mock.patch.object(settings, "batch_max_wait_ms", 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.host = ModelHost(self.path, InferenceEngine(self.fake, dynamic_batching=True))
+        self.host.bind()
+        threading.Thread(target=self.host.serve_forever, daemon=True).start()
+        self.addCleanup(self.host.shutdown)
+        self.client = RemoteModelManager(self.path, timeout_s=5)
+        self.addCleanup(self.client.stop)
+
+    def test_generate_round_trip_in_order(self):
+        self.assertEqual(self.client.generate("m", ["b c", "a", "你好"], 1, 16), ["B C", "A", "你好"])
+
+    def test_engine_is_a_thin_client(self):
+        engine = InferenceEngine(self.client)
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        out, n = engine.translate_text("m", "Hello. World.", 1, 16, split_long=True, cache=cache)
+        self.assertEqual((out, n), ("HELLO. WORLD.", 2))
+        engine.translate_text("m", "Hello. World.", 1, 16, split_long=True, cache=cache)
+        self.assertEqual(len(self.fake.calls), 1)  # second request served by the client-side cache
+
+    def test_concurrent_clients_share_batches(self):
+        clients = [RemoteModelManager(self.path, timeout_s=5) for _ in range(4)]
+        barrier = threading.Barrier(len(clients))
+        results = {}
+
+        def run(i):
+            barrier.wait()
+            results[i] = clients[i].generate("m", [f"text {i}"], 1, 16)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(clients))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for c in clients:
+            c.stop()
+        self.assertEqual(results, {i: [f"TEXT {i}"] for i in range(4)})
+        self.assertLess(len(self.fake.calls), 4)  # coalesced on the host
+
+    def test_errors_keep_their_type(self):
+        with self.assertRaises(ValueError):
+            self.client.generate("missing", ["x"], 1, 16)
+        expired = SchedulingHints(priority=BULK, deadline=time.monotonic() - 1)
+        with self.assertRaises(DeadlineExceeded):
+            self.client.generate("m", ["x"], 1, 16, expired)
+        # The connection is still usable after an error reply.
+        self.assertEqual(self.client.generate("m", ["ok"], 1, 16), ["OK"])
+
+    def test_deadline_bounds_the_wait_for_a_reply(self):
+        self.addCleanup(self.fake.release.set)
+        hints = SchedulingHints(priority=BULK, deadline=time.monotonic() + 0.3)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            self.client.generate("slow", ["x"], 1, 16, hints)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_cancellation_closes_the_call(self):
+        self.addCleanup(self.fake.release.set)
+        cancelled = threading.Event()
+        hints = SchedulingHints(priority=BULK, cancelled=cancelled)
+        threading.Timer(0.2, cancelled.set).start()
+        start = time.monotonic()
+        with self.assertRaisesRegex(DeadlineExceeded, "cancelled"):
+            self.client.generate("slow", ["x"], 1, 16, hints)
+        self.assertLess(time.monotonic() - start, 2)
+        self.fake.release.set()
+        self.assertEqual(self.client.generate("m", ["ok"], 1, 16), ["OK"])
+
+    def test_host_cancels_queued_work_of_a_departed_client(self):
+        self.addCleanup(self.fake.release.set)
+        with mock.patch.object(self.host.engine, "generate", wraps=self.host.engine.generate) as generate:
+            cancelled = threading.Event()
+            threading.Timer(0.2, cancelled.set).start()
+            with self.assertRaises(DeadlineExceeded):
+                self.client.generate("slow", ["x"], 1, 16, SchedulingHints(priority=BULK, cancelled=cancelled))
+            host_hints = generate.call_args.args[4]
+            for _ in range(100):
+                if host_hints.expired():
+                    break
+                time.sleep(0.02)
+            self.assertTrue(host_hints.cancelled.is_set())
+
+    def test_info_and_loaded_models(self):
+        self.assertEqual(self.client.device, "cpu")
+        self.assertEqual(self.client.device_info()["executor"], "model_host")
+        self.assertEqual(self.client.loaded_models(), ["m"])
+        self.client.warmup("m")
+
+    def test_unavailable_host_raises(self):
+        with self.assertRaises(RuntimeError):
+            RemoteModelManager(self.path + ".absent", timeout_s=1).loaded_models()
@@ -4,16 +4,26 @@ Real model loading is replaced with a fake builder that sleeps briefly and
 counts how many times each model was built, so we can assert the double-checked
 locking prevents duplicate loads under concurrency.
 """
+import gc
 import threading
 import time
+import types
 import unittest
+from unittest import mock
 
 import torch
 
 from app.inference.model_manager import (
     ModelManager,
+    _encode_batch,
+    _live_managers,
+    _make_encoder,
+    _nllb_tagged_ids,
+    _parse_cost_weights,
     _resolve_device,
     _resolve_dtype,
+    _thrashing_alarm,
+    _wants_int8,
 )
 
 
@@ -44,7 +54,7 @@ class ModelManagerTests(unittest.TestCase):
         self.assertEqual(counts["m1"], 1)  # built once
 
     def test_lru_eviction(self):
-        mm = ModelManager(max_loaded_models=2)
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
         counts = {}
         patch_builder(mm, counts)
         mm.get_pipeline("m1")
@@ -56,7 +66,7 @@ class ModelManagerTests(unittest.TestCase):
         self.assertEqual(counts["m1"], 2)
 
     def test_access_refreshes_recency(self):
-        mm = ModelManager(max_loaded_models=2)
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
         counts = {}
         patch_builder(mm, counts)
         mm.get_pipeline("m1")
@@ -87,6 +97,259 @@ class ModelManagerTests(unittest.TestCase):
         self.assertTrue(all(r is results[0] for r in results))  # all same object
 
 
+def patch_sized_builder(mm, sizes, shared=None):
+    """Fake builders whose translators report ``resident_bytes`` (and, for
+    nllb:*, a shared weight group of ``shared`` bytes)."""
+
+    def fake_build(model_name):
+        def _translate(texts, num_beams, max_new_tokens):
+            return [{"translation_text": t} for t in texts]
+
+        if model_name.startswith("nllb:"):
+            _translate.shared_weights, _translate.shared_bytes = "nllb-base", shared
+        else:
+            _translate.resident_bytes = sizes[model_name]
+        return _translate
+
+    mm._build_seq2seq_translator = fake_build
+    mm._build_nllb_translator = fake_build
+
+
+MB = 1024 * 1024
+
+
+class MemoryBudgetTests(unittest.TestCase):
+    def test_evicts_by_bytes_not_count(self):
+        mm = ModelManager(max_loaded_models=10, memory_budget_mb=100, min_resident_s=0)
+        patch_sized_builder(mm, {"big": 60 * MB, "small1": 20 * MB, "small2": 20 * MB, "other": 50 * MB})
+        for name in ("big", "small1", "small2"):
+            mm.get_pipeline(name)
+        self.assertEqual(mm.resident_bytes(), 100 * MB)  # at budget: nothing evicted
+        mm.get_pipeline("other")  # 150 MB -> evict LRU "big" only
+        self.assertEqual(mm.loaded_models(), ["small1", "small2", "other"])
+
+    def test_model_over_budget_alone_still_loads(self):
+        mm = ModelManager(max_loaded_models=10, memory_budget_mb=10, min_resident_s=0)
+        patch_sized_builder(mm, {"a": 5 * MB, "huge": 50 * MB})
+        mm.get_pipeline("a")
+        mm.get_pipeline("huge")
+        self.assertEqual(mm.loaded_models(), ["huge"])
+
+    def test_cost_weight_keeps_expensive_model_longer(self):
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
+        mm._cost_weights = {"costly": 10.0}
+        patch_sized_builder(mm, {"costly": 1, "cheap": 1, "new": 1})
+        mm.get_pipeline("costly")
+        mm.get_pipeline("cheap")
+        now = time.monotonic()
+        mm._last_used.update(costly=now - 5.0, cheap=now - 1.0)  # costly idle longer
+        mm.get_pipeline("new")  # 5/10 < 1/1 -> cheap is the victim
+        self.assertEqual(mm.loaded_models(), ["costly", "new"])
+
+    def test_shared_nllb_weights_counted_once_and_released_with_last(self):
+        mm = ModelManager(max_loaded_models=10, memory_budget_mb=100, min_resident_s=0)
+        patch_sized_builder(mm, {"marian": 30 * MB}, shared=60 * MB)
+        mm._nllb = ("model", "device")
+        mm.get_pipeline("nllb:en:fr")
+        mm.get_pipeline("nllb:en:de")
+        self.assertEqual(mm.resident_bytes(), 60 * MB)  # not 120
+        mm.get_pipeline("marian")  # 90 MB: fits
+        self.assertIsNotNone(mm._nllb)
+        patch_sized_builder(mm, {"marian": 30 * MB, "marian2": 50 * MB}, shared=60 * MB)
+        mm.get_pipeline("marian2")  # 140 MB -> both nllb pipelines go, then the shared weights
+        self.assertEqual(mm.loaded_models(), ["marian", "marian2"])
+        self.assertIsNone(mm._nllb)
+        self.assertEqual(mm.resident_bytes(), 80 * MB)
+
+    def test_parse_cost_weights_matches_prefix(self):
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
+        mm._cost_weights = _parse_cost_weights("nllb=4, Helsinki-NLP/opus-mt-en-zh=2,bad=x")
+        self.assertEqual(mm._cost_weight("nllb:eng_Latn:fra_Latn"), 4.0)
+        self.assertEqual(mm._cost_weight("Helsinki-NLP/opus-mt-en-zh"), 2.0)
+        self.assertEqual(mm._cost_weight("bad"), 1.0)
+
+
+class SharedNllbRaceTests(unittest.TestCase):
+    def test_eviction_during_an_nllb_build_keeps_the_shared_weights(self):
+        class Tokenizer:
+            def convert_tokens_to_ids(self, token):
+                return 7
+
+        mm = ModelManager(max_loaded_models=1, min_resident_s=0)
+        patch_builder(mm, {})
+        model = types.SimpleNamespace(nbytes=42 * MB)
+        loads = []
+
+        def load_torch_model(name):
+            loads.append(name)
+            return model, "cpu"
+
+        building, release = threading.Event(), threading.Event()
+
+        def slow_tokenizer(src_code):
+            building.set()
+            release.wait(5)
+            return Tokenizer()
+
+        mm._load_torch_model = load_torch_model
+        mm._get_nllb_tokenizer = slow_tokenizer
+        bytes_patch = mock.patch("app.inference.model_manager._module_bytes", lambda m: m.nbytes)
+        bytes_patch.start()
+        self.addCleanup(bytes_patch.stop)
+        mm.get_pipeline("m1")
+        loader = threading.Thread(target=mm.get_pipeline, args=("nllb:eng_Latn:fra_Latn",))
+        loader.start()
+        self.assertTrue(building.wait(5))
+        for _ in range(100):
+            if mm._nllb is not None:
+                break
+            time.sleep(0.01)
+        mm.get_pipeline("m2")  # evicts m1 while the NLLB translator is still being built
+        self.assertIsNotNone(mm._nllb)
+        release.set()
+        loader.join(5)
+        self.assertIn("nllb:eng_Latn:fra_Latn", mm.loaded_models())
+        self.assertEqual(len(loads), 1)  # no second copy of the weights
+        pipe = mm.get_pipeline("nllb:eng_Latn:fra_Latn")
+        self.assertEqual(pipe.shared_bytes, 42 * MB)
+
+
+class ThrashControlTests(unittest.TestCase):
+    def test_pinned_model_is_not_evicted_until_released(self):
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
+        patch_builder(mm, {})
+        with mm.pin("m1"):
+            mm.get_pipeline("m1")
+            mm.get_pipeline("m2")
+            mm.get_pipeline("m3")  # m1 is LRU but pinned -> m2 goes
+            self.assertEqual(mm.loaded_models(), ["m1", "m3"])
+            with mm.pin("m3"):
+                mm.get_pipeline("m4")  # every candidate pinned: cap exceeded for now
+                self.assertEqual(mm.loaded_models(), ["m1", "m3", "m4"])
+            # m3 released but m1 is still pinned; m3 is the eviction candidate.
+            self.assertEqual(mm.loaded_models(), ["m1", "m4"])
+        self.assertEqual(mm.loaded_models(), ["m1", "m4"])
+
+    def test_pins_are_reference_counted(self):
+        mm = ModelManager(max_loaded_models=1, min_resident_s=0)
+        patch_builder(mm, {})
+        with mm.pin("m1"):
+            with mm.pin("m1"):
+                mm.get_pipeline("m1")
+            mm.get_pipeline("m2")  # m1 still pinned once
+            self.assertIn("m1", mm.loaded_models())
+        self.assertEqual(mm.loaded_models(), ["m2"])
+
+    def test_min_residency_defers_eviction(self):
+        mm = ModelManager(max_loaded_models=1, min_resident_s=60)
+        patch_builder(mm, {})
+        mm.get_pipeline("m1")
+        mm.get_pipeline("m2")  # m1 loaded just now: kept
+        self.assertEqual(mm.loaded_models(), ["m1", "m2"])
+        mm._loaded_at["m1"] -= 61
+        mm.get_pipeline("m3")  # m1 aged out; m2 still protected
+        self.assertEqual(mm.loaded_models(), ["m2", "m3"])
+
+    def test_byte_budget_overrides_min_residency(self):
+        mm = ModelManager(max_loaded_models=10, memory_budget_mb=100, min_resident_s=60)
+        patch_sized_builder(mm, {"a": 60 * MB, "b": 60 * MB})
+        mm.get_pipeline("a")
+        mm.get_pipeline("b")  # a was loaded just now, but 120 MB > budget
+        self.assertEqual(mm.loaded_models(), ["b"])
+
+    def test_pins_still_hold_against_the_byte_budget(self):
+        mm = ModelManager(max_loaded_models=10, memory_budget_mb=100, min_resident_s=0)
+        patch_sized_builder(mm, {"a": 60 * MB, "b": 60 * MB})
+        with mm.pin("a"):
+            mm.get_pipeline("a")
+            mm.get_pipeline("b")
+            self.assertEqual(mm.loaded_models(), ["a", "b"])
+        self.assertEqual(mm.loaded_models(), ["b"])
+
+    def test_thrash_gauge_reads_every_live_manager(self):
+        busy = ModelManager(max_loaded_models=1, min_resident_s=0)
+        busy._thrash_reloads.extend([time.monotonic()] * 10)
+        last = ModelManager(max_loaded_models=1, min_resident_s=0)  # built last, not thrashing
+        self.assertEqual(last._thrashing(), 0.0)
+        self.assertEqual(_thrashing_alarm(), 1.0)
+        del busy
+        gc.collect()
+        self.assertNotIn(1.0, [mm._thrashing() for mm in _live_managers])
+
+    def test_reload_after_recent_eviction_raises_thrash_alarm(self):
+        from app.settings import settings
+
+        mm = ModelManager(max_loaded_models=1, min_resident_s=0)
+        patch_builder(mm, {})
+        old = settings.model_thrash_alarm_reloads
+        settings.model_thrash_alarm_reloads = 2
+        try:
+            mm.get_pipeline("a")
+            mm.get_pipeline("b")
+            self.assertEqual(mm._thrashing(), 0.0)
+            mm.get_pipeline("a")  # thrash reload 1
+            mm.get_pipeline("b")  # thrash reload 2 -> alarm
+            self.assertEqual(mm._thrashing(), 1.0)
+            mm._thrash_reloads[0] -= settings.model_thrash_window_s + 1
+            self.assertEqual(mm._thrashing(), 0.0)  # fell out of the window
+        finally:
+            settings.model_thrash_alarm_reloads = old
+
+
+class GetEncoderTests(unittest.TestCase):
+    def test_resident_model_shares_its_translators_encoder(self):
+        mm = ModelManager(max_loaded_models=2, min_resident_s=0)
+
+        def fake_build(model_name):
+            def _translate(texts, num_beams, max_new_tokens):
+                return [{"translation_text": t} for t in texts]
+
+            _translate.encode = lambda texts: [[len(t)] for t in texts]
+            return _translate
+
+        mm._build_seq2seq_translator = fake_build
+        mm.get_pipeline("m")
+        self.assertEqual(mm.get_encoder("m")(["abc"]), [[3]])
+        self.assertIsNone(mm.get_encoder("nllb:*"))  # the group translator has no encode
+
+
+class FakeTokenizer:
+    def __call__(self, texts, **kw):
+        return {"input_ids": [[ord(c) for c in t] for t in texts], "kw": kw}
+
+    def pad(self, encoded, **kw):
+        return {"padded": encoded["input_ids"], "kw": kw}
+
+
+class EncodeTests(unittest.TestCase):
+    def test_nllb_rows_are_tagged_with_their_own_source_language(self):
+        class NllbTokenizer:
+            model_max_length = 8
+            eos_token_id = 2
+
+            def __call__(self, texts, add_special_tokens=True, truncation=False, max_length=None):
+                assert not add_special_tokens
+                return {"input_ids": [[ord(c) for c in t][:max_length] for t in texts]}
+
+            def convert_tokens_to_ids(self, token):
+                return {"eng_Latn": 100, "zho_Hans": 101}[token]
+
+        ids = _nllb_tagged_ids(NllbTokenizer(), ["ab", "abcdefghij"], ["eng_Latn", "zho_Hans"])
+        self.assertEqual(ids[0], [100, 97, 98, 2])
+        self.assertEqual(ids[1][0], 101)
+        self.assertEqual(len(ids[1]), 8)  # truncated to model_max_length with the tags
+
+
+    def test_encoder_tokenizes_without_padding(self):
+        self.assertEqual(_make_encoder(FakeTokenizer())(["ab", "c"]), [[97, 98], [99]])
+
+    def test_pre_tokenized_ids_are_padded_not_retokenized(self):
+        out = _encode_batch(FakeTokenizer(), ["ab"], [[1, 2]])
+        self.assertEqual(out["padded"], [[1, 2]])
+        out = _encode_batch(FakeTokenizer(), ["ab"], None)
+        self.assertEqual(out["input_ids"], [[97, 98]])
+
+
 class DeviceResolutionTests(unittest.TestCase):
     def setUp(self):
         self._orig = torch.cuda.is_available
@@ -115,6 +378,13 @@ class DeviceResolutionTests(unittest.TestCase):
         self.assertEqual(_resolve_dtype("auto", on_cuda=False), torch.float32)
         self.assertEqual(_resolve_dtype("float32", on_cuda=True), torch.float32)
 
+    def test_int8_loads_float32_and_quantizes_on_cpu_only(self):
+        self.assertEqual(_resolve_dtype("int8", on_cuda=False), torch.float32)
+        self.assertTrue(_wants_int8("int8", on_cuda=False))
+        self.assertFalse(_wants_int8("int8", on_cuda=True))  # fp16 on GPU instead
+        self.assertEqual(_resolve_dtype("int8", on_cuda=True), torch.float16)
+        self.assertFalse(_wants_int8("auto", on_cuda=False))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+"""Local model store tests: snapshot resolution over a fake HF cache layout
+and the parallel loader."""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.inference.model_store import (
+    load_parallel,
+    local_snapshot,
+    pretrained_source,
+    resolve_snapshot,
+    weight_load_kwargs,
+)
+from app.settings import settings
+
+COMPLETE = ("config.json", "model.safetensors", "tokenizer_config.json", "source.spm", "target.spm", "vocab.json")
+
+
+def make_snapshot(root, model_name, commit="abc123", ref="main", files=COMPLETE):
+    repo = os.path.join(root, "models--" + model_name.replace("/", "--"))
+    snapshot = os.path.join(repo, "snapshots", commit)
+    os.makedirs(snapshot)
+    os.makedirs(os.path.join(repo, "refs"), exist_ok=True)
+    with open(os.path.join(repo, "refs", ref), "w") as f:
+        f.write(commit + "\n")
+    for name in files:
+        open(os.path.join(snapshot, name), "w").close()
+    return snapshot
+
+
+class ModelStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(settings, "hf_model_cache", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_resolves_ref_to_snapshot(self):
+        snapshot = make_snapshot(self.tmp.name, "Helsinki-NLP/opus-mt-en-zh")
+        self.assertEqual(resolve_snapshot("Helsinki-NLP/opus-mt-en-zh"), snapshot)
+        self.assertEqual(resolve_snapshot("Helsinki-NLP/opus-mt-en-zh", revision="abc123"), snapshot)
+
+    def test_hf_home_hub_layout(self):
+        snapshot = make_snapshot(os.path.join(self.tmp.name, "hub"), "facebook/nllb-200-distilled-600M")
+        self.assertEqual(resolve_snapshot("facebook/nllb-200-distilled-600M"), snapshot)
+
+    def test_missing_or_incomplete_snapshot_is_none(self):
+        self.assertIsNone(resolve_snapshot("org/absent"))
+        make_snapshot(self.tmp.name, "org/partial", files=())  # no config.json yet
+        self.assertIsNone(resolve_snapshot("org/partial"))
+        make_snapshot(self.tmp.name, "org/no-weights", files=("config.json", "tokenizer.json"))
+        self.assertIsNone(resolve_snapshot("org/no-weights"))
+        make_snapshot(self.tmp.name, "org/no-vocab", files=("config.json", "model.safetensors", "tokenizer_config.json"))
+        self.assertIsNone(resolve_snapshot("org/no-vocab"))
+
+    def test_sharded_weights_need_every_shard(self):
+        shards = {"a": "model-00001-of-00002.safetensors", "b": "model-00002-of-00002.safetensors"}
+        snapshot = make_snapshot(self.tmp.name, "org/sharded", files=("config.json", "tokenizer.json", shards["a"]))
+        with open(os.path.join(snapshot, "model.safetensors.index.json"), "w") as f:
+            json.dump({"weight_map": shards}, f)
+        self.assertIsNone(resolve_snapshot("org/sharded"))
+        open(os.path.join(snapshot, shards["b"]), "w").close()
+        self.assertEqual(resolve_snapshot("org/sharded"), snapshot)
+
+    def test_dangling_blob_symlink_is_missing(self):
+        snapshot = make_snapshot(self.tmp.name, "org/dangling", files=("config.json", "tokenizer.json"))
+        os.symlink(os.path.join(self.tmp.name, "blobs", "absent"), os.path.join(snapshot, "model.safetensors"))
+        self.assertIsNone(resolve_snapshot("org/dangling"))
+
+    def test_pretrained_source_prefers_local_snapshot(self):
+        snapshot = make_snapshot(self.tmp.name, "org/m")
+        self.assertEqual(pretrained_source("org/m"), (snapshot, {"local_files_only": True}))
+        name, kwargs = pretrained_source("org/other")
+        self.assertEqual(name, "org/other")
+        self.assertEqual(kwargs["cache_dir"], self.tmp.name)
+        with mock.patch.object(settings, "local_model_store", False):
+            self.assertEqual(pretrained_source("org/m")[0], "org/m")
+
+    def test_local_snapshot_downloads_into_our_cache_when_missing(self):
+        snapshot = make_snapshot(self.tmp.name, "org/cached")
+        self.assertEqual(local_snapshot("org/cached"), snapshot)
+        with mock.patch("huggingface_hub.snapshot_download", return_value="/dl/org/new") as download:
+            self.assertEqual(local_snapshot("org/new"), "/dl/org/new")
+        download.assert_called_once_with("org/new", cache_dir=self.tmp.name, revision=settings.model_revision)
+
+    def test_weights_load_without_a_random_init(self):
+        self.assertEqual(weight_load_kwargs(), {"low_cpu_mem_usage": True})
+
+
+class LoadParallelTests(unittest.TestCase):
+    def test_runs_concurrently_and_keeps_order(self):
+        barrier = threading.Barrier(2, timeout=2)
+
+        def load(value):
+            barrier.wait()  # deadlocks (BrokenBarrierError) unless both run at once
+            return value
+
+        self.assertEqual(load_parallel(lambda: load("tok"), lambda: load("model")), ["tok", "model"])
+
+    def test_failure_propagates(self):
+        def boom():
+            raise OSError("missing weights")
+
+        with self.assertRaises(OSError):
+            load_parallel(lambda: "tok", boom)
@@ -0,0 +1,111 @@
+"""ONNX Runtime backend tests: backend selection and the shared generate()
+translator, with a fake ORT model (optimum/onnxruntime are optional)."""
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from app.inference import model_manager as mm_module
+from app.inference import onnx_backend
+from app.inference.model_manager import ModelManager
+from app.inference.onnx_backend import export_to_onnx, load_ort_model, onnx_model_dir
+from app.settings import settings
+
+
+class _Ids:
+    """Just enough of a tensor for the translator: .to(), [:, 1:] != pad, .sum()."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def to(self, device):
+        return self
+
+    def __getitem__(self, idx):
+        _, cols = idx
+        return _Ids([r[cols] for r in self.rows])
+
+    def __ne__(self, other):
+        return _Ids([[int(v != other) for v in r] for r in self.rows])
+
+    def sum(self, dim):
+        return _Ids([sum(r) for r in self.rows])
+
+    def tolist(self):
+        return self.rows
+
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+    def __call__(self, texts, **kw):
+        if kw.get("return_tensors"):
+            return {"input_ids": _Ids([[ord(c) for c in t] for t in texts])}
+        return {"input_ids": [[ord(c) for c in t] for t in texts]}
+
+    def batch_decode(self, outputs, skip_special_tokens=True):
+        return ["".join(chr(i) for i in r if i).upper() for r in outputs.rows]
+
+
+class FakeORTModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, input_ids, **kw):
+        self.calls.append(kw)
+        return _Ids([[0, *r] for r in input_ids.rows])  # decoder start + echo
+
+
+class OnnxBackendTests(unittest.TestCase):
+    def test_manager_runs_generate_on_the_ort_model(self):
+        fake = FakeORTModel()
+        with mock.patch.object(settings, "inference_backend", "onnx"), \
+                mock.patch.object(mm_module, "load_ort_model", return_value=fake) as load, \
+                mock.patch.object(mm_module.AutoTokenizer, "from_pretrained", return_value=FakeTokenizer()):
+            mm = ModelManager(max_loaded_models=2)
+            pipe = mm.get_pipeline("Helsinki-NLP/opus-mt-en-de")
+            out = pipe(["hi"], num_beams=2, max_new_tokens=8)
+        self.assertEqual(out, [{"translation_text": "HI", "generated_tokens": 2}])
+        self.assertEqual(load.call_args.args[0], "Helsinki-NLP/opus-mt-en-de")
+        self.assertEqual(fake.calls[0]["num_beams"], 2)
+        self.assertEqual(fake.calls[0]["no_repeat_ngram_size"], 3)
+        self.assertTrue(hasattr(pipe, "encode"))
+
+    def test_model_dir_is_under_hf_cache(self):
+        path = onnx_model_dir("Helsinki-NLP/opus-mt-en-zh")
+        self.assertTrue(path.startswith(settings.hf_model_cache))
+        self.assertTrue(path.endswith("onnx/Helsinki-NLP--opus-mt-en-zh"))
+
+    def test_export_reads_the_local_snapshot(self):
+        ort_model = mock.MagicMock()
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(settings, "hf_model_cache", tmp), \
+                mock.patch.object(onnx_backend, "_import_ort_model", return_value=ort_model), \
+                mock.patch.object(onnx_backend, "local_snapshot", return_value="/models/snap/abc") as snapshot:
+            out_dir = export_to_onnx("Helsinki-NLP/opus-mt-en-zh")
+        snapshot.assert_called_once_with("Helsinki-NLP/opus-mt-en-zh")
+        self.assertEqual(ort_model.from_pretrained.call_args.args[0], "/models/snap/abc")
+        ort_model.from_pretrained.return_value.save_pretrained.assert_called_once_with(out_dir)
+
+    def test_io_binding_only_on_cuda(self):
+        ort_model = mock.MagicMock()
+        fake_ort = types.SimpleNamespace(
+            SessionOptions=types.SimpleNamespace,
+            GraphOptimizationLevel=types.SimpleNamespace(ORT_ENABLE_ALL=99),
+        )
+        with mock.patch.dict(sys.modules, {"onnxruntime": fake_ort}), \
+                mock.patch.object(onnx_backend, "_import_ort_model", return_value=ort_model), \
+                mock.patch.object(onnx_backend, "export_to_onnx", return_value="/models/onnx/m"):
+            load_ort_model("m", "cpu", 2)
+            cpu_kwargs = ort_model.from_pretrained.call_args.kwargs
+            load_ort_model("m", "cuda", 2)
+            cuda_kwargs = ort_model.from_pretrained.call_args.kwargs
+        self.assertNotIn("use_io_binding", cpu_kwargs)
+        self.assertEqual(cpu_kwargs["provider"], "CPUExecutionProvider")
+        self.assertTrue(cuda_kwargs["use_io_binding"])
+        self.assertEqual(cuda_kwargs["provider"], "CUDAExecutionProvider")
+
+
+if __name__ == "__main__":
+    unittest.main()
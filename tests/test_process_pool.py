@@ -0,0 +1,146 @@
+"""Tests for the multiprocess inference executor.
+
+The pool forks real worker processes; the ModelManager is faked (module-level
+so it is inherited by fork) and "translates" by uppercasing.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+import fakeredis
+
+from app.inference.batcher import DeadlineExceeded
+from app.inference.engine import InferenceEngine
+from app.inference.process_pool import ProcessPoolModelManager
+from infra.cache import RedisCache
+
+
+class FakeModelManager:
+    device = "cpu"
+
+    def __init__(self):
+        self.loaded = []
+
+    def get_pipeline(self, model_name):
+        if model_name == "missing":
+            raise ValueError("no such model")
+        if model_name not in self.loaded:
+            self.loaded.append(model_name)
+
+        def _pipe(texts, num_beams, max_new_tokens, input_ids=None):
+            if texts == ["crash"]:
+                os._exit(3)
+            if texts == ["slow"]:
+                time.sleep(1.0)
+            return [{"translation_text": t.upper(), "pid": os.getpid(), "ppid": os.getppid()} for t in texts]
+
+        _pipe.encode = lambda texts: [t.split() for t in texts]
+        return _pipe
+
+    def get_encoder(self, model_name):
+        pid = os.getpid()
+        return lambda texts: [[*t.split(), pid] for t in texts]
+
+    def warmup(self, model_name):
+        self.get_pipeline(model_name)
+
+    def loaded_models(self):
+        return list(self.loaded)
+
+    def device_info(self):
+        return {"device": "cpu"}
+
+
+class ProcessPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = ProcessPoolModelManager(
+            workers=2, torch_threads=1, preload=["m"], manager_factory=FakeModelManager,
+        )
+        self.addCleanup(self.pool.stop)
+
+    def test_translate_runs_in_worker_process(self):
+        pipe = self.pool.get_pipeline("m")
+        out = pipe(["hello", "world"], num_beams=1, max_new_tokens=8)
+        self.assertEqual([r["translation_text"] for r in out], ["HELLO", "WORLD"])
+        self.assertNotEqual(out[0]["pid"], os.getpid())
+        self.assertEqual(pipe.encode(["a b"]), [["a", "b", os.getpid()]])  # tokenized in the parent
+
+    def test_errors_propagate_to_caller(self):
+        with self.assertRaises(ValueError):
+            self.pool.get_pipeline("missing")
+
+    def test_dead_worker_fails_its_call_and_is_replaced(self):
+        pipe = self.pool.get_pipeline("m")
+        with self.assertRaises(RuntimeError):
+            pipe(["crash"], num_beams=1, max_new_tokens=8)
+        out = pipe(["still works"], num_beams=1, max_new_tokens=8)
+        self.assertEqual(out[0]["translation_text"], "STILL WORKS")
+
+    def test_deadline_bounds_the_wait_for_a_worker(self):
+        pipe = self.pool.get_pipeline("m")
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            pipe(["slow"], num_beams=1, max_new_tokens=8, deadline=time.monotonic() + 0.2)
+        self.assertLess(time.monotonic() - start, 0.8)
+        busy = [w for w in self.pool._workers if w.in_flight]  # still decoding the abandoned call
+        self.assertEqual(len(busy), 1)
+        out = pipe(["after"], num_beams=1, max_new_tokens=8, deadline=time.monotonic() + 5)
+        self.assertEqual(out[0]["translation_text"], "AFTER")
+        self.assertNotEqual(out[0]["pid"], busy[0].proc.pid)  # routed to the idle worker
+        for _ in range(300):
+            if not any(w.in_flight for w in self.pool._workers):
+                break
+            time.sleep(0.01)
+        self.assertEqual(sum(w.in_flight for w in self.pool._workers), 0)
+
+    def test_workers_are_forked_by_the_template_process(self):
+        pipe = self.pool.get_pipeline("m")
+        with self.assertRaises(RuntimeError):
+            pipe(["crash"], num_beams=1, max_new_tokens=8)
+        outs = [pipe([f"t{i}"], num_beams=1, max_new_tokens=8)[0] for i in range(4)]
+        self.assertEqual({o["ppid"] for o in outs}, {self.pool._template.pid})
+        self.assertEqual(len(self.pool._workers), 2)
+
+    def test_preloaded_models_are_reported(self):
+        self.assertEqual(self.pool.loaded_models(), ["m"])
+
+    def test_engine_runs_on_the_pool(self):
+        engine = InferenceEngine(self.pool)
+        cache = RedisCache(fakeredis.FakeRedis(decode_responses=True))
+        out, n = engine.translate_text("m", "One. Two.", 1, 16, split_long=True, cache=cache)
+        self.assertEqual((out, n), ("ONE. TWO.", 2))
+
+    def test_calls_after_stop_fail_fast(self):
+        self.pool.stop()
+        with self.assertRaises(RuntimeError):
+            self.pool.get_pipeline("m")
+
+
+
+class MultiprocessMetricsTests(unittest.TestCase):
+    def test_worker_metrics_are_aggregated(self):
+        script = textwrap.dedent("""
+            import os
+            from app.metrics import MODEL_LOADS, render_metrics
+            MODEL_LOADS.labels(model="m").inc()
+            pid = os.fork()
+            if pid == 0:
+                MODEL_LOADS.labels(model="m").inc(2)
+                os._exit(0)
+            os.waitpid(pid, 0)
+            print(render_metrics().decode())
+        """)
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": tmp}
+            out = subprocess.run(
+                [sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=60, check=True,
+            ).stdout
+        self.assertIn('model_loads_total{model="m"} 3.0', out)
+
+
+if __name__ == "__main__":
+    unittest.main()
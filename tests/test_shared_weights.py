@@ -0,0 +1,70 @@
+"""Shared-weights preload tests: models load in the parent, failures are
+skipped, and a forked child reuses the parent's models instead of loading."""
+import gc
+import multiprocessing as mp
+import unittest
+from unittest import mock
+
+import torch
+
+from app.inference.shared_weights import preload_before_fork, warmup_model_names
+from app.settings import settings
+
+
+class CountingManager:
+    def __init__(self):
+        self.builds = []
+        self.pipelines = {}
+
+    def get_pipeline(self, model_name):
+        if model_name == "broken":
+            raise OSError("download failed")
+        if model_name not in self.pipelines:
+            self.builds.append(model_name)
+            self.pipelines[model_name] = lambda texts, **kw: texts
+        return self.pipelines[model_name]
+
+
+def _child_builds(mm, conn):
+    mm.get_pipeline("m1")
+    conn.send(list(mm.builds))
+
+
+class PreloadTests(unittest.TestCase):
+    def tearDown(self):
+        gc.unfreeze()
+
+    def test_loads_in_parent_and_skips_failures(self):
+        mm = CountingManager()
+        loaded = preload_before_fork(mm, ["m1", "broken", "m2"])
+        self.assertEqual(loaded, ["m1", "m2"])
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+    def test_restores_torch_threads(self):
+        torch.set_num_threads(3)
+        preload_before_fork(CountingManager(), ["m1"])
+        self.assertEqual(torch.get_num_threads(), 3)
+
+    def test_forked_child_reuses_parent_models(self):
+        mm = CountingManager()
+        preload_before_fork(mm, ["m1"])
+        ctx = mp.get_context("fork")
+        parent_conn, child_conn = ctx.Pipe()
+        proc = ctx.Process(target=_child_builds, args=(mm, child_conn))
+        proc.start()
+        self.assertTrue(parent_conn.poll(10))
+        self.assertEqual(parent_conn.recv(), ["m1"])  # built once, in the parent
+        proc.join(5)
+
+    def test_skipped_in_continuous_mode(self):
+        mm = CountingManager()
+        with mock.patch.object(settings, "generation_mode", "continuous"):
+            self.assertEqual(preload_before_fork(mm, ["m1"]), [])
+        self.assertEqual(mm.builds, [])
+
+
+class WarmupNamesTests(unittest.TestCase):
+    def test_resolves_and_dedupes_pairs(self):
+        with mock.patch.object(settings, "warmup_pairs", "en:zh, zh:en,en:zh,xx:yy"):
+            names = warmup_model_names()
+        self.assertEqual(names, ["Helsinki-NLP/opus-mt-en-zh", "Helsinki-NLP/opus-mt-zh-en"])
@@ -0,0 +1,152 @@
+"""Singleflight tests: concurrent identical misses run once in-process, a
+failed leader does not fail its followers, and Redis leases make separate
+processes (separate Singleflight registries here) wait for each other."""
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fakeredis
+
+from app.inference.engine import InferenceEngine
+from app.settings import settings
+from infra.cache import RedisCache
+from infra.singleflight import RedisLeases, Singleflight
+
+
+class SlowModelManager:
+    def __init__(self, delay_s=0.2):
+        self.delay_s = delay_s
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_pipeline(self, model_name):
+        def _pipe(texts, num_beams, max_new_tokens):
+            with self.lock:
+                self.calls.append(list(texts))
+            time.sleep(self.delay_s)
+            return [{"translation_text": t.upper()} for t in texts]
+
+        return _pipe
+
+
+def run_concurrently(fn, n):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def target(i):
+        barrier.wait()
+        results[i] = fn(i)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+class InProcessTests(unittest.TestCase):
+    def test_concurrent_requests_translate_a_sentence_once(self):
+        mm = SlowModelManager()
+        engine = InferenceEngine(mm)
+        cache = RedisCache(fakeredis.FakeRedis())
+        results = run_concurrently(
+            lambda i: engine.translate_text("m", "Launch day.", 1, 16, split_long=True, cache=cache), 8
+        )
+        self.assertEqual(results, [("LAUNCH DAY.", 1)] * 8)
+        self.assertEqual(mm.calls, [["Launch day."]])
+
+    def test_disabled_runs_every_request(self):
+        mm = SlowModelManager(delay_s=0.1)
+        engine = InferenceEngine(mm)
+        cache = RedisCache(fakeredis.FakeRedis())
+        with mock.patch.object(settings, "singleflight", False):
+            run_concurrently(lambda i: engine.translate_text("m", "Launch day.", 1, 16, True, cache), 3)
+        self.assertEqual(len(mm.calls), 3)
+
+    def test_failed_leader_does_not_fail_followers(self):
+        flights = Singleflight()
+        started = threading.Event()
+        calls = []
+
+        def leader_compute(keys):
+            started.set()
+            time.sleep(0.1)
+            raise TimeoutError("leader deadline")
+
+        def follower_compute(keys):
+            calls.append(keys)
+            return {k: k.upper() for k in keys}
+
+        errors = []
+
+        def lead():
+            try:
+                flights.run(["a"], leader_compute)
+            except TimeoutError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        self.assertEqual(flights.run(["a", "b"], follower_compute), {"a": "A", "b": "B"})
+        leader.join(5)
+        self.assertEqual(len(errors), 1)  # the leader still sees its own error
+        self.assertEqual(sorted(map(sorted, calls)), [["a"], ["b"]])  # b led, a retried after the failure
+
+
+class RedisLeaseTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(settings, singleflight_redis_lease=True, singleflight_poll_ms=10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = RedisCache(fakeredis.FakeRedis())
+
+    def test_other_process_waits_for_leaseholder(self):
+        computed = []
+
+        def compute(keys):
+            computed.extend(keys)
+            time.sleep(0.2)
+            self.cache.mset_json({k: {"t": k.upper()} for k in keys})
+            return {k: k.upper() for k in keys}
+
+        # One registry per "process": only the Redis lease is shared.
+        registries = [Singleflight(), Singleflight()]
+        results = run_concurrently(
+            lambda i: registries[i].run(["sx:a"], compute, cache=self.cache, cached=lambda e: e["t"]), 2
+        )
+        self.assertEqual(results, [{"sx:a": "SX:A"}] * 2)
+        self.assertEqual(computed, ["sx:a"])
+        self.assertFalse(self.cache.r.exists("lease:sx:a"))  # released
+
+    def test_wait_polls_raw_keys_and_reads_once(self):
+        leader, follower = RedisLeases(self.cache), RedisLeases(self.cache)
+        self.assertEqual(leader.acquire(["sx:c"]), ["sx:c"])
+        threading.Timer(0.1, lambda: self.cache.set_json("sx:c", {"t": "C"})).start()
+        with mock.patch.object(self.cache, "mget_json", wraps=self.cache.mget_json) as mget_json:
+            self.assertEqual(follower.wait(["sx:c"], time.monotonic() + 5), {"sx:c": {"t": "C"}})
+        self.assertEqual(mget_json.call_count, 1)
+
+    def test_wait_gives_up_when_the_lease_goes_away(self):
+        follower = RedisLeases(self.cache)
+        with mock.patch.object(self.cache, "mget_json") as mget_json:
+            self.assertEqual(follower.wait(["sx:d"], time.monotonic() + 5), {})
+        mget_json.assert_not_called()
+
+    def test_wait_keeps_polling_keys_whose_lease_is_held(self):
+        leader, follower = RedisLeases(self.cache), RedisLeases(self.cache)
+        self.assertEqual(leader.acquire(["sx:e"]), ["sx:e"])
+        threading.Timer(0.1, lambda: self.cache.set_json("sx:e", {"t": "E"})).start()
+        # sx:f has no lease (its leader gave up): dropped, while sx:e is still awaited.
+        self.assertEqual(follower.wait(["sx:e", "sx:f"], time.monotonic() + 5), {"sx:e": {"t": "E"}})
+
+    def test_lease_released_on_failure(self):
+        def failing(keys):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            Singleflight().run(["sx:b"], failing, cache=self.cache)
+        self.assertFalse(self.cache.r.exists("lease:sx:b"))
+        self.assertEqual(Singleflight().run(["sx:b"], lambda keys: {k: 1 for k in keys}, cache=self.cache), {"sx:b": 1})
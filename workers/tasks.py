@@ -2,28 +2,43 @@ import json
 
 import httpx
 import structlog
+from celery.signals import worker_init
 
 from app.core.orchestrator import Orchestrator
+from app.core.policies import tenant_weight
 from app.core.usage import record_usage
 from app.core.webhook import sign_payload
+from app.inference.batcher import BULK, SchedulingHints
 from app.inference.engine import InferenceEngine
+from app.inference.model_host import RemoteModelManager
 from app.inference.model_manager import ModelManager
+from app.inference.shared_weights import preload_before_fork, warmup_model_names
 from app.metrics import JOBS_FAILED, JOBS_SUCCEEDED
 from app.settings import settings
-from domain.models import TranslationJob, utcnow
+from domain.models import ApiKey, TranslationJob, utcnow
 from infra.cache import RedisCache
 from infra.db import SessionLocal, init_db
+from infra.local_cache import LocalCache
 from infra.redis_client import get_redis
 from workers.celery_app import celery
 
 log = structlog.get_logger()
 
-# Worker-side singletons
-mm = ModelManager()
+# Worker-side singletons (inference goes to the model-host sidecar when configured)
+mm = RemoteModelManager(settings.model_host_socket) if settings.model_host_socket else ModelManager()
 engine = InferenceEngine(mm)
-cache = RedisCache(get_redis())
+cache = RedisCache(get_redis(binary=True), local=LocalCache.from_settings())
 orch = Orchestrator(engine, cache)
 
+
+@worker_init.connect
+def _share_model_weights(**_):
+    """Runs in the main worker process before the prefork pool forks: with
+    SHARED_WEIGHTS the warmup models load here and every child shares them."""
+    if settings.shared_weights and isinstance(mm, ModelManager):
+        preload_before_fork(mm, warmup_model_names())
+
+
 @celery.task(name="translate_job_async", bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def translate_job_async(self, job_id: str, source_lang: str, target_lang: str, texts: list[str], options: dict):
     if settings.auto_create_tables:
@@ -42,6 +57,12 @@ def translate_job_async(self, job_id: str, source_lang: str, target_lang: str, t
         beam_size = int(options.get("beam_size") or settings.default_beam_size)
         max_new_tokens = int(options.get("max_new_tokens", 256))
         split_long = bool(options.get("split_long", True))
+        key = db.get(ApiKey, job.api_key_id) if job.api_key_id else None
+        hints = SchedulingHints(
+            priority=BULK,
+            tenant=job.api_key_id,
+            weight=tenant_weight(key.rpm_limit if key else None),
+        )
 
         model_name, outs, latency_ms, cache_hit_rate = orch.translate_sync(
             source_lang=source_lang,
@@ -50,6 +71,7 @@ def translate_job_async(self, job_id: str, source_lang: str, target_lang: str, t
             beam_size=beam_size,
             max_new_tokens=max_new_tokens,
             split_long=split_long,
+            hints=hints,
         )
 
         job.status = "SUCCEEDED"